@@ -122,7 +122,10 @@ const serversQuery: UseQueryResult<Server[], Error> = useQuery<Server[], Error>(
     }
     // 5) делаем запрос через apiRequest
     //    apiRequest сам добавит Authorization: Bearer <token> и проверит res.ok
-    const res = await apiRequest<null>("GET", "http://localhost:4000/api/servers");
+    const res = await apiRequest<null>(
+      "GET",
+      "http://localhost:4000/api/servers?fields=id,host,country,max_users,users_count,ui_panel_link"
+    );
     // 6) парсим JSON и возвращаем
     const payload = (await res.json()) as Server[];
     return payload;
@@ -344,7 +347,16 @@ const serversQuery: UseQueryResult<Server[], Error> = useQuery<Server[], Error>(
         );
         const data = await res.json();
         if (!res.ok) throw new Error(data.message || "Ошибка генерации конфигурации");
-        return data as CreateConfigResponse;
+        if (res.status !== 202) return data as CreateConfigResponse;
+
+        // 202 — создание поставлено в очередь: опрашиваем статус задачи, пока она не завершится
+        for (let attempt = 0; attempt < 120; attempt++) {
+          await new Promise((resolve) => setTimeout(resolve, 1000));
+          const job = await (await apiRequest("GET", `http://localhost:4000${data.status_url}`)).json();
+          if (job.status === "succeeded") return job as CreateConfigResponse;
+          if (job.status === "failed") throw new Error(job.error || "Ошибка генерации конфигурации");
+        }
+        throw new Error("Конфигурация создаётся слишком долго, проверьте профиль позже");
       },
       onSuccess: (data) => {
         toast({
@@ -1,64 +1,32 @@
 # F:\Education\OOP\shadow_link\server\app\__init__.py
-import os
-import uuid
+import threading
 from flask import Flask, Response
-from app.logging_config import configure_logging
 from app.extensions import db, bcrypt, login_manager, cors, jwt
-from app.routes.auth import auth_bp
-from app.routes.users import users_bp
-from app.routes.admin import admin_bp
-from app.routes.servers import server_bp
-from app.routes.user_configurations import user_configurations_bp
 from app.models.user_configuration import UserConfiguration
 from app.models.server import Server
 from app.models.user import User
+from app.models.client_slot import ClientSlot
+
+# Телеметрия, blueprint'ы и логирование подключаются в create_app(): импорт пакета
+# (модели, утилиты, задачи Celery) не должен поднимать экспортеры и сетевые клиенты
+
+_app = None
+_app_lock = threading.Lock()
 
-# OpenTelemetry imports
-from opentelemetry import trace, metrics
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.jaeger.thrift import JaegerExporter
-from opentelemetry.instrumentation.flask import FlaskInstrumentor
-from opentelemetry.instrumentation.psycopg2 import Psycopg2Instrumentor
-from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.exporter.prometheus import PrometheusMetricReader
-from opentelemetry.instrumentation.flask import FlaskInstrumentor as FlaskMetricsInstrumentor
-from opentelemetry.instrumentation.celery import CeleryInstrumentor
-from opentelemetry.instrumentation.redis import RedisInstrumentor
-
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-
-# --- OpenTelemetry Setup (tracing + metrics) ---
-
-resource = Resource.create({
-    "service.name": os.getenv("OTEL_SERVICE_NAME", "flaskapp")
-})
-
-# Tracing
-trace_provider = TracerProvider(resource=resource)
-jaeger_exporter = JaegerExporter(
-    agent_host_name=os.getenv("OTEL_EXPORTER_JAEGER_AGENT_HOST", "localhost"),
-    agent_port=int(os.getenv("OTEL_EXPORTER_JAEGER_AGENT_PORT", "6831"))
-)
-trace_provider.add_span_processor(BatchSpanProcessor(jaeger_exporter))
-trace.set_tracer_provider(trace_provider)
-
-# Metrics
-prom_reader = PrometheusMetricReader()
-meter_provider = MeterProvider(metric_readers=[prom_reader])
-metrics.set_meter_provider(meter_provider)
-
-# Instrument DB and other libraries globally (до создания app)
-Psycopg2Instrumentor().instrument()
-SQLAlchemyInstrumentor().instrument()
-CeleryInstrumentor().instrument()
-RedisInstrumentor().instrument()
-
-# -------------------------------------------------------------
 
 def create_app():
+    from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+    from app.logging_config import configure_logging
+    from app.telemetry import init_telemetry, instrument_flask
+    from app.routes.auth import auth_bp
+    from app.routes.users import users_bp
+    from app.routes.admin import admin_bp
+    from app.routes.servers import server_bp
+    from app.routes.user_configurations import user_configurations_bp
+
+    # Инструментирование SQLAlchemy/psycopg2 — до создания движка в db.init_app
+    init_telemetry()
+
     app = Flask(__name__)
 
     app.config.from_object('config.Config')
@@ -68,8 +36,7 @@ def create_app():
         port=app.config['LOGSTASH_PORT']
     )
 
-    FlaskInstrumentor().instrument_app(app)
-    FlaskMetricsInstrumentor().instrument_app(app)
+    instrument_flask(app)
 
     # Инициализация расширений
     db.init_app(app)
@@ -104,13 +71,36 @@ def create_app():
     def metrics_endpoint():
         return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Создать недостающие таблицы."""
+        init_schema(app)
+        print("Database schema is up to date.")
+
     app.register_blueprint(auth_bp)
     app.register_blueprint(users_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(server_bp)
     app.register_blueprint(user_configurations_bp)
 
+    return app
+
+
+def get_app():
+    """
+    Приложение процесса: создаётся при первом вызове и переиспользуется gRPC-servicer'ами
+    и задачами Celery (вместо create_app() на каждый запуск задачи).
+    """
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
+
+
+def init_schema(app=None):
+    """Создаёт недостающие таблицы. Вызывается при старте сервиса (serve(), воркер, веб), а не при импорте."""
+    app = app or get_app()
     with app.app_context():
         db.create_all()
-
-    return app
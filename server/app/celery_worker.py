@@ -1,9 +1,14 @@
 # F:\Education\OOP\shadow_link\server\app\celery_worker.py
-from app import create_app
-from app.extensions import celery
+import os
 
-# Создаём Flask-приложение и загружаем конфигурацию
-flask_app = create_app()
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+
+from app import get_app, init_schema
+from app.extensions import celery, db
+from app.utils.metrics import MetricsPusher
+
+# Flask-приложение процесса (то же, что берут задачи через get_app) и конфигурация
+flask_app = get_app()
 celery.conf.update(flask_app.config)
 
 # Оборачиваем все задачи в контекст Flask
@@ -15,4 +20,36 @@ class ContextTask(celery.Task):
 celery.Task = ContextTask
 
 # Автодискавер тасков
-celery.autodiscover_tasks(['app.tasks.celery_tasks'])
\ No newline at end of file
+celery.autodiscover_tasks(['app.tasks.celery_tasks'])
+
+# У воркеров нет /metrics — каждый процесс пула отправляет свои ряды в pushgateway
+_metrics_pusher = None
+
+
+@worker_init.connect
+def create_schema(**kwargs):
+    # Один раз в главном процессе воркера, до fork пула (beat таблицы не трогает)
+    init_schema(flask_app)
+
+
+@worker_process_init.connect
+def reset_db_engine(**kwargs):
+    # Соединения, открытые родителем до fork, дочерним процессам использовать нельзя
+    with flask_app.app_context():
+        db.engine.dispose(close=False)
+
+
+@worker_process_init.connect
+def start_metrics_push(**kwargs):
+    global _metrics_pusher
+    from billiard.process import current_process
+    # Номер процесса в пуле стабилен при перезапусках — ряды не размножаются в pushgateway
+    index = getattr(current_process(), "index", None)
+    _metrics_pusher = MetricsPusher(job="celery_worker", instance=str(index if index is not None else os.getpid()))
+    _metrics_pusher.start()
+
+
+@worker_process_shutdown.connect
+def stop_metrics_push(**kwargs):
+    if _metrics_pusher is not None:
+        _metrics_pusher.stop()
@@ -13,7 +13,8 @@ bcrypt = Bcrypt()
 login_manager = LoginManager()
 cors = CORS()
 jwt = JWTManager()
-celery = Celery('app')
+# Брокер нужен и вне воркера: gRPC-сервисы ставят задачи в очередь (пул клиентов)
+celery = Celery('app', broker=os.getenv('REDIS_URL'), backend=os.getenv('REDIS_URL'))
 
 
 # stub: инициализации Celery из Flask больше не требуется
@@ -22,33 +22,34 @@ _runtime_version.ValidateProtobufRuntimeVersion(
 _sym_db = _symbol_database.Default()
 
 
+from google.protobuf import field_mask_pb2 as google_dot_protobuf_dot_field__mask__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14server_service.proto\x12\x06server\"\xc3\x01\n\nServerInfo\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ountry\x18\x02 \x01(\t\x12\x0c\n\x04host\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\t\x12\x14\n\x0cssh_username\x18\x05 \x01(\t\x12\x14\n\x0cssh_password\x18\x06 \x01(\t\x12\x11\n\tmax_users\x18\x07 \x01(\x05\x12\x11\n\tx_ui_port\x18\x08 \x01(\x05\x12\x13\n\x0busers_count\x18\t \x01(\x05\x12\x15\n\rui_panel_link\x18\n \x01(\t\"%\n\x12ListServersRequest\x12\x0f\n\x07\x63ountry\x18\x01 \x01(\t\":\n\x13ListServersResponse\x12#\n\x07servers\x18\x01 \x03(\x0b\x32\x12.server.ServerInfo\"\xab\x01\n\x13\x43reateServerRequest\x12\x0f\n\x07\x63ountry\x18\x01 \x01(\t\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\t\x12\x14\n\x0cssh_username\x18\x04 \x01(\t\x12\x14\n\x0cssh_password\x18\x05 \x01(\t\x12\x11\n\tmax_users\x18\x06 \x01(\x05\x12\x11\n\tx_ui_port\x18\x07 \x01(\x05\x12\x15\n\rui_panel_link\x18\x08 \x01(\t\"3\n\x14\x43reateServerResponse\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07message\x18\x02 \x01(\t\"\xb7\x01\n\x13UpdateServerRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ountry\x18\x02 \x01(\t\x12\x0c\n\x04host\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\t\x12\x14\n\x0cssh_username\x18\x05 \x01(\t\x12\x14\n\x0cssh_password\x18\x06 \x01(\t\x12\x11\n\tmax_users\x18\x07 \x01(\x05\x12\x11\n\tx_ui_port\x18\x08 \x01(\x05\x12\x15\n\rui_panel_link\x18\t \x01(\t\"\'\n\x14UpdateServerResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"!\n\x13\x44\x65leteServerRequest\x12\n\n\x02id\x18\x01 \x01(\x05\"\'\n\x14\x44\x65leteServerResponse\x12\x0f\n\x07message\x18\x01 \x01(\t2\xb8\x02\n\rServerService\x12\x46\n\x0bListServers\x12\x1a.server.ListServersRequest\x1a\x1b.server.ListServersResponse\x12I\n\x0c\x43reateServer\x12\x1b.server.CreateServerRequest\x1a\x1c.server.CreateServerResponse\x12I\n\x0cUpdateServer\x12\x1b.server.UpdateServerRequest\x1a\x1c.server.UpdateServerResponse\x12I\n\x0c\x44\x65leteServer\x12\x1b.server.DeleteServerRequest\x1a\x1c.server.DeleteServerResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x14server_service.proto\x12\x06server\x1a google/protobuf/field_mask.proto\"\xc3\x01\n\nServerInfo\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ountry\x18\x02 \x01(\t\x12\x0c\n\x04host\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\t\x12\x14\n\x0cssh_username\x18\x05 \x01(\t\x12\x14\n\x0cssh_password\x18\x06 \x01(\t\x12\x11\n\tmax_users\x18\x07 \x01(\x05\x12\x11\n\tx_ui_port\x18\x08 \x01(\x05\x12\x13\n\x0busers_count\x18\t \x01(\x05\x12\x15\n\rui_panel_link\x18\n \x01(\t\"{\n\x12ListServersRequest\x12\x0f\n\x07\x63ountry\x18\x01 \x01(\t\x12\x11\n\tpage_size\x18\x02 \x01(\x05\x12\x12\n\npage_token\x18\x03 \x01(\t\x12-\n\tread_mask\x18\x04 \x01(\x0b\x32\x1a.google.protobuf.FieldMask\"S\n\x13ListServersResponse\x12#\n\x07servers\x18\x01 \x03(\x0b\x32\x12.server.ServerInfo\x12\x17\n\x0fnext_page_token\x18\x02 \x01(\t\"\xab\x01\n\x13\x43reateServerRequest\x12\x0f\n\x07\x63ountry\x18\x01 \x01(\t\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\t\x12\x14\n\x0cssh_username\x18\x04 \x01(\t\x12\x14\n\x0cssh_password\x18\x05 \x01(\t\x12\x11\n\tmax_users\x18\x06 \x01(\x05\x12\x11\n\tx_ui_port\x18\x07 \x01(\x05\x12\x15\n\rui_panel_link\x18\x08 \x01(\t\"3\n\x14\x43reateServerResponse\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07message\x18\x02 \x01(\t\"\xb7\x01\n\x13UpdateServerRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ountry\x18\x02 \x01(\t\x12\x0c\n\x04host\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\t\x12\x14\n\x0cssh_username\x18\x05 \x01(\t\x12\x14\n\x0cssh_password\x18\x06 \x01(\t\x12\x11\n\tmax_users\x18\x07 \x01(\x05\x12\x11\n\tx_ui_port\x18\x08 \x01(\x05\x12\x15\n\rui_panel_link\x18\t \x01(\t\"\'\n\x14UpdateServerResponse\x12\x0f\n\x07message\x18\x01 \x01(\t\"!\n\x13\x44\x65leteServerRequest\x12\n\n\x02id\x18\x01 \x01(\x05\"\'\n\x14\x44\x65leteServerResponse\x12\x0f\n\x07message\x18\x01 \x01(\t2\xfb\x02\n\rServerService\x12\x46\n\x0bListServers\x12\x1a.server.ListServersRequest\x1a\x1b.server.ListServersResponse\x12\x41\n\rStreamServers\x12\x1a.server.ListServersRequest\x1a\x12.server.ServerInfo0\x01\x12I\n\x0c\x43reateServer\x12\x1b.server.CreateServerRequest\x1a\x1c.server.CreateServerResponse\x12I\n\x0cUpdateServer\x12\x1b.server.UpdateServerRequest\x1a\x1c.server.UpdateServerResponse\x12I\n\x0c\x44\x65leteServer\x12\x1b.server.DeleteServerRequest\x1a\x1c.server.DeleteServerResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'server_service_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_SERVERINFO']._serialized_start=33
-  _globals['_SERVERINFO']._serialized_end=228
-  _globals['_LISTSERVERSREQUEST']._serialized_start=230
-  _globals['_LISTSERVERSREQUEST']._serialized_end=267
-  _globals['_LISTSERVERSRESPONSE']._serialized_start=269
-  _globals['_LISTSERVERSRESPONSE']._serialized_end=327
-  _globals['_CREATESERVERREQUEST']._serialized_start=330
-  _globals['_CREATESERVERREQUEST']._serialized_end=501
-  _globals['_CREATESERVERRESPONSE']._serialized_start=503
-  _globals['_CREATESERVERRESPONSE']._serialized_end=554
-  _globals['_UPDATESERVERREQUEST']._serialized_start=557
-  _globals['_UPDATESERVERREQUEST']._serialized_end=740
-  _globals['_UPDATESERVERRESPONSE']._serialized_start=742
-  _globals['_UPDATESERVERRESPONSE']._serialized_end=781
-  _globals['_DELETESERVERREQUEST']._serialized_start=783
-  _globals['_DELETESERVERREQUEST']._serialized_end=816
-  _globals['_DELETESERVERRESPONSE']._serialized_start=818
-  _globals['_DELETESERVERRESPONSE']._serialized_end=857
-  _globals['_SERVERSERVICE']._serialized_start=860
-  _globals['_SERVERSERVICE']._serialized_end=1172
+  _globals['_SERVERINFO']._serialized_start=67
+  _globals['_SERVERINFO']._serialized_end=262
+  _globals['_LISTSERVERSREQUEST']._serialized_start=264
+  _globals['_LISTSERVERSREQUEST']._serialized_end=387
+  _globals['_LISTSERVERSRESPONSE']._serialized_start=389
+  _globals['_LISTSERVERSRESPONSE']._serialized_end=472
+  _globals['_CREATESERVERREQUEST']._serialized_start=475
+  _globals['_CREATESERVERREQUEST']._serialized_end=646
+  _globals['_CREATESERVERRESPONSE']._serialized_start=648
+  _globals['_CREATESERVERRESPONSE']._serialized_end=699
+  _globals['_UPDATESERVERREQUEST']._serialized_start=702
+  _globals['_UPDATESERVERREQUEST']._serialized_end=885
+  _globals['_UPDATESERVERRESPONSE']._serialized_start=887
+  _globals['_UPDATESERVERRESPONSE']._serialized_end=926
+  _globals['_DELETESERVERREQUEST']._serialized_start=928
+  _globals['_DELETESERVERREQUEST']._serialized_end=961
+  _globals['_DELETESERVERRESPONSE']._serialized_start=963
+  _globals['_DELETESERVERRESPONSE']._serialized_end=1002
+  _globals['_SERVERSERVICE']._serialized_start=1005
+  _globals['_SERVERSERVICE']._serialized_end=1384
 # @@protoc_insertion_point(module_scope)
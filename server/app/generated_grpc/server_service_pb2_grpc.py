@@ -40,6 +40,11 @@ class ServerServiceStub(object):
                 request_serializer=server__service__pb2.ListServersRequest.SerializeToString,
                 response_deserializer=server__service__pb2.ListServersResponse.FromString,
                 _registered_method=True)
+        self.StreamServers = channel.unary_stream(
+                '/server.ServerService/StreamServers',
+                request_serializer=server__service__pb2.ListServersRequest.SerializeToString,
+                response_deserializer=server__service__pb2.ServerInfo.FromString,
+                _registered_method=True)
         self.CreateServer = channel.unary_unary(
                 '/server.ServerService/CreateServer',
                 request_serializer=server__service__pb2.CreateServerRequest.SerializeToString,
@@ -67,6 +72,13 @@ class ServerServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamServers(self, request, context):
+        """То же, что ListServers, но сервера отдаются потоком (page_size игнорируется)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def CreateServer(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -93,6 +105,11 @@ def add_ServerServiceServicer_to_server(servicer, server):
                     request_deserializer=server__service__pb2.ListServersRequest.FromString,
                     response_serializer=server__service__pb2.ListServersResponse.SerializeToString,
             ),
+            'StreamServers': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamServers,
+                    request_deserializer=server__service__pb2.ListServersRequest.FromString,
+                    response_serializer=server__service__pb2.ServerInfo.SerializeToString,
+            ),
             'CreateServer': grpc.unary_unary_rpc_method_handler(
                     servicer.CreateServer,
                     request_deserializer=server__service__pb2.CreateServerRequest.FromString,
@@ -147,6 +164,33 @@ class ServerService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def StreamServers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/server.ServerService/StreamServers',
+            server__service__pb2.ListServersRequest.SerializeToString,
+            server__service__pb2.ServerInfo.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def CreateServer(request,
             target,
@@ -0,0 +1,134 @@
+# app/grpc_server/aio_service.py
+"""
+Режим GRPC_SERVING_MODE=aio — это не асинхронный сервис, а транспорт grpc.aio перед тем же
+синхронным servicer'ом. На event loop живут только соединения, очередь RPC (ожидание
+GRPC_PROVISIONING_CONCURRENCY) и отдача стрима. Каждый RPC целиком — SSH через paramiko
+и SQLAlchemy — выполняется в пуле из GRPC_BLOCKING_WORKERS потоков, как в режиме sync.
+Пропускная способность медленных RPC поэтому та же, что у пула потоков:
+не больше min(GRPC_BLOCKING_WORKERS, GRPC_PROVISIONING_CONCURRENCY) / время SSH-вызова в секунду.
+"""
+import asyncio
+import contextvars
+import os
+import signal
+from concurrent import futures
+
+import grpc
+from dotenv import load_dotenv
+from grpc_reflection.v1alpha import reflection
+
+from app.generated_grpc import (
+    config_service_pb2, config_service_pb2_grpc,
+    server_service_pb2, server_service_pb2_grpc,
+)
+from app.grpc_server.context import LocalServicerContext
+from app.grpc_server.settings import GRPC_SHUTDOWN_GRACE, SERVER_OPTIONS, STREAM_BATCH_SIZE
+
+load_dotenv()
+
+# Сколько RPC сервер принимает одновременно (ждущие своей очереди RPC не занимают потоков)
+GRPC_MAX_CONCURRENT_RPCS = int(os.getenv("GRPC_MAX_CONCURRENT_RPCS", 1000))
+# Потоки для блокирующей работы (SSH, SQLAlchemy); SSH к одному хосту дополнительно ограничен пулом
+GRPC_BLOCKING_WORKERS = int(os.getenv("GRPC_BLOCKING_WORKERS", 64))
+# Сколько CreateConfiguration/SyncConfigurations выполняются одновременно, остальные ждут в очереди
+GRPC_PROVISIONING_CONCURRENCY = int(os.getenv("GRPC_PROVISIONING_CONCURRENCY", 32))
+
+
+class _Offloader:
+    """
+    Выполняет методы синхронного servicer'а в пуле потоков целиком: event loop не блокируется,
+    но поток занят на всё время RPC. Код и описание ошибки переносятся из LocalServicerContext
+    в контекст grpc.aio.
+    """
+
+    def __init__(self, servicer, executor, limit: int = None):
+        self.servicer = servicer
+        self.executor = executor
+        self.semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def run(self, fn, *args):
+        # Контекст (в т.ч. трассировка) переносится в поток вместе с вызовом
+        ctx = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        if self.semaphore is None:
+            return await loop.run_in_executor(self.executor, ctx.run, fn, *args)
+        async with self.semaphore:
+            return await loop.run_in_executor(self.executor, ctx.run, fn, *args)
+
+    async def call(self, method: str, request, context):
+        # Дедлайн клиента переносится в синхронный servicer
+        local = LocalServicerContext(timeout=context.time_remaining())
+        response = await self.run(getattr(self.servicer, method), request, local)
+        if not local.ok:
+            context.set_code(local.code)
+            context.set_details(local.details)
+        return response
+
+
+class AioConfigurationServiceServicer(config_service_pb2_grpc.ConfigurationServiceServicer):
+    def __init__(self, servicer, executor):
+        self._provisioning = _Offloader(servicer, executor, GRPC_PROVISIONING_CONCURRENCY)
+
+    async def CreateConfiguration(self, request, context):
+        return await self._provisioning.call("CreateConfiguration", request, context)
+
+    async def SyncConfigurations(self, request, context):
+        return await self._provisioning.call("SyncConfigurations", request, context)
+
+
+class AioServerServiceServicer(server_service_pb2_grpc.ServerServiceServicer):
+    def __init__(self, servicer, executor):
+        self._offloader = _Offloader(servicer, executor)
+
+    async def ListServers(self, request, context):
+        return await self._offloader.call("ListServers", request, context)
+
+    async def StreamServers(self, request, context):
+        servicer = self._offloader.servicer
+        try:
+            fields, after_id = servicer.parse_list_request(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        # Пачки читаются в пуле потоков, между пачками event loop свободен
+        has_more = True
+        while has_more:
+            servers, after_id, has_more = await self._offloader.run(
+                servicer.list_page, request.country, after_id, STREAM_BATCH_SIZE, fields
+            )
+            for info in servers:
+                yield info
+
+
+async def serve_aio(servicer, port: int):
+    """
+    Запускает синхронный servicer (ConfigurationService или ServerService) на grpc.aio.
+    Servicer передаётся готовым — модуль сервиса уже создал своё приложение Flask.
+    """
+    executor = futures.ThreadPoolExecutor(max_workers=GRPC_BLOCKING_WORKERS)
+    server = grpc.aio.server(maximum_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS, options=SERVER_OPTIONS)
+
+    if isinstance(servicer, config_service_pb2_grpc.ConfigurationServiceServicer):
+        config_service_pb2_grpc.add_ConfigurationServiceServicer_to_server(
+            AioConfigurationServiceServicer(servicer, executor), server
+        )
+        full_name = config_service_pb2.DESCRIPTOR.services_by_name['ConfigurationService'].full_name
+    elif isinstance(servicer, server_service_pb2_grpc.ServerServiceServicer):
+        server_service_pb2_grpc.add_ServerServiceServicer_to_server(
+            AioServerServiceServicer(servicer, executor), server
+        )
+        full_name = server_service_pb2.DESCRIPTOR.services_by_name['ServerService'].full_name
+    else:
+        raise ValueError(f"Неизвестный servicer: {type(servicer).__name__}")
+
+    reflection.enable_server_reflection((full_name, reflection.SERVICE_NAME), server)
+    server.add_insecure_port(f'[::]:{port}')
+    print(f"gRPC {full_name} (aio) listening on {port}", flush=True)
+    await server.start()
+    # docker stop / prefork-супервизор: дать текущим RPC завершиться
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, lambda: asyncio.ensure_future(server.stop(GRPC_SHUTDOWN_GRACE))
+    )
+    try:
+        await server.wait_for_termination()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,7 @@
 # F:\Education\OOP\shadow_link\server\app\grpc_server\config_service.py
 import grpc
+import asyncio
+import signal
 from concurrent import futures
 from datetime import datetime, timezone
 from dateutil.relativedelta import relativedelta
@@ -9,90 +11,107 @@ import os
 from grpc_reflection.v1alpha import reflection
 
 
-# ─── ПОДКЛЮЧЕНИЕ REDIS «НА МЕСТЕ» ──────────────────────────────────────────────
-import redis
-from dotenv import load_dotenv
-load_dotenv()
-redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"))
-# ────────────────────────────────────────────────────────────────────────────────
-
-
 # Импорт сгенерированных protobuf-классов
 from app.generated_grpc import config_service_pb2, config_service_pb2_grpc
 from app.models.server import Server
 from app.models.user_configuration import UserConfiguration
 from app.models.user import User
 from app.extensions import db
-from app.utils.vps_data import (
-    insert_inbound_record,
-    insert_traffic_record,
-    restart_xui,
-    count_users_on_port,
-    get_vps_clients_configurations,
-    # get_cached_user_count
-)
-from app import create_app
-
-app = create_app()
-
-# Вспомогательные функции для работы с ключами Redis:
-def _redis_key_for_server_count(server_id: int) -> str:
-    return f"server:{server_id}:active_config_count"
-
-def get_cached_user_count(host, port, ssh_username, ssh_password, server_id: int, force_reload: bool=False) -> int:
-    """
-    Возвращает количество конфигураций (active users) для сервера server_id.
-    Сначала пытается взять значение из Redis; если не нашёл — считает из БД и кладёт в Redis с TTL = 300 сек.
-    """
-    key = _redis_key_for_server_count(server_id)
-    raw = redis_client.get(key)
-    if raw is not None and not force_reload:
-        try:
-            return int(raw)
-        except ValueError:
-            pass
-    # Если не нашли или «битое» значение — пересчитываем и записываем в Redis заново
-    count = UserConfiguration.query.filter_by(server_id=server_id).count()
-    redis_client.set(key, count, ex=300)
-    return count
+from app.utils.vps_data import VpsBusy, provision_clients, remove_clients
+from app.utils.fleet import server_ref
+from app.utils.config_sync import fetch_fleet_clients, save_user_fingerprints
+from app.utils.reconcile import reconcile_configurations
+from app.utils.metrics import SYNC_SERVERS_SKIPPED
+from app.utils.placement import reserve_server, release_server, drop_server, unhealthy_servers
+from app.utils.slot_pool import claim_client_slot, release_claimed_slot
+from app.utils.counters import incr_config_count
+from app.utils.deadline import DeadlineExceeded, check, deadline_scope
+from app.utils.circuit_breaker import CircuitOpen
+from app.tasks.celery_tasks import activate_client_slot, refill_client_slots
+from app import get_app, init_schema
+from app.grpc_server.settings import GRPC_SERVING_MODE, GRPC_MAX_WORKERS, GRPC_SHUTDOWN_GRACE, SERVER_OPTIONS
+
+def _remove_orphan(srv, client: dict) -> bool:
+    """Удаляет с VPS клиента, для которого не удалось сохранить конфигурацию. True — удалён."""
+    try:
+        remove_clients(srv.host, srv.port, srv.ssh_username, srv.ssh_password, srv.x_ui_port, [client],
+                       server_id=srv.id)
+        return True
+    except Exception as e:
+        print(f"[CONFIG][WARN] client {client['client_uuid']} left on server_id={srv.id}, "
+              f"sync will adopt it: {e}", flush=True)
+        return False
+
 
 class ConfigurationServiceServicer(config_service_pb2_grpc.ConfigurationServiceServicer):
     def CreateConfiguration(self, request, context):
-        with app.app_context():
+        # Дедлайн клиента ограничивает и SSH: подключение, чтение, ожидание свободного канала
+        with get_app().app_context(), deadline_scope(context.time_remaining()):
             # Простая валидация
             if not request.country or request.months not in (1,3,6,12):
                 context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
                 context.set_details("Неверные входные данные")
                 return config_service_pb2.CreateConfigResponse()
 
-            # Выбор первого свободного сервера
-            servers = Server.query.filter_by(country=request.country).all()
-            selected = next(
-                (s for s in servers
-                 if get_cached_user_count(s.host, s.port, s.ssh_username, s.ssh_password, s.id) < s.max_users),
-                None
-            )
-            if not selected:
-                context.set_code(grpc.StatusCode.NOT_FOUND)
-                context.set_details("Нет свободных серверов")
-                return config_service_pb2.CreateConfigResponse()
+            # Быстрый путь: готовый клиент из пула — одна транзакция БД, без SSH
+            claimed = claim_client_slot(request.country, request.user_id, request.months)
+            if claimed is not None:
+                try:
+                    activate_client_slot.delay(claimed.slot_id)
+                except Exception as e:
+                    # Без задачи клиент на VPS так и остался бы выключенным: отменяем выдачу
+                    # (VPS ещё не трогали) и создаём конфигурацию обычным путём ниже
+                    print(f"[SLOT_POOL][ERROR] enqueue failed for slot {claimed.slot_id}: {e}", flush=True)
+                    release_claimed_slot(claimed.slot_id)
+                    claimed = None
+            if claimed is not None:
+                incr_config_count(claimed.server_id)
+                try:
+                    refill_client_slots.delay(request.country)
+                except Exception as e:
+                    # Пул пополнит и периодическая задача
+                    print(f"[SLOT_POOL][WARN] refill not enqueued for {request.country}: {e}", flush=True)
+                return config_service_pb2.CreateConfigResponse(
+                    config_link=claimed.config_link,
+                    expiration_date=claimed.expiration_date.isoformat(),
+                    price={1:100,3:250,6:500,12:1000}[request.months]
+                )
+
+            # Атомарно занимаем слот на наименее загруженном исправном сервере страны
+            unhealthy = unhealthy_servers(request.country)
+            selected = None
+            while selected is None:
+                server_id = reserve_server(request.country, exclude=unhealthy)
+                if server_id is None:
+                    context.set_code(grpc.StatusCode.NOT_FOUND)
+                    context.set_details("Нет свободных серверов")
+                    return config_service_pb2.CreateConfigResponse()
+                selected = Server.query.get(server_id)
+                if selected is None:
+                    # Сервер удалён, а индекс ещё помнит его
+                    drop_server(request.country, server_id)
+            # Отвязанная от сессии копия: доступна и после rollback в обработке ошибки
+            selected = server_ref(selected)
 
             # Генерация параметров
             email = f"Unknown_Soldier_{request.user_id}_{uuid.uuid4().hex[:8]}"
             client_uuid = base64.urlsafe_b64encode(uuid.uuid4().bytes).rstrip(b"=").decode()
             flow = os.environ.get("FLOW", "")
 
+            new_client = dict(email=email, client_uuid=client_uuid, flow=flow,
+                              user_id=request.user_id, months=request.months)
+            provisioned = committed = False
             try:
-                # Шаг 1: добавить inbound и получить ссылку
-                link = insert_inbound_record(
-                    email, client_uuid,
+                # Не начинаем SSH, если клиент уже не дождётся ответа
+                check("создание конфигурации")
+                # Шаг 1-2: клиент в inbound и учёт трафика — один SSH-вызов, одна транзакция на VPS
+                link, = provision_clients(
                     selected.host, selected.port,
-                    flow, request.user_id, request.months,
-                    selected.ssh_username, selected.ssh_password, selected.x_ui_port
+                    selected.ssh_username, selected.ssh_password, selected.x_ui_port,
+                    [new_client],
+                    server_id=selected.id,
                 )
-                # Шаг 2: учёт трафика
-                insert_traffic_record(email, selected.port, request.months,
-                                      selected.host, selected.ssh_username, selected.ssh_password)
+                provisioned = True
                 # Шаг 3: перезапуск XUI
                 # restart_xui(selected.host, selected.port,
                 #             selected.ssh_username, selected.ssh_password)
@@ -109,13 +128,9 @@ class ConfigurationServiceServicer(config_service_pb2_grpc.ConfigurationServiceS
                 )
                 db.session.add(cfg)
                 db.session.commit()
+                committed = True
 
-                redis_key = _redis_key_for_server_count(selected.id)
-                if redis_client.exists(redis_key):
-                    redis_client.incr(redis_key, amount=1)
-                else:
-                    actual_count = UserConfiguration.query.filter_by(server_id=selected.id).count()
-                    redis_client.set(redis_key, actual_count, ex=300)
+                incr_config_count(selected.id)
 
                 # Ответ gRPC
                 return config_service_pb2.CreateConfigResponse(
@@ -125,13 +140,25 @@ class ConfigurationServiceServicer(config_service_pb2_grpc.ConfigurationServiceS
                 )
             except Exception as e:
                 db.session.rollback()
-                context.set_code(grpc.StatusCode.INTERNAL)
+                if not committed:
+                    # Конфигурация не выдана: клиента, уже созданного на VPS, удаляем и возвращаем слот.
+                    # Если удалить не вышло, слот остаётся занятым, а клиента (у него есть user_id)
+                    # добавит в БД синхронизация флота
+                    if not provisioned or _remove_orphan(selected, new_client):
+                        release_server(request.country, selected.id)
+                if isinstance(e, DeadlineExceeded):
+                    context.set_code(grpc.StatusCode.DEADLINE_EXCEEDED)
+                elif isinstance(e, (CircuitOpen, VpsBusy)):
+                    # Повторяемые ошибки: клиент может повторить запрос
+                    context.set_code(grpc.StatusCode.UNAVAILABLE)
+                else:
+                    context.set_code(grpc.StatusCode.INTERNAL)
                 context.set_details(str(e))
                 return config_service_pb2.CreateConfigResponse()
             
     
     def SyncConfigurations(self, request, context):
-        with app.app_context():
+        with get_app().app_context(), deadline_scope(context.time_remaining()):
             # 1. Проверка пользователя (существует ли)
             user = User.query.get(request.user_id)
             if not user:
@@ -139,90 +166,47 @@ class ConfigurationServiceServicer(config_service_pb2_grpc.ConfigurationServiceS
                 context.set_details("User not found")
                 return config_service_pb2.SyncConfigsResponse()
 
-            # 2. Собираем локальные конфигурации и их UUID
-            local_configs = UserConfiguration.query.filter_by(user_id=request.user_id).all()
-            local_uuids = {cfg.client_uuid for cfg in local_configs}
+            # 2. Получаем конфиги с VPS — все сервера опрашиваются параллельно,
+            # сервера, где с прошлой синхронизации пользователя не менялись ни x-ui.db,
+            # ни его локальные записи, пропускаются; остальные отдают только его клиентов
+            servers = [server_ref(s) for s in Server.query.all()]
+            snapshot = fetch_fleet_clients(servers, user_id=request.user_id)
+            # Недоступные машины просто пропускаем
+            for sid, e in snapshot.errors.items():
+                print(f"[SYNC][SKIP] server_id={sid}: {e}", flush=True)
+            SYNC_SERVERS_SKIPPED.labels(mode="user").inc(len(snapshot.unchanged))
 
-            # 3. Получаем все конфиги с VPS
-            vps_entries = []
-            servers = Server.query.all()
-            for srv in servers:
-                try:
-                    clients = get_vps_clients_configurations(
-                        host=srv.host,
-                        port=srv.port,
-                        ssh_username=srv.ssh_username,
-                        ssh_password=srv.ssh_password,
-                        x_ui_port=srv.x_ui_port
-                    )
-                    for c in clients:
-                        c['server_id'] = srv.id
-                        vps_entries.append(c)
-                except Exception:
-                    # Просто пропускаем недоступные машины
-                    continue
-
-            # Фильтруем только записи для данного user_id
-            user_vps = [c for c in vps_entries if c.get('user_id') == request.user_id]
-            vps_uuids = {c['id'] for c in user_vps}
-
-            # 4. Вычисляем новые и удалённые UUID
-            new_uuids     = vps_uuids - local_uuids
-            removed_uuids = local_uuids - vps_uuids
+            # 3. Записи VPS уже отфильтрованы по user_id
+            user_vps = [c for clients in snapshot.clients.values() for c in clients]
 
             try:
-                # 5. Добавляем и обновляем
-                for entry in user_vps:
-                    cuuid = entry['id']
-                    exp_date = datetime.fromtimestamp(entry['expiryTime'] / 1000, tz=timezone.utc)
-
-                    if cuuid in new_uuids:
-                        new_cfg = UserConfiguration(
-                            user_id       = request.user_id,
-                            server_id     = entry['server_id'],
-                            client_uuid   = cuuid,
-                            config_link   = entry.get('link'),
-                            expiration_date = exp_date,
-                            months        = entry.get('months')
-                        )
-                        db.session.add(new_cfg)
-                    else:
-                        cfg = next(cfg for cfg in local_configs if cfg.client_uuid == cuuid)
-                        cfg.config_link     = entry.get('link')
-                        cfg.expiration_date = exp_date
-                        cfg.months          = entry.get('months')
-
-                # 6. Удаляем старые
-                for cfg in local_configs:
-                    if cfg.client_uuid in removed_uuids:
-                        db.session.delete(cfg)
-
-                db.session.commit()
-
-                affected_server_ids = set()
-                for entry in user_vps:
-                    if entry['id'] in new_uuids:
-                        affected_server_ids.add(entry['server_id'])
-                for cfg in local_configs:
-                    if cfg.client_uuid in removed_uuids:
-                        affected_server_ids.add(cfg.server_id)
-
-                for sid in affected_server_ids:
-                    key = _redis_key_for_server_count(sid)
-                    actual = UserConfiguration.query.filter_by(server_id=sid).count()
-                    redis_client.set(key, actual, ex=300)
+                # 4. Добавляем/обновляем/удаляем пакетно.
+                # Удаляем только конфиги с ответивших серверов — иначе недоступный VPS «стирает» пользователя
+                reconcile_configurations(user_vps, set(snapshot.clients), user_id=request.user_id)
+                save_user_fingerprints(request.user_id,
+                                       {sid: snapshot.fingerprints[sid] for sid in snapshot.clients})
 
                 return config_service_pb2.SyncConfigsResponse(
                     message="Configurations synchronized successfully"
                 )
             except Exception as e:
-                db.session.rollback()
                 context.set_code(grpc.StatusCode.INTERNAL)
                 context.set_details(str(e))
                 return config_service_pb2.SyncConfigsResponse()
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=5))
+def serve(init_db=True):
+    # Приложение и схема БД — до приёма RPC, чтобы первый запрос не ждал инициализации
+    # (prefork создаёт схему один раз в супервизоре и передаёт init_db=False)
+    if init_db:
+        init_schema(get_app())
+    else:
+        get_app()
+    if GRPC_SERVING_MODE == "aio":
+        from app.grpc_server.aio_service import serve_aio
+        asyncio.run(serve_aio(ConfigurationServiceServicer(), 50052))
+        return
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=GRPC_MAX_WORKERS), options=SERVER_OPTIONS)
     config_service_pb2_grpc.add_ConfigurationServiceServicer_to_server(
         ConfigurationServiceServicer(), server
     )
@@ -236,6 +220,8 @@ def serve():
     server.add_insecure_port('[::]:50052')
     print("gRPC ConfigurationService listening on 50052")
     server.start()
+    # docker stop / prefork-супервизор: дать текущим RPC завершиться
+    signal.signal(signal.SIGTERM, lambda *_: server.stop(GRPC_SHUTDOWN_GRACE))
     server.wait_for_termination()
 
 
@@ -0,0 +1,34 @@
+# app/grpc_server/context.py
+import time
+
+import grpc
+
+
+class LocalServicerContext:
+    """
+    Минимальная замена grpc.ServicerContext, чтобы вызывать методы servicer'ов
+    вне gRPC-сервера (например, из задач Celery) и потом прочитать код ошибки.
+    """
+
+    def __init__(self, timeout: float = None):
+        self.code = grpc.StatusCode.OK
+        self.details = ""
+        self._deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def set_code(self, code):
+        self.code = code
+
+    def set_details(self, details):
+        self.details = details
+
+    def is_active(self) -> bool:
+        return True
+
+    def time_remaining(self):
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    @property
+    def ok(self) -> bool:
+        return self.code == grpc.StatusCode.OK
@@ -0,0 +1,130 @@
+# app/grpc_server/prefork.py
+"""
+Запуск gRPC-сервиса в нескольких процессах на одном порту (SO_REUSEPORT):
+
+    python -m app.grpc_server.prefork config   # ConfigurationService, 50052
+    python -m app.grpc_server.prefork server   # ServerService, 50051
+
+Воркеры стартуют через spawn: каждый заново импортирует приложение и получает
+собственные движок БД, клиенты Redis и пул SSH (gRPC-сервер после fork использовать нельзя).
+Родитель не обслуживает RPC — только следит за воркерами и перезапускает упавших.
+SIGTERM/SIGINT — плавная остановка всех, SIGHUP — поочерёдный перезапуск воркеров.
+"""
+import importlib
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from multiprocessing.connection import wait
+
+from dotenv import load_dotenv
+
+from app.grpc_server.settings import GRPC_SHUTDOWN_GRACE
+
+load_dotenv()
+
+GRPC_WORKERS = int(os.getenv("GRPC_WORKERS", 0)) or os.cpu_count() or 1
+# Воркер, проживший меньше, перезапускается с паузой — чтобы не крутить падающий импорт
+MIN_WORKER_UPTIME = 5.0
+RESTART_BACKOFF = 2.0
+
+SERVICES = {
+    "config": "app.grpc_server.config_service",
+    "server": "app.grpc_server.server_service",
+}
+
+_ctx = multiprocessing.get_context("spawn")
+
+
+def _run_worker(module_name: str):
+    # SIGINT (Ctrl+C в терминале) приходит всей группе — останавливает воркеров родитель
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Схему БД уже создал супервизор — воркеры не гоняют create_all наперегонки
+    importlib.import_module(module_name).serve(init_db=False)
+
+
+class Supervisor:
+    def __init__(self, module_name: str, workers: int = GRPC_WORKERS):
+        self.module_name = module_name
+        self.workers = workers
+        self.procs = {}  # sentinel -> (Process, время старта)
+        self.stopping = False
+        self.reload_requested = False
+
+    def _spawn(self):
+        proc = _ctx.Process(target=_run_worker, args=(self.module_name,), daemon=False)
+        proc.start()
+        self.procs[proc.sentinel] = (proc, time.monotonic())
+        print(f"[PREFORK] worker pid={proc.pid} started", flush=True)
+        return proc
+
+    def _stop(self, proc, grace: float = GRPC_SHUTDOWN_GRACE):
+        if proc.is_alive():
+            proc.terminate()  # SIGTERM — воркер доделывает текущие RPC
+            proc.join(grace + 1)
+        if proc.is_alive():
+            print(f"[PREFORK] worker pid={proc.pid} did not stop in time, killing", flush=True)
+            proc.kill()
+            proc.join()
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _rolling_restart(self):
+        # Новый воркер поднимается раньше, чем останавливается старый, — порт не пустеет
+        for sentinel, (proc, _) in list(self.procs.items()):
+            self._spawn()
+            self.procs.pop(sentinel, None)
+            self._stop(proc)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        for _ in range(self.workers):
+            self._spawn()
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                print("[PREFORK] rolling restart", flush=True)
+                self._rolling_restart()
+
+            for sentinel in wait(list(self.procs), timeout=1.0):
+                proc, started = self.procs.pop(sentinel)
+                proc.join()
+                if self.stopping:
+                    break
+                print(f"[PREFORK] worker pid={proc.pid} exited with {proc.exitcode}, restarting", flush=True)
+                if time.monotonic() - started < MIN_WORKER_UPTIME:
+                    time.sleep(RESTART_BACKOFF)
+                self._spawn()
+
+        print("[PREFORK] stopping workers", flush=True)
+        for proc, _ in list(self.procs.values()):
+            if proc.is_alive():
+                proc.terminate()
+        for proc, _ in list(self.procs.values()):
+            self._stop(proc)
+        self.procs.clear()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1 or argv[0] not in SERVICES:
+        print(f"usage: python -m app.grpc_server.prefork {{{'|'.join(SERVICES)}}}", file=sys.stderr)
+        return 2
+    print(f"[PREFORK] {argv[0]}: {GRPC_WORKERS} workers", flush=True)
+    from app import init_schema
+    init_schema()
+    Supervisor(SERVICES[argv[0]]).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
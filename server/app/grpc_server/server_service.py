@@ -1,75 +1,129 @@
 # F:\Education\OOP\shadow_link\server\app\grpc_server\server_service.py
 
-import grpc, os
+import base64
+import json
+import grpc
+import asyncio
+import signal
 from concurrent import futures
 from grpc_reflection.v1alpha import reflection
 
-from app import create_app
+from app import get_app, init_schema
+from app.grpc_server.settings import GRPC_SERVING_MODE, GRPC_MAX_WORKERS, GRPC_SHUTDOWN_GRACE, SERVER_OPTIONS, STREAM_BATCH_SIZE
 from app.generated_grpc import server_service_pb2, server_service_pb2_grpc
 from app.models.server import Server
 from app.extensions import db
+from sqlalchemy.orm import load_only
+from app.utils.counters import get_config_counts
 
-# ─── ПОДКЛЮЧЕНИЕ REDIS «НА МЕСТЕ» ───────────────────────────────────────────────
-import redis
-from dotenv import load_dotenv
+# Верхняя граница page_size
+MAX_PAGE_SIZE = 1000
 
-load_dotenv()
-# Используем переменную окружения REDIS_URL, которую ты прописал в docker-compose.yml
-redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"))
+SERVER_INFO_FIELDS = tuple(f.name for f in server_service_pb2.ServerInfo.DESCRIPTOR.fields)
+# Учётные данные SSH отдаются, только если их явно перечислили в read_mask
+CREDENTIAL_FIELDS = ("ssh_username", "ssh_password")
+DEFAULT_FIELDS = tuple(f for f in SERVER_INFO_FIELDS if f not in CREDENTIAL_FIELDS)
 
-# Вспомогательная функция для формирования ключа в Redis
-def _redis_key_for_server_count(server_id: int) -> str:
-    return f"server:{server_id}:active_config_count"
-# ────────────────────────────────────────────────────────────────────────────────
 
-app = create_app()
+class InvalidListRequest(ValueError):
+    pass
+
+
+def _encode_page_token(after_id: int, country: str) -> str:
+    raw = json.dumps({"after": after_id, "country": country}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_page_token(token: str, country: str) -> int:
+    """Курсор — id последнего отданного сервера; токен привязан к фильтру по стране."""
+    if not token:
+        return 0
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode()))
+        after_id = int(data["after"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidListRequest("Некорректный page_token")
+    if data.get("country", "") != country:
+        raise InvalidListRequest("page_token выдан для другого фильтра")
+    return after_id
+
+
+def _mask_fields(read_mask) -> tuple:
+    paths = tuple(read_mask.paths)
+    if not paths:
+        return DEFAULT_FIELDS
+    unknown = [p for p in paths if p not in SERVER_INFO_FIELDS]
+    if unknown:
+        raise InvalidListRequest(f"Неизвестные поля в read_mask: {', '.join(unknown)}")
+    return paths
+
+
+def _server_info(srv, fields, counts) -> server_service_pb2.ServerInfo:
+    values = {}
+    for name in fields:
+        if name == "users_count":
+            values[name] = counts[srv.id]
+        elif name == "port":
+            values[name] = str(srv.port)
+        else:
+            values[name] = getattr(srv, name)
+    return server_service_pb2.ServerInfo(**values)
+
 
 class ServerServiceServicer(server_service_pb2_grpc.ServerServiceServicer):
+    def list_page(self, country: str, after_id: int, limit: int, fields) -> tuple:
+        """
+        Одна страница серверов по id (keyset-пагинация) с заполненными только полями из fields.
+        Возвращает (servers, last_id, has_more).
+        """
+        with get_app().app_context():
+            query = Server.query.filter(Server.id > after_id).order_by(Server.id)
+            if country:
+                query = query.filter_by(country=country)
+            # Из БД читаем только нужные колонки
+            columns = [getattr(Server, f) for f in fields if f in Server.__table__.c and f != "id"]
+            if columns:
+                query = query.options(load_only(*columns))
+            rows = query.limit(limit + 1).all() if limit else query.all()
+            has_more = bool(limit) and len(rows) > limit
+            rows = rows[:limit] if limit else rows
+
+            # Счётчики всей страницы: один MGET, промахи — один GROUP BY
+            counts = get_config_counts(s.id for s in rows) if "users_count" in fields else {}
+            servers = [_server_info(s, fields, counts) for s in rows]
+            return servers, (rows[-1].id if rows else after_id), has_more
+
+    def parse_list_request(self, request) -> tuple:
+        """(fields, after_id) из запроса; InvalidListRequest — некорректная маска или токен."""
+        return _mask_fields(request.read_mask), _decode_page_token(request.page_token, request.country)
+
     def ListServers(self, request, context):
-        # Работа с базой в контексте приложения
-        with app.app_context():
-            query = Server.query
-            if request.country:
-                query = query.filter_by(country=request.country)
-            servers = query.all()
-
-            response_servers = []
-            for s in servers:
-                # 1) Пытаемся взять значение из Redis
-                key = _redis_key_for_server_count(s.id)
-                raw = redis_client.get(key)
-                if raw is not None:
-                    try:
-                        users_count = int(raw)
-                    except ValueError:
-                        users_count = None
-                else:
-                    users_count = None
-
-                # 2) Если ключа нет или он «битый» — пересчитываем из БД и кладём в Redis
-                if users_count is None:
-                    from app.models.user_configuration import UserConfiguration as UC
-                    users_count = UC.query.filter_by(server_id=s.id).count()
-                    # Записываем в Redis с TTL = 300 секунд (5 минут)
-                    redis_client.set(key, users_count, ex=300)
-
-                # 3) Собираем ответный объект с полем users_count
-                response_servers.append(
-                    server_service_pb2.ServerInfo(
-                        id=s.id,
-                        country=s.country,
-                        host=s.host,
-                        port=str(s.port),
-                        ssh_username=s.ssh_username,
-                        ssh_password=s.ssh_password,
-                        max_users=s.max_users,
-                        x_ui_port=s.x_ui_port,
-                        users_count=users_count,
-                        ui_panel_link=s.ui_panel_link,
-                    )
-                )
-
-            return server_service_pb2.ListServersResponse(servers=response_servers)
+        try:
+            fields, after_id = self.parse_list_request(request)
+        except InvalidListRequest as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return server_service_pb2.ListServersResponse()
+
+        page_size = min(max(request.page_size, 0), MAX_PAGE_SIZE)
+        servers, last_id, has_more = self.list_page(request.country, after_id, page_size, fields)
+        return server_service_pb2.ListServersResponse(
+            servers=servers,
+            next_page_token=_encode_page_token(last_id, request.country) if has_more else ""
+        )
+
+    def StreamServers(self, request, context):
+        try:
+            fields, after_id = self.parse_list_request(request)
+        except InvalidListRequest as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return
+
+        has_more = True
+        while has_more and context.is_active():
+            servers, after_id, has_more = self.list_page(request.country, after_id, STREAM_BATCH_SIZE, fields)
+            yield from servers
 
     # def CreateServer(self, request, context):
     #     srv = Server(
@@ -109,8 +163,19 @@ class ServerServiceServicer(server_service_pb2_grpc.ServerServiceServicer):
     #     db.session.commit()
     #     return server_service_pb2.DeleteServerResponse(message="Server deleted")
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=5))
+def serve(init_db=True):
+    # Приложение и схема БД — до приёма RPC, чтобы первый запрос не ждал инициализации
+    # (prefork создаёт схему один раз в супервизоре и передаёт init_db=False)
+    if init_db:
+        init_schema(get_app())
+    else:
+        get_app()
+    if GRPC_SERVING_MODE == "aio":
+        from app.grpc_server.aio_service import serve_aio
+        asyncio.run(serve_aio(ServerServiceServicer(), 50051))
+        return
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=GRPC_MAX_WORKERS), options=SERVER_OPTIONS)
     server_service_pb2_grpc.add_ServerServiceServicer_to_server(
         ServerServiceServicer(), server
     )
@@ -124,6 +189,8 @@ def serve():
     server.add_insecure_port('[::]:50051')
     print("gRPC ServerService listening on 50051")
     server.start()
+    # docker stop / prefork-супервизор: дать текущим RPC завершиться
+    signal.signal(signal.SIGTERM, lambda *_: server.stop(GRPC_SHUTDOWN_GRACE))
     server.wait_for_termination()
 
 if __name__ == '__main__':
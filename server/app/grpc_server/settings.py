@@ -0,0 +1,19 @@
+# app/grpc_server/settings.py
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# sync — пул потоков (по умолчанию), aio — приём RPC на grpc.aio, но работа servicer'а
+# (SSH, БД) по-прежнему блокирующая и выполняется в пуле потоков (см. aio_service)
+GRPC_SERVING_MODE = os.getenv("GRPC_SERVING_MODE", "sync")
+GRPC_MAX_WORKERS = int(os.getenv("GRPC_MAX_WORKERS", 5))
+# Сколько секунд на завершение текущих RPC после SIGTERM
+GRPC_SHUTDOWN_GRACE = float(os.getenv("GRPC_SHUTDOWN_GRACE", 10))
+
+# SO_REUSEPORT: несколько процессов (prefork) слушают один порт, ядро распределяет соединения
+SERVER_OPTIONS = [("grpc.so_reuseport", 1)]
+
+# Сколько серверов StreamServers читает из БД за раз
+STREAM_BATCH_SIZE = int(os.getenv("GRPC_STREAM_BATCH_SIZE", 500))
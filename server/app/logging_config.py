@@ -1,32 +1,204 @@
 # F:\Education\OOP\shadow_link\server\app\logging_config.py
 import os
 import logging
+import socket
+import threading
+import time
+from collections import deque
+
 import structlog
-from socket import socket, AF_INET, SOCK_STREAM
+
+from app.utils.metrics import LOGSTASH_RECONNECTS, LOGSTASH_RECORDS
+
+# Буфер записей на процесс: при переполнении выбрасываются самые старые
+LOGSTASH_QUEUE_SIZE     = int(os.getenv("LOGSTASH_QUEUE_SIZE", 10000))
+# Пачка уходит, когда набралось LOGSTASH_BATCH_SIZE записей или прошло LOGSTASH_FLUSH_INTERVAL секунд
+LOGSTASH_BATCH_SIZE     = int(os.getenv("LOGSTASH_BATCH_SIZE", 500))
+LOGSTASH_FLUSH_INTERVAL = float(os.getenv("LOGSTASH_FLUSH_INTERVAL", 1.0))
+LOGSTASH_SOCKET_TIMEOUT = float(os.getenv("LOGSTASH_SOCKET_TIMEOUT", 5.0))
+# Пауза между попытками переподключения удваивается до максимума
+LOGSTASH_BACKOFF_BASE   = 0.5
+LOGSTASH_BACKOFF_MAX    = 30.0
+# Сколько ждать отправки остатка буфера при остановке процесса
+LOGSTASH_SHUTDOWN_TIMEOUT = float(os.getenv("LOGSTASH_SHUTDOWN_TIMEOUT", 5.0))
+
 
 class LogstashJSONHandler(logging.Handler):
-    def __init__(self, host, port):
+    """
+    Отправка логов в Logstash (json_lines по TCP) без сетевых вызовов в потоке запроса:
+    emit только кладёт строку в ограниченный буфер, а фоновый поток отправляет пачки
+    по одному постоянному соединению, переподключаясь с нарастающей паузой.
+    """
+
+    def __init__(self, host, port, queue_size=LOGSTASH_QUEUE_SIZE, batch_size=LOGSTASH_BATCH_SIZE,
+                 flush_interval=LOGSTASH_FLUSH_INTERVAL):
         super().__init__()
         self.host, self.port = host, port
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.sent = 0
+        self.dropped = 0
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._buffer = deque(maxlen=self.queue_size)
+        self._cond = threading.Condition()
+        self._pending = []  # пачка, которую не удалось отправить, — уйдёт первой
+        self._inflight = 0  # записей в отправляемой сейчас пачке
+        self._sock = None
+        self._thread = None
+        self._closing = False
+        self._down = False  # последняя отправка не удалась — отправитель ждёт переподключения
+        self._retry_at = 0.0  # monotonic-время следующей попытки подключения
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="logstash-shipper", daemon=True)
+            self._thread.start()
 
     def emit(self, record):
         try:
-            msg = self.format(record) + "\n"
-            sock = socket(AF_INET, SOCK_STREAM)
-            sock.connect((self.host, self.port))
-            sock.sendall(msg.encode("utf-8"))
-            sock.close()
+            line = self.format(record) + "\n"
         except Exception:
-            pass
+            self.handleError(record)
+            return
+        # После fork (celery prefork, gunicorn) поток и сокет родителя не существуют — заводим свои
+        if self._pid != os.getpid():
+            self._reset()
+        with self._cond:
+            self._ensure_worker()
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+                LOGSTASH_RECORDS.labels(result="dropped").inc()
+            self._buffer.append(line)
+            # Пока Logstash недоступен, будить отправителя незачем — он ждёт срока переподключения
+            if len(self._buffer) >= self.batch_size and not self._down:
+                self._cond.notify()
+
+    def _next_batch(self) -> list:
+        with self._cond:
+            if not self._pending and not self._closing and len(self._buffer) < self.batch_size:
+                self._cond.wait(self.flush_interval)
+            batch, self._pending = self._pending, []
+            while self._buffer and len(batch) < self.batch_size:
+                batch.append(self._buffer.popleft())
+            self._inflight = len(batch)
+            return batch
+
+    def _send(self, batch: list) -> int:
+        """
+        Отправляет пачку; возвращает число записей, ушедших в сокет целиком.
+        При ошибке кидает OSError с атрибутом records_sent — их повторно не отправляем.
+        """
+        sent_records = 0
+        try:
+            if self._sock is None:
+                self._sock = socket.create_connection((self.host, self.port), timeout=LOGSTASH_SOCKET_TIMEOUT)
+                self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            payload = [line.encode("utf-8") for line in batch]
+            data = memoryview(b"".join(payload))
+            ends, offset = [], 0
+            for line in payload:
+                offset += len(line)
+                ends.append(offset)
+            written = 0
+            while written < len(data):
+                written += self._sock.send(data[written:])
+                while sent_records < len(ends) and ends[sent_records] <= written:
+                    sent_records += 1
+        except OSError as e:
+            # Запись, оборванная на середине, уйдёт заново целиком по новому соединению
+            e.records_sent = sent_records
+            raise
+        return sent_records
+
+    def _close_socket(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _run(self):
+        backoff = LOGSTASH_BACKOFF_BASE
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._closing:
+                    break
+                continue
+            try:
+                self._send(batch)
+            except OSError as e:
+                self._close_socket()
+                done = getattr(e, "records_sent", 0)
+                if done:
+                    self.sent += done
+                    LOGSTASH_RECORDS.labels(result="sent").inc(done)
+                with self._cond:
+                    # Дошедшие записи не повторяем — иначе в Logstash будут дубли
+                    self._pending, self._inflight = batch[done:], 0
+                    self._down = True
+                    self._retry_at = time.monotonic() + backoff
+                    if self._closing:
+                        break
+                    LOGSTASH_RECONNECTS.inc()
+                    # Пишем в stdout, а не в logging — иначе ошибка отправки снова попадёт в этот же буфер
+                    print(f"[LOGSTASH][WARN] {self.host}:{self.port} unavailable, retry in {backoff:.1f}s: {e}",
+                          flush=True)
+                    # notify() без срока не прерывает паузу: ждём до retry_at, будит только остановка
+                    while not self._closing and (remaining := self._retry_at - time.monotonic()) > 0:
+                        self._cond.wait(remaining)
+                backoff = min(backoff * 2, LOGSTASH_BACKOFF_MAX)
+                continue
+            backoff = LOGSTASH_BACKOFF_BASE
+            self._down = False
+            self._inflight = 0
+            self.sent += len(batch)
+            LOGSTASH_RECORDS.labels(result="sent").inc(len(batch))
+        self._close_socket()
+
+    def flush(self, timeout=LOGSTASH_SHUTDOWN_TIMEOUT):
+        """Будит отправителя и ждёт, пока буфер опустеет (но не дольше timeout)."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+        while self._buffer or self._pending or self._inflight:
+            # Logstash недоступен — ждать нечего, иначе каждый выход процесса затягивается на timeout
+            if self._down or not self._thread.is_alive() or time.monotonic() >= deadline:
+                break
+            time.sleep(0.01)
+
+    def close(self):
+        # logging.shutdown() при выходе вызывает flush() и close() — остаток буфера уходит в Logstash
+        if self._thread is not None and self._pid == os.getpid():
+            with self._cond:
+                self._closing = True
+                self._cond.notify()
+            self._thread.join(LOGSTASH_SHUTDOWN_TIMEOUT)
+            lost = len(self._buffer) + len(self._pending)
+            if lost:
+                self.dropped += lost
+                LOGSTASH_RECORDS.labels(result="dropped").inc(lost)
+        super().close()
+
 
 def configure_logging(host=None, port=None):
     host = host or os.getenv("LOGSTASH_HOST", "logstash")
     port = port or int(os.getenv("LOGSTASH_PORT", 5000))
 
     logging.basicConfig(level=logging.INFO, format="%(message)s")
-    handler = LogstashJSONHandler(host, port)
-    handler.setFormatter(logging.Formatter("%(message)s"))
-    logging.getLogger().addHandler(handler)
+    # create_app() вызывается в процессе многократно (Celery-задачи, gRPC) — обработчик один
+    root = logging.getLogger()
+    if not any(isinstance(h, LogstashJSONHandler) for h in root.handlers):
+        handler = LogstashJSONHandler(host, port)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        root.addHandler(handler)
 
     structlog.configure(
         processors=[
@@ -0,0 +1,19 @@
+# app/models/client_slot.py
+from app.extensions import db
+from datetime import datetime
+
+class ClientSlot(db.Model):
+    """Заранее созданный на VPS (выключенный) клиент, ожидающий выдачи пользователю."""
+    __tablename__ = 'client_slots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, db.ForeignKey('servers.id'), nullable=False)
+    client_uuid = db.Column(db.String(36), unique=True, nullable=False)
+    email = db.Column(db.String(150), nullable=False)
+    config_link = db.Column(db.String(255), nullable=False)
+    # ready — свободен; claimed — выдан пользователю, ждёт активации на VPS
+    status = db.Column(db.String(20), nullable=False, default='ready', index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+
+    server = db.relationship('Server')
@@ -5,13 +5,29 @@ from app.extensions import db
 from app.models.user import User
 from app.models.server import Server
 from app.utils.insert_servers import insert_servers
+from app.utils.placement import invalidate_placement_index
 
-from app.generated_grpc import server_service_pb2, server_service_pb2_grpc
+from app.generated_grpc import server_service_pb2
+from app.utils.grpc_clients import server_stub
+from app.utils.deadline import HTTP_REQUEST_BUDGET
 import grpc
+from google.protobuf import field_mask_pb2
 
 
 server_bp = Blueprint('servers', __name__, url_prefix='/api')
 
+# Поля по умолчанию — без учётных данных SSH: их администратор получает, только перечислив явно
+# (?fields=id,host,ssh_username,ssh_password)
+_SERVER_FIELDS = (
+    "id", "country", "host", "port",
+    "max_users", "x_ui_port", "users_count", "ui_panel_link",
+)
+_INT_FIELDS = {"id", "port", "max_users", "x_ui_port", "users_count"}
+
+
+def _server_json(info, fields) -> dict:
+    return {f: int(getattr(info, f) or 0) if f in _INT_FIELDS else getattr(info, f) for f in fields}
+
 
 # GET /api/servers — получить все серверы
 @server_bp.route('/servers', methods=['GET'])
@@ -25,39 +41,43 @@ def get_servers():
 
     # Опциональный фильтр по стране
     country = request.args.get('country', '')
-
-    # Создаём gRPC-канал и stub
-    channel = grpc.insecure_channel('grpc_server:50051')
-    stub = server_service_pb2_grpc.ServerServiceStub(channel)
-    grpc_req = server_service_pb2.ListServersRequest(country=country)
+    # Пагинация и выбор полей: ?page_size=50&page_token=...&fields=id,host,users_count
+    try:
+        page_size = int(request.args.get('page_size', 0))
+    except ValueError:
+        return jsonify(error="page_size должен быть числом"), 400
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+
+    # Общий долгоживущий канал процесса
+    stub = server_stub()
+    grpc_req = server_service_pb2.ListServersRequest(
+        country=country,
+        page_size=page_size,
+        page_token=request.args.get('page_token', ''),
+        read_mask=field_mask_pb2.FieldMask(paths=fields)
+    )
 
     try:
-        grpc_res = stub.ListServers(grpc_req)
-        result = [
-            {
-                "id": int(s.id),
-                "country": s.country,
-                "host": s.host,
-                "port": int(s.port),
-                "ssh_username": s.ssh_username,
-                "ssh_password": s.ssh_password,
-                "max_users": int(s.max_users),
-                "x_ui_port": int(s.x_ui_port),
-                "users_count": int(s.users_count),
-                "ui_panel_link": s.ui_panel_link
-            }
-            for s in grpc_res.servers
-        ]
-        return jsonify(result), 200
+        grpc_res = stub.ListServers(grpc_req, timeout=HTTP_REQUEST_BUDGET)
+        result = [_server_json(s, fields or _SERVER_FIELDS) for s in grpc_res.servers]
+        response = make_response(jsonify(result), 200)
+        # Тело остаётся списком (как раньше); следующая страница — в заголовке
+        if grpc_res.next_page_token:
+            response.headers['X-Next-Page-Token'] = grpc_res.next_page_token
+        return response
 
     except grpc.RpcError as e:
         status = e.code()
         msg = e.details() or 'gRPC error'
         http_code = 500
-        if status == grpc.StatusCode.UNAUTHENTICATED:
+        if status == grpc.StatusCode.INVALID_ARGUMENT:
+            http_code = 400
+        elif status == grpc.StatusCode.UNAUTHENTICATED:
             http_code = 401
         elif status == grpc.StatusCode.PERMISSION_DENIED:
             http_code = 403
+        elif status == grpc.StatusCode.DEADLINE_EXCEEDED:
+            http_code = 504
         return jsonify(error=msg), http_code
 
 
@@ -89,11 +109,14 @@ def update_server(server_id):
         return jsonify({'message': 'Server not found'}), 404
 
     data = request.get_json() or {}
+    old_country = server.country
     for field in ['country', 'ip', 'port', 'username', 'password']:
         if field in data:
             setattr(server, field, data[field])
 
     db.session.commit()
+    invalidate_placement_index(old_country)
+    invalidate_placement_index(server.country)
     return jsonify({'message': 'Server updated'}), 200
 
 # DELETE /api/servers/<int:server_id> — удалить сервер (только админ)
@@ -111,4 +134,5 @@ def delete_server(server_id):
 
     db.session.delete(server)
     db.session.commit()
+    invalidate_placement_index(server.country)
     return jsonify({'message': 'Server deleted'}), 200
\ No newline at end of file
@@ -1,5 +1,5 @@
 # F:\Education\OOP\shadow_link\server\app\routes\user_configurations.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta, timezone
 
@@ -9,23 +9,41 @@ from app.models.user import User
 
 from app.extensions import db
 
-from app.utils.vps_data import (
-    insert_inbound_record,
-    insert_traffic_record,
-    restart_xui,
-    count_users_on_port,
-    get_vps_clients_configurations,
-    get_cached_user_count
-)
+from app.tasks.celery_tasks import provision_configuration
 import uuid, os, base64
 import grpc
-from app.generated_grpc import config_service_pb2, config_service_pb2_grpc
+from dotenv import load_dotenv
+from app.generated_grpc import config_service_pb2
+from app.utils.grpc_clients import config_stub
+from app.utils.deadline import HTTP_REQUEST_BUDGET
+from app.utils.redis_pool import redis_client
+
+load_dotenv()
+
+# Асинхронный режим по умолчанию: 202 и id задачи. ASYNC_PROVISIONING=false или ?async=0 —
+# синхронный ответ 201 со ссылкой
+ASYNC_PROVISIONING = os.getenv("ASYNC_PROVISIONING", "true").lower() in ("1", "true", "yes")
+# Сколько хранится привязка задачи к пользователю (как и результат в Celery)
+JOB_TTL = 3600
 
 
 user_configurations_bp = Blueprint('user_configurations', __name__, url_prefix='/api')
 
 
+def _redis_key_for_job_owner(job_id: str) -> str:
+    return f"provision:job:{job_id}:owner"
+
+
+def _wants_async() -> bool:
+    flag = request.args.get('async')
+    if flag is None:
+        return ASYNC_PROVISIONING
+    return flag.lower() in ('1', 'true', 'yes')
+
+
 # POST /api/users/<id>/configurations — создать конфигурацию (самому себе)
+# По умолчанию создание ставится в очередь и сразу возвращается 202 с id задачи;
+# ?async=0 — дождаться ссылки в этом запросе
 @user_configurations_bp.route('/users/configurations/<int:user_id>', methods=['POST'])
 @jwt_required()
 def create_configuration(user_id):
@@ -36,10 +54,27 @@ def create_configuration(user_id):
     if not country or months not in (1, 3, 6, 12):
         return jsonify(error="Неверные входные данные"), 400
 
+    if _wants_async():
+        if int(get_jwt_identity()) != user_id:
+            return jsonify(error="Unauthorized"), 403
+        # Владелец записывается до постановки в очередь: опрос сразу после ответа не получит 404
+        job_id = str(uuid.uuid4())
+        redis_client.set(_redis_key_for_job_owner(job_id), user_id, ex=JOB_TTL)
+        try:
+            provision_configuration.apply_async(args=(user_id, country, months), task_id=job_id)
+        except Exception:
+            # Задача не поставлена — иначе опрос вечно видел бы PENDING
+            redis_client.delete(_redis_key_for_job_owner(job_id))
+            raise
+        return jsonify(
+            job_id=job_id,
+            status="queued",
+            status_url=url_for('user_configurations.get_configuration_job', job_id=job_id)
+        ), 202
+
     try:
-        # Создаем канал и stub
-        channel = grpc.insecure_channel('grpc_config:50052')
-        stub = config_service_pb2_grpc.ConfigurationServiceStub(channel)
+        # Общий долгоживущий канал процесса
+        stub = config_stub()
 
         # Формируем gRPC запрос
         grpc_request = config_service_pb2.CreateConfigRequest(
@@ -49,7 +84,7 @@ def create_configuration(user_id):
         )
 
         # Вызываем gRPC метод
-        grpc_response = stub.CreateConfiguration(grpc_request)
+        grpc_response = stub.CreateConfiguration(grpc_request, timeout=HTTP_REQUEST_BUDGET)
 
         if grpc_response.config_link == "":
             # Если пустая ссылка — значит что-то не так (gRPC вернул ошибку)
@@ -64,9 +99,44 @@ def create_configuration(user_id):
 
     except grpc.RpcError as e:
         # Обработка ошибок gRPC
+        if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+            return jsonify(error="Сервер не успел создать конфигурацию, попробуйте позже"), 504
         return jsonify(error=f"gRPC ошибка: {e.details()}"), 500
 
 
+# GET /api/users/configurations/jobs/<job_id> — статус асинхронного создания конфигурации
+@user_configurations_bp.route('/users/configurations/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_configuration_job(job_id):
+    owner = redis_client.get(_redis_key_for_job_owner(job_id))
+    if owner is None:
+        return jsonify(error="Job not found"), 404
+    if int(owner) != int(get_jwt_identity()):
+        return jsonify(error="Unauthorized"), 403
+
+    result = provision_configuration.AsyncResult(job_id)
+    state = result.state
+    if state in ('PENDING', 'RETRY'):
+        return jsonify(job_id=job_id, status="queued"), 200
+    if state == 'STARTED':
+        return jsonify(job_id=job_id, status="running"), 200
+    if state == 'SUCCESS':
+        payload = result.result if isinstance(result.result, dict) else {}
+        if not payload.get('config_link'):
+            error = payload.get('error') or "Ошибка при создании конфигурации"
+            return jsonify(job_id=job_id, status="failed", error=error), 200
+        return jsonify(
+            job_id=job_id,
+            status="succeeded",
+            config_link=payload['config_link'],
+            expiration_date=payload['expiration_date'],
+            price=payload['price']
+        ), 200
+
+    # FAILURE, REVOKED и любые другие состояния: result.result может быть исключением
+    return jsonify(job_id=job_id, status="failed", error="Ошибка при создании конфигурации"), 200
+
+
 # GET /api/users/<id>/configurations — список конфигураций (самому себе)
 @user_configurations_bp.route('/users/configurations/<int:user_id>', methods=['GET'])
 @jwt_required()
@@ -94,18 +164,19 @@ def sync_configurations(user_id):
     if int(get_jwt_identity()) != user_id:
         return jsonify(error="Unauthorized"), 403
 
-    channel = grpc.insecure_channel('grpc_config:50052')
-    stub    = config_service_pb2_grpc.ConfigurationServiceStub(channel)
+    stub    = config_stub()
     req     = config_service_pb2.SyncConfigsRequest(user_id=user_id)
 
     try:
-        res = stub.SyncConfigurations(req)
+        res = stub.SyncConfigurations(req, timeout=HTTP_REQUEST_BUDGET)
         return jsonify(message=res.message), 200
     except grpc.RpcError as e:
         code = e.code()
         http = 500
         if code == grpc.StatusCode.NOT_FOUND:
             http = 404
+        elif code == grpc.StatusCode.DEADLINE_EXCEEDED:
+            http = 504
         elif code == grpc.StatusCode.INVALID_ARGUMENT:
             http = 400
         return jsonify(error=e.details()), http
@@ -162,72 +162,152 @@
 
 from app.extensions import celery
 from app.models.server import Server
-import redis, os
+from app.utils.periodic import PERIODIC_TICK, changed_share, periodic
+from app.utils.ssh_metrics import count_retry
+import os
 from dotenv import load_dotenv
-from celery.schedules import crontab
 
 load_dotenv()
-redis_client = redis.Redis.from_url(os.getenv('REDIS_URL'))
 
 
 @celery.task(bind=True)
-def update_user_count_cache(self, host, port, ssh_username, ssh_password, ttl=60):
+def update_user_count_cache(self, server_id, ttl=60):
     from app.utils.vps_data import count_users_on_port
+    from app.utils.counters import set_vps_counts
+    from app.utils.circuit_breaker import CircuitOpen
+    srv = Server.query.get(server_id)
+    if srv is None:
+        return None
     try:
-        count = count_users_on_port(host, port, ssh_username, ssh_password)
-        redis_client.set(f"vps:users:{host}:{port}", count, ex=ttl)
+        count = count_users_on_port(srv.host, int(srv.port), srv.ssh_username, srv.ssh_password,
+                                    server_id=srv.id)
+        set_vps_counts({server_id: count}, ttl=ttl)
         return count
+    except CircuitOpen as e:
+        # Повторы до закрытия предохранителя бессмысленны
+        print(f"[USERS_COUNT][SKIP] server_id={server_id}: {e}", flush=True)
+        return None
     except Exception as e:
+        count_retry("task_retry", "count_users")
         self.retry(exc=e, countdown=10, max_retries=3)
 
 
+def _stats_activity(changed_key: str):
+    # Доля изменившегося за прогон; прогон без статистики (ошибка) считаем «занятым»
+    def activity(stats):
+        return changed_share(stats[changed_key], stats["servers"]) if stats else 1.0
+    return activity
+
+
 @celery.task
+@periodic("update_all_vps_user_counts", min_interval=60, max_interval=300,
+          activity=_stats_activity("changed"))
 def update_all_vps_user_counts():
+    # Весь флот опрашивается параллельно в одной задаче, счётчики пишутся одним pipeline
     print("[USERS_COUNT]", flush=True)
+    from app.utils.counters import refresh_vps_counts
+    from app.utils.fleet import server_ref
     try:
         servers = Server.query.all()
     except Exception as e:
         print(f"[ERROR] Failed to fetch servers: {e}", flush=True)
         return
 
+    refs = []
     for srv in servers:
         # фильтрация «плохих» портов
         if not srv.port or int(srv.port) == 0:
             print(f"[SKIP] Invalid port for {srv.host}:{srv.port}", flush=True)
             continue
-        update_user_count_cache.delay(
-            srv.host, int(srv.port), srv.ssh_username, srv.ssh_password
-        )
+        refs.append(server_ref(srv))
+    return refresh_vps_counts(refs)
 
 
 @celery.task
+@periodic("sync_all_user_configurations", min_interval=60, max_interval=600,
+          activity=_stats_activity("answered"))
 def sync_all_user_configurations():
+    # Один проход по флоту вместо SyncConfigurations для каждого пользователя.
+    # Точечная синхронизация пользователя по-прежнему доступна через gRPC SyncConfigurations.
     print("[SYNC_USER_CONFIGURATIONS]", flush=True)
-    from app import create_app
-    from app.models.user import User
+    from app import get_app
+    from app.utils.config_sync import sync_fleet_configurations
+
+    with get_app().app_context():
+        try:
+            return sync_fleet_configurations()
+        except Exception as e:
+            print(f"[SYNC_TASK][ERROR] fleet sync failed: {e}", flush=True)
+
+
+@celery.task(bind=True, track_started=True)
+def provision_configuration(self, user_id, country, months):
+    """
+    Асинхронное создание конфигурации: та же логика ConfigurationServiceServicer.CreateConfiguration,
+    но вне HTTP-запроса. Результат (ссылка или ошибка) читается по id задачи.
+    """
     from app.grpc_server.config_service import ConfigurationServiceServicer
-    from app.generated_grpc.config_service_pb2 import SyncConfigsRequest
+    from app.grpc_server.context import LocalServicerContext
+    from app.generated_grpc.config_service_pb2 import CreateConfigRequest
+
+    context = LocalServicerContext()
+    response = ConfigurationServiceServicer().CreateConfiguration(
+        CreateConfigRequest(user_id=user_id, country=country, months=months), context
+    )
+    if not context.ok or not response.config_link:
+        print(f"[PROVISION][ERROR] user_id={user_id}: {context.code.name} {context.details}", flush=True)
+        return {"error": context.details or "Ошибка при создании конфигурации", "code": context.code.name}
+    return {
+        "config_link": response.config_link,
+        "expiration_date": response.expiration_date,
+        "price": response.price,
+    }
+
+
+@celery.task
+@periodic("refill_client_slots", min_interval=60, max_interval=300,
+          activity=lambda created: 1.0 if created and any(created.values()) else 0.0)
+def refill_client_slots(country=None):
+    """Пополняет пул готовых клиентов (одной страны или всех)."""
+    from app.utils.slot_pool import refill_country
+    if country:
+        countries = [country]
+    else:
+        countries = [c for (c,) in Server.query.with_entities(Server.country).distinct().all()]
+    created = {}
+    for c in countries:
+        try:
+            created[c] = refill_country(c)
+        except Exception as e:
+            print(f"[SLOT_POOL][ERROR] {c}: {e}", flush=True)
+    print(f"[SLOT_POOL] created {created}", flush=True)
+    return created
 
-    flask_app = create_app()
-    with flask_app.app_context():
-        service = ConfigurationServiceServicer()
-        for user in User.query.all():
-            try:
-                print(f"[SYNC_TASK] user_id={user.id}", flush=True)
-                req = SyncConfigsRequest(user_id=user.id)
-                service.SyncConfigurations(req, context=None)
-            except Exception as e:
-                print(f"[SYNC_TASK][ERROR] user_id={user.id}: {e}", flush=True)
+
+@celery.task(bind=True)
+def activate_client_slot(self, slot_id):
+    from app.utils.slot_pool import activate_claimed_slot
+    from app.utils.vps_data import ClientNotFound
+    try:
+        activate_claimed_slot(slot_id)
+    except Exception as e:
+        if isinstance(e, ClientNotFound):
+            # Слот не удалён: после исчерпания повторов он остаётся claimed для разбора
+            print(f"[SLOT_POOL][ERROR] slot {slot_id}: {e}", flush=True)
+        count_retry("task_retry", "activate_client")
+        self.retry(exc=e, countdown=10, max_retries=5)
 
 
 @celery.task
+@periodic("load_servers_from_env", min_interval=60, max_interval=600,
+          activity=_stats_activity("added"))
 def load_servers_from_env():
-    from app import create_app, db
+    from app import get_app, db
     from app.models.server import Server
+    from app.utils.placement import invalidate_placement_index
     from sqlalchemy.exc import IntegrityError
 
-    flask_app = create_app()
-    with flask_app.app_context():
+    with get_app().app_context():
         i, added = 1, 0
         while True:
             host = os.getenv(f"HOST{i}")
@@ -255,6 +335,7 @@ def load_servers_from_env():
                     )
                     db.session.add(server)
                     db.session.commit()
+                    invalidate_placement_index(server.country)
                     added += 1
                     print(f"[ENV_LOAD] Added: {host}:{port}", flush=True)
                 except IntegrityError as e:
@@ -262,6 +343,7 @@ def load_servers_from_env():
                     print(f"[ENV_LOAD][ERROR] {host}:{port}: {e}", flush=True)
             i += 1
         print(f"[ENV_LOAD] Total added: {added}", flush=True)
+        return {"servers": i - 1, "added": added}
 
 
 @celery.on_after_configure.connect
@@ -270,20 +352,16 @@ def setup_all_periodic_tasks(sender, **kwargs):
     update_all_vps_user_counts.s().apply_async()
     sync_all_user_configurations.s().apply_async()
     load_servers_from_env.s().apply_async()
-
-    # расписание
-    sender.add_periodic_task(
-        crontab(minute='*/1'),
-        update_all_vps_user_counts.s(),
-        name='update-vps-user-counts-every-minute'
-    )
-    sender.add_periodic_task(
-        crontab(minute='*/1'),
-        sync_all_user_configurations.s(),
-        name='sync-configs-every-3-minutes'
-    )
-    sender.add_periodic_task(
-        crontab(minute='*/1'),
-        load_servers_from_env.s(),
-        name='load-servers-every-10-minutes'
-    )
\ No newline at end of file
+    refill_client_slots.s().apply_async()
+
+    # Расписание: beat лишь «стучится» каждые PERIODIC_TICK секунд, а запускается задача
+    # по своему адаптивному интервалу (app/utils/periodic.py) и только в одном экземпляре.
+    # Не взятый воркером тик устаревает — очередь не копит пропущенные запуски.
+    for task in (update_all_vps_user_counts, sync_all_user_configurations,
+                 load_servers_from_env, refill_client_slots):
+        sender.add_periodic_task(
+            PERIODIC_TICK,
+            task.s(),
+            name=f"{task.name.rsplit('.', 1)[-1]}-tick",
+            options={"expires": PERIODIC_TICK},
+        )
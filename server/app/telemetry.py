@@ -0,0 +1,82 @@
+# app/telemetry.py
+"""
+OpenTelemetry (трассировка + метрики) и инструментирование библиотек.
+
+Настраивается один раз на процесс при первом create_app(), а не при импорте пакета app:
+импорт моделей и утилит (тесты, скрипты, Celery beat) не тянет экспортеры и инструментаторы.
+"""
+import os
+import threading
+
+_lock = threading.Lock()
+_initialized = False
+
+
+def _trace_sampler():
+    """
+    Записывается только доля трасс (OTEL_TRACES_SAMPLER_ARG); решение корневого спана
+    (flaskapp) наследуют gRPC-сервисы и Celery — трасса либо целиком есть, либо её нет.
+    """
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    return ParentBased(TraceIdRatioBased(float(os.getenv("OTEL_TRACES_SAMPLER_ARG", "0.1"))))
+
+
+def init_telemetry():
+    """Провайдеры трасс и метрик, инструментирование psycopg2, SQLAlchemy, Celery, Redis, gRPC. Идемпотентна."""
+    global _initialized
+    if _initialized:
+        return
+    with _lock:
+        if _initialized:
+            return
+
+        from opentelemetry import trace, metrics
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.jaeger.thrift import JaegerExporter
+        from opentelemetry.sdk.metrics import MeterProvider
+        from opentelemetry.exporter.prometheus import PrometheusMetricReader
+        from opentelemetry.instrumentation.psycopg2 import Psycopg2Instrumentor
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+        from opentelemetry.instrumentation.celery import CeleryInstrumentor
+        from opentelemetry.instrumentation.redis import RedisInstrumentor
+        from opentelemetry.instrumentation.grpc import (
+            GrpcAioInstrumentorServer, GrpcInstrumentorClient, GrpcInstrumentorServer,
+        )
+
+        resource = Resource.create({
+            "service.name": os.getenv("OTEL_SERVICE_NAME", "flaskapp")
+        })
+
+        # Tracing
+        trace_provider = TracerProvider(resource=resource, sampler=_trace_sampler())
+        jaeger_exporter = JaegerExporter(
+            agent_host_name=os.getenv("OTEL_EXPORTER_JAEGER_AGENT_HOST", "localhost"),
+            agent_port=int(os.getenv("OTEL_EXPORTER_JAEGER_AGENT_PORT", "6831"))
+        )
+        trace_provider.add_span_processor(BatchSpanProcessor(jaeger_exporter))
+        trace.set_tracer_provider(trace_provider)
+
+        # Metrics
+        prom_reader = PrometheusMetricReader()
+        meter_provider = MeterProvider(metric_readers=[prom_reader])
+        metrics.set_meter_provider(meter_provider)
+
+        # Инструментирование библиотек — до первого подключения к БД/Redis
+        Psycopg2Instrumentor().instrument()
+        SQLAlchemyInstrumentor().instrument()
+        CeleryInstrumentor().instrument()
+        RedisInstrumentor().instrument()
+        # gRPC: клиент (flaskapp, Celery) передаёт контекст трассы в метаданных, сервер продолжает её
+        GrpcInstrumentorClient().instrument()
+        GrpcInstrumentorServer().instrument()
+        GrpcAioInstrumentorServer().instrument()
+
+        _initialized = True
+
+
+def instrument_flask(app):
+    from opentelemetry.instrumentation.flask import FlaskInstrumentor
+    # Спаны и HTTP-метрики даёт один инструментатор
+    FlaskInstrumentor().instrument_app(app)
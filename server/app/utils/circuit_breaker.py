@@ -0,0 +1,161 @@
+# app/utils/circuit_breaker.py
+import os
+import time
+
+import redis
+from dotenv import load_dotenv
+
+from app.utils.metrics import CIRCUIT_TRANSITIONS
+from app.utils.redis_pool import redis_client
+
+load_dotenv()
+
+# Сколько подряд неудач открывают цепь и на сколько (удваивается при каждом повторном открытии)
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 3))
+BREAKER_BASE_COOLDOWN     = float(os.getenv("BREAKER_BASE_COOLDOWN", 30))
+BREAKER_MAX_COOLDOWN      = float(os.getenv("BREAKER_MAX_COOLDOWN", 600))
+# Сколько живёт пробный запрос в half_open: если он завис, пробу получит следующий
+BREAKER_PROBE_TTL         = float(os.getenv("BREAKER_PROBE_TTL", 60))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def _redis_key_for_breaker(host: str, port) -> str:
+    return f"vps:breaker:{host}:{int(port)}"
+
+
+# Можно ли идти на хост. Из open по истечении паузы цепь переходит в half_open,
+# и ровно один вызывающий получает пробный запрос. Возвращает {разрешено, состояние}.
+_ALLOW_LUA = """
+local now = tonumber(ARGV[1])
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'closed' then
+  return {1, state}
+end
+if state == 'open' then
+  if now < tonumber(redis.call('HGET', KEYS[1], 'opened_until') or 0) then
+    return {0, state}
+  end
+  redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', now + tonumber(ARGV[2]))
+  return {1, 'half_open'}
+end
+if now < tonumber(redis.call('HGET', KEYS[1], 'probe_until') or 0) then
+  return {0, state}
+end
+redis.call('HSET', KEYS[1], 'probe_until', now + tonumber(ARGV[2]))
+return {1, state}
+"""
+
+# Неудача: считаем подряд идущие ошибки; на пороге или при неудачной пробе — открываем
+# с экспоненциально растущей паузой. Возвращает новое состояние.
+_FAILURE_LUA = """
+local now = tonumber(ARGV[1])
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if state == 'half_open' or (state == 'closed' and failures >= tonumber(ARGV[2])) then
+  local opens = redis.call('HINCRBY', KEYS[1], 'opens', 1)
+  local cooldown = math.min(tonumber(ARGV[3]) * 2 ^ (opens - 1), tonumber(ARGV[4]))
+  redis.call('HSET', KEYS[1], 'state', 'open', 'opened_until', now + cooldown)
+  redis.call('HDEL', KEYS[1], 'probe_until')
+  state = 'open'
+end
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[4]) * 4))
+return state
+"""
+
+_allow_script = redis_client.register_script(_ALLOW_LUA)
+_failure_script = redis_client.register_script(_FAILURE_LUA)
+
+
+def allow(host: str, port) -> bool:
+    """Пропускает вызов к VPS, если цепь не открыта. При недоступном Redis — пропускает."""
+    try:
+        allowed, state = _allow_script(
+            keys=[_redis_key_for_breaker(host, port)], args=[time.time(), BREAKER_PROBE_TTL]
+        )
+    except redis.RedisError:
+        return True
+    return bool(allowed)
+
+
+def guard(host: str, port):
+    if not allow(host, port):
+        raise CircuitOpen(f"{host}:{port} недоступен, повторная попытка позже")
+
+
+def record_success(host: str, port):
+    """
+    Успешный вызов закрывает цепь и сбрасывает счётчик ошибок. Число открытий остаётся
+    до истечения ключа — у «мигающего» хоста пауза продолжает расти.
+    """
+    key = _redis_key_for_breaker(host, port)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hget(key, "state")
+        pipe.hdel(key, "state", "failures", "opened_until", "probe_until")
+        state, _ = pipe.execute()
+    except redis.RedisError:
+        return
+    if state is not None and state.decode() != CLOSED:
+        CIRCUIT_TRANSITIONS.labels(state=CLOSED).inc()
+        print(f"[BREAKER] {host}:{port} closed", flush=True)
+
+
+def record_failure(host: str, port):
+    try:
+        state = _failure_script(
+            keys=[_redis_key_for_breaker(host, port)],
+            args=[time.time(), BREAKER_FAILURE_THRESHOLD, BREAKER_BASE_COOLDOWN, BREAKER_MAX_COOLDOWN],
+        )
+    except redis.RedisError:
+        return
+    if state.decode() == OPEN:
+        CIRCUIT_TRANSITIONS.labels(state=OPEN).inc()
+        print(f"[BREAKER] {host}:{port} open", flush=True)
+
+
+def open_hosts(hosts) -> set:
+    """
+    Из (host, port) выбирает те, к которым сейчас идти не стоит (open до истечения паузы
+    или half_open с идущей пробой). Одним pipeline; при недоступном Redis — пусто.
+    """
+    hosts = list(hosts)
+    if not hosts:
+        return set()
+    now = time.time()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for host, port in hosts:
+            pipe.hmget(_redis_key_for_breaker(host, port), "state", "opened_until", "probe_until")
+        rows = pipe.execute()
+    except redis.RedisError:
+        return set()
+    unhealthy = set()
+    for hp, (state, opened_until, probe_until) in zip(hosts, rows):
+        if state == b"open" and now < float(opened_until or 0):
+            unhealthy.add(hp)
+        elif state == b"half_open" and now < float(probe_until or 0):
+            unhealthy.add(hp)
+    return unhealthy
+
+
+def breaker_states() -> dict:
+    """(host, port) -> {'state', 'failures'} для всех хостов с недавними ошибками."""
+    keys = list(redis_client.scan_iter(match="vps:breaker:*", count=500))
+    if not keys:
+        return {}
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.hmget(key, "state", "failures")
+    states = {}
+    for key, (state, failures) in zip(keys, pipe.execute()):
+        host, _, port = key.decode()[len("vps:breaker:"):].rpartition(":")
+        states[(host, port)] = {
+            "state": (state or b"closed").decode(),
+            "failures": int(failures or 0),
+        }
+    return states
@@ -0,0 +1,270 @@
+# app/utils/config_sync.py
+import hashlib
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import redis
+from dotenv import load_dotenv
+
+from app.extensions import db
+from app.models.server import Server
+from app.models.user import User
+from app.models.user_configuration import UserConfiguration
+from app.utils.fleet import fan_out, server_ref
+from app.utils.metrics import SYNC_FINGERPRINT_CHECKS, SYNC_SERVERS_SKIPPED
+from app.utils.redis_pool import redis_client
+from app.utils.reconcile import reconcile_configurations
+from app.utils.vps_data import get_vps_clients_if_changed
+
+load_dotenv()
+
+# Отпечаток живёт сутки: сервер, не синхронизировавшийся так долго, перечитаем целиком
+FINGERPRINT_TTL = int(os.getenv("VPS_FINGERPRINT_TTL", 86400))
+# Сервер, у которого данные не менялись несколько циклов подряд, опрашивается реже:
+# пауза удваивается с каждым «пустым» циклом, пока не дойдёт до максимума
+SYNC_IDLE_BASE_INTERVAL = float(os.getenv("SYNC_IDLE_BASE_INTERVAL", 60))
+SYNC_IDLE_MAX_INTERVAL  = float(os.getenv("SYNC_IDLE_MAX_INTERVAL", 900))
+
+
+def _redis_key_for_fingerprint(server_id: int) -> str:
+    return f"vps:fingerprint:{server_id}"
+
+
+def _redis_key_for_user_fingerprint(server_id: int, user_id: int) -> str:
+    # "отпечаток x-ui.db:дайджест локальных записей пользователя" после его последней синхронизации
+    return f"vps:fingerprint:{server_id}:user:{user_id}"
+
+
+def _redis_key_for_cadence() -> str:
+    # server_id -> "число пустых циклов подряд:время следующего опроса"
+    return "vps:sync:cadence"
+
+
+@dataclass
+class FleetSnapshot:
+    clients: dict = field(default_factory=dict)       # server_id -> клиенты (только изменившиеся сервера)
+    unchanged: set = field(default_factory=set)       # server_id с прежним отпечатком
+    fingerprints: dict = field(default_factory=dict)  # server_id -> новый отпечаток
+    errors: dict = field(default_factory=dict)        # server_id -> исключение
+
+
+def load_fingerprints(server_ids) -> dict:
+    """Отпечатки последней успешной синхронизации; при недоступном Redis — пусто (перечитаем всё)."""
+    server_ids = list(server_ids)
+    if not server_ids:
+        return {}
+    try:
+        raw = redis_client.mget([_redis_key_for_fingerprint(sid) for sid in server_ids])
+    except redis.RedisError as e:
+        print(f"[FLEET_SYNC][WARN] fingerprints unavailable: {e}", flush=True)
+        return {}
+    return {sid: fp.decode() for sid, fp in zip(server_ids, raw) if fp is not None}
+
+
+def local_digests(user_id: int, server_ids) -> dict:
+    """server_id -> md5 локальных записей пользователя на сервере. Должна вызываться внутри app_context."""
+    server_ids = list(server_ids)
+    if not server_ids:
+        return {}
+    rows = db.session.query(
+        UserConfiguration.server_id, UserConfiguration.client_uuid, UserConfiguration.config_link,
+        UserConfiguration.months, UserConfiguration.expiration_date,
+    ).filter(
+        UserConfiguration.user_id == user_id, UserConfiguration.server_id.in_(server_ids)
+    ).order_by(UserConfiguration.client_uuid).all()
+    lines = defaultdict(list)
+    for sid, *values in rows:
+        lines[sid].append("|".join(map(str, values)))
+    return {sid: hashlib.md5("\n".join(lines[sid]).encode()).hexdigest() for sid in server_ids}
+
+
+def load_user_fingerprints(user_id: int, server_ids) -> dict:
+    """
+    Отпечатки x-ui.db для синхронизации одного пользователя. Отпечаток действует, только пока
+    локальные записи пользователя на сервере не изменились: удалённую у нас запись
+    надо перечитать с VPS, даже если сам VPS не менялся.
+    """
+    server_ids = list(server_ids)
+    if not server_ids:
+        return {}
+    try:
+        raw = redis_client.mget([_redis_key_for_user_fingerprint(sid, user_id) for sid in server_ids])
+    except redis.RedisError as e:
+        print(f"[SYNC][WARN] fingerprints unavailable: {e}", flush=True)
+        return {}
+    stored = {sid: value.decode().split(":") for sid, value in zip(server_ids, raw) if value is not None}
+    local = local_digests(user_id, stored)
+    return {sid: fp for sid, (fp, digest) in stored.items() if local[sid] == digest}
+
+
+def save_user_fingerprints(user_id: int, fingerprints: dict):
+    """Запоминает отпечатки вместе с локальным состоянием после успешной сверки пользователя."""
+    if not fingerprints:
+        return
+    local = local_digests(user_id, fingerprints)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for sid, fp in fingerprints.items():
+            pipe.set(_redis_key_for_user_fingerprint(sid, user_id), f"{fp}:{local[sid]}", ex=FINGERPRINT_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"[SYNC][WARN] fingerprints not saved: {e}", flush=True)
+
+
+def save_fingerprints(fingerprints: dict):
+    if not fingerprints:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for sid, fp in fingerprints.items():
+            pipe.set(_redis_key_for_fingerprint(sid), fp, ex=FINGERPRINT_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"[FLEET_SYNC][WARN] fingerprints not saved: {e}", flush=True)
+
+
+def deferred_servers(server_ids, now: float = None) -> set:
+    """Сервера, которые в этом цикле можно не опрашивать; при недоступном Redis — опрашиваем все."""
+    server_ids = list(server_ids)
+    if not server_ids:
+        return set()
+    now = time.time() if now is None else now
+    try:
+        raw = redis_client.hmget(_redis_key_for_cadence(), [str(sid) for sid in server_ids])
+    except redis.RedisError as e:
+        print(f"[FLEET_SYNC][WARN] cadence unavailable: {e}", flush=True)
+        return set()
+    deferred = set()
+    for sid, value in zip(server_ids, raw):
+        if value is not None and now < float(value.decode().split(":")[1]):
+            deferred.add(sid)
+    return deferred
+
+
+def update_cadence(unchanged, changed, now: float = None):
+    """
+    Неизменившийся сервер откладывается на SYNC_IDLE_BASE_INTERVAL * 2^(k-1), где k — число
+    пустых циклов подряд; изменившийся снова опрашивается каждый цикл.
+    """
+    unchanged, changed = list(unchanged), list(changed)
+    if not unchanged and not changed:
+        return
+    now = time.time() if now is None else now
+    key = _redis_key_for_cadence()
+    try:
+        streaks = {}
+        if unchanged:
+            raw = redis_client.hmget(key, [str(sid) for sid in unchanged])
+            for sid, value in zip(unchanged, raw):
+                streaks[sid] = (int(value.decode().split(":")[0]) if value is not None else 0) + 1
+        pipe = redis_client.pipeline(transaction=False)
+        if streaks:
+            pipe.hset(key, mapping={
+                str(sid): f"{streak}:{now + min(SYNC_IDLE_BASE_INTERVAL * 2 ** (streak - 1), SYNC_IDLE_MAX_INTERVAL)}"
+                for sid, streak in streaks.items()
+            })
+        if changed:
+            pipe.hdel(key, *[str(sid) for sid in changed])
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"[FLEET_SYNC][WARN] cadence not saved: {e}", flush=True)
+
+
+def fetch_fleet_clients(servers, skip_unchanged: bool = True, user_id: int = None) -> FleetSnapshot:
+    """
+    Один раз за цикл опрашивает каждый сервер (параллельно). Сервера, у которых
+    отпечаток x-ui.db совпал с сохранённым, не передают и не разбирают список клиентов.
+    С user_id фильтрация по пользователю выполняется на стороне VPS, а отпечатки
+    берутся собственные для пользователя (см. load_user_fingerprints).
+    """
+    if not skip_unchanged:
+        known = {}
+    elif user_id is not None:
+        known = load_user_fingerprints(user_id, (srv.id for srv in servers))
+    else:
+        known = load_fingerprints(srv.id for srv in servers)
+    results, errors = fan_out(
+        servers,
+        lambda srv: get_vps_clients_if_changed(
+            server_id=srv.id,
+            host=srv.host,
+            port=srv.port,
+            ssh_username=srv.ssh_username,
+            ssh_password=srv.ssh_password,
+            x_ui_port=srv.x_ui_port,
+            known_fingerprint=known.get(srv.id),
+            user_id=user_id
+        )
+    )
+
+    snapshot = FleetSnapshot(errors=errors)
+    for sid, (fingerprint, clients) in results.items():
+        snapshot.fingerprints[sid] = fingerprint
+        if clients is None:
+            snapshot.unchanged.add(sid)
+            SYNC_FINGERPRINT_CHECKS.labels(result="hit").inc()
+            continue
+        SYNC_FINGERPRINT_CHECKS.labels(result="miss").inc()
+        for c in clients:
+            c['server_id'] = sid
+        snapshot.clients[sid] = clients
+    return snapshot
+
+
+def group_by_user(clients_by_server) -> dict:
+    """Группирует записи VPS по user_id; клиенты без user_id (созданные вручную в панели) пропускаются."""
+    grouped = defaultdict(list)
+    for clients in clients_by_server.values():
+        for c in clients:
+            if c.get('user_id') is not None:
+                grouped[c['user_id']].append(c)
+    return grouped
+
+
+def sync_fleet_configurations() -> dict:
+    """
+    Синхронизация UserConfiguration всех пользователей за один проход по флоту:
+    каждый сервер опрашивается ровно один раз, затем одним diff'ом
+    добавляются/обновляются/удаляются локальные записи.
+    Сервера с неизменным отпечатком пропускаются целиком, а долго не менявшиеся
+    опрашиваются реже (см. update_cadence).
+    Должна вызываться внутри app_context.
+    """
+    servers = [server_ref(s) for s in Server.query.all()]
+    deferred = deferred_servers(srv.id for srv in servers)
+    snapshot = fetch_fleet_clients([srv for srv in servers if srv.id not in deferred])
+    for sid, e in snapshot.errors.items():
+        print(f"[FLEET_SYNC][SKIP] server_id={sid}: {e}", flush=True)
+    SYNC_SERVERS_SKIPPED.labels(mode="fleet").inc(len(snapshot.unchanged))
+    SYNC_SERVERS_SKIPPED.labels(mode="deferred").inc(len(deferred))
+
+    answered = set(snapshot.clients)
+    by_user = group_by_user(snapshot.clients)
+    known_users = {
+        uid for (uid,) in db.session.query(User.id).filter(User.id.in_(list(by_user))).all()
+    } if by_user else set()
+    entries = [e for uid, user_entries in by_user.items() if uid in known_users for e in user_entries]
+
+    # Все UUID, которые реально есть на ответивших серверах (включая чужие/ручные)
+    present_uuids = {c['id'] for clients in snapshot.clients.values() for c in clients}
+
+    result = reconcile_configurations(entries, answered, present_uuids=present_uuids)
+    # Отпечаток запоминаем только после успешной сверки всех пользователей сервера
+    save_fingerprints({sid: snapshot.fingerprints[sid] for sid in answered})
+    update_cadence(snapshot.unchanged, answered)
+
+    stats = {
+        "servers": len(servers),
+        "answered": len(answered),
+        "unchanged": len(snapshot.unchanged),
+        "deferred": len(deferred),
+        "failed": len(snapshot.errors),
+        "users": len(by_user),
+        "added": result.added,
+        "updated": result.updated,
+        "removed": result.removed,
+    }
+    print(f"[FLEET_SYNC] {stats}", flush=True)
+    return stats
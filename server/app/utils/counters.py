@@ -0,0 +1,235 @@
+# app/utils/counters.py
+import math
+import os
+import random
+import time
+
+import redis
+from dotenv import load_dotenv
+
+from app.utils.redis_pool import cached_client, delete_many, mget_many, redis_client, set_many
+
+load_dotenv()
+
+# Число конфигураций по БД (источник истины) и число клиентов, увиденное на VPS по SSH
+CONFIG_COUNT_TTL = 300
+VPS_COUNT_TTL = 60
+# Сколько после CONFIG_COUNT_TTL ещё можно отдавать устаревшее значение, пока идёт пересчёт
+CONFIG_COUNT_STALE_TTL = int(os.getenv("CONFIG_COUNT_STALE_TTL", 300))
+# Агрессивность раннего обновления (XFetch): 1.0 — стандарт, больше — раньше
+CONFIG_COUNT_EARLY_BETA = float(os.getenv("CONFIG_COUNT_EARLY_BETA", 1.0))
+# Блокировка пересчёта одного ключа — не дольше, чем занимает GROUP BY
+CONFIG_COUNT_LOCK_TTL = 10
+
+# Последние известные значения в этом процессе — на случай недоступного Redis
+_last_known = {}
+
+
+def _redis_key_for_config_count(server_id: int) -> str:
+    return f"server:{server_id}:active_config_count"
+
+
+def _redis_key_for_config_refresh(server_id: int) -> str:
+    # "<срок свежести unix>:<время пересчёта, сек>"; пропал — значение устарело
+    return f"server:{server_id}:active_config_count:refresh"
+
+
+def _redis_key_for_config_lock(server_id: int) -> str:
+    return f"server:{server_id}:active_config_count:lock"
+
+
+def _redis_key_for_vps_count(server_id: int) -> str:
+    return f"server:{server_id}:vps_user_count"
+
+
+# Увеличивает счётчик, только если он уже есть: отсутствующий ключ заполнится из БД при чтении
+_INCR_IF_EXISTS_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+_incr_if_exists = redis_client.register_script(_INCR_IF_EXISTS_LUA)
+
+
+def _parse(raw):
+    if raw is None:
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        return None
+
+
+def _needs_refresh(raw_refresh, now: float) -> bool:
+    """
+    Вероятностное раннее обновление (XFetch): чем ближе срок свежести и чем дольше
+    пересчёт, тем вероятнее, что именно этот запрос обновит значение заранее.
+    """
+    if raw_refresh is None:
+        return True
+    try:
+        fresh_until, delta = (float(x) for x in raw_refresh.decode().split(":"))
+    except (ValueError, AttributeError):
+        return True
+    return now - delta * CONFIG_COUNT_EARLY_BETA * math.log(1.0 - random.random()) >= fresh_until
+
+
+def _try_lock(server_ids) -> list:
+    """Берёт блокировки пересчёта; возвращает server_id, за которые отвечает этот запрос."""
+    pipe = redis_client.pipeline(transaction=False)
+    for sid in server_ids:
+        pipe.set(_redis_key_for_config_lock(sid), 1, nx=True, ex=CONFIG_COUNT_LOCK_TTL)
+    return [sid for sid, ok in zip(server_ids, pipe.execute()) if ok]
+
+
+def _recompute(server_ids) -> dict:
+    from app.utils.reconcile import count_by_server  # локальный импорт: reconcile сам пишет счётчики
+
+    started = time.monotonic()
+    counts = count_by_server(server_ids)
+    set_config_counts(counts, compute_time=time.monotonic() - started)
+    return counts
+
+
+def get_config_counts(server_ids) -> dict:
+    """
+    Число конфигураций по серверам: один MGET на весь флот (с включённым кешем
+    на стороне клиента — из памяти процесса, пока ключи не менялись).
+    Пересчёт (один GROUP BY на все нуждающиеся сервера) выполняет только запрос,
+    взявший блокировку ключа; остальные отдают устаревшее значение. Свежие значения
+    иногда обновляются заранее (XFetch), чтобы ключи не истекали одновременно.
+    При недоступном Redis отдаются последние известные значения процесса.
+    Должна вызываться внутри app_context.
+    """
+    from app.utils.reconcile import count_by_server
+
+    server_ids = list(server_ids)
+    if not server_ids:
+        return {}
+    try:
+        raw = mget_many(
+            [_redis_key_for_config_count(sid) for sid in server_ids]
+            + [_redis_key_for_config_refresh(sid) for sid in server_ids],
+            client=cached_client,
+        )
+    except redis.RedisError as e:
+        print(f"[COUNTERS][WARN] redis unavailable, serving last known counts: {e}", flush=True)
+        unknown = [sid for sid in server_ids if sid not in _last_known]
+        counts = {sid: _last_known[sid] for sid in server_ids if sid in _last_known}
+        if unknown:
+            counts.update(count_by_server(unknown))
+            _last_known.update(counts)
+        return counts
+
+    now = time.time()
+    counts, missing, stale = {}, [], []
+    for sid, value, refresh in zip(server_ids, raw[:len(server_ids)], raw[len(server_ids):]):
+        value = _parse(value)
+        if value is None:
+            missing.append(sid)
+            continue
+        counts[sid] = value
+        if _needs_refresh(refresh, now):
+            stale.append(sid)
+
+    try:
+        owned = _try_lock(missing + stale)
+    except redis.RedisError:
+        owned = missing + stale
+    # Значения нет совсем и пересчитывает другой запрос — берём последнее известное,
+    # а если его нет, считаем сами (такое бывает только на холодном старте)
+    for sid in missing:
+        if sid not in owned and sid in _last_known:
+            counts[sid] = _last_known[sid]
+    to_compute = [sid for sid in server_ids if sid in owned or (sid in missing and sid not in counts)]
+
+    if to_compute:
+        try:
+            counts.update(_recompute(to_compute))
+        finally:
+            try:
+                redis_client.delete(*[_redis_key_for_config_lock(sid) for sid in owned])
+            except redis.RedisError:
+                pass
+    _last_known.update(counts)
+    return counts
+
+
+def get_config_count(server_id: int) -> int:
+    return get_config_counts([server_id])[server_id]
+
+
+def set_config_counts(counts: dict, compute_time: float = 0.0):
+    """
+    Записывает точные значения (после пересчёта из БД). Сам счётчик живёт дольше
+    срока свежести — на время пересчёта остальные запросы получают устаревшее значение.
+    """
+    if not counts:
+        return
+    _last_known.update(counts)
+    fresh_until = time.time() + CONFIG_COUNT_TTL
+    items = []
+    for sid, cnt in counts.items():
+        items.append((_redis_key_for_config_count(sid), cnt, CONFIG_COUNT_TTL + CONFIG_COUNT_STALE_TTL))
+        items.append((_redis_key_for_config_refresh(sid), f"{fresh_until}:{compute_time}", CONFIG_COUNT_TTL))
+    try:
+        set_many(items, client=redis_client)
+    except redis.RedisError as e:
+        print(f"[COUNTERS][WARN] counts not saved: {e}", flush=True)
+
+
+def incr_config_count(server_id: int, delta: int = 1):
+    """Write-through после выдачи/удаления конфигурации."""
+    if server_id in _last_known:
+        _last_known[server_id] += delta
+    try:
+        _incr_if_exists(keys=[_redis_key_for_config_count(server_id)], args=[delta])
+    except redis.RedisError as e:
+        print(f"[COUNTERS][WARN] server_id={server_id} not incremented: {e}", flush=True)
+
+
+def invalidate_config_counts(server_ids):
+    server_ids = list(server_ids)
+    if server_ids:
+        delete_many([_redis_key_for_config_count(sid) for sid in server_ids]
+                    + [_redis_key_for_config_refresh(sid) for sid in server_ids], client=redis_client)
+
+
+def get_vps_counts(server_ids) -> dict:
+    """Число клиентов на VPS по последнему опросу; None — опроса ещё не было."""
+    server_ids = list(server_ids)
+    if not server_ids:
+        return {}
+    raw = mget_many([_redis_key_for_vps_count(sid) for sid in server_ids], client=cached_client)
+    return {sid: _parse(value) for sid, value in zip(server_ids, raw)}
+
+
+def set_vps_counts(counts: dict, ttl: int = VPS_COUNT_TTL):
+    if not counts:
+        return
+    set_many([(_redis_key_for_vps_count(sid), cnt, ttl) for sid, cnt in counts.items()], client=redis_client)
+
+
+def refresh_vps_counts(servers) -> dict:
+    """
+    Опрашивает число клиентов на VPS (параллельно, servers — ServerRef) и пишет счётчики
+    одним pipeline. Недоступный или ответивший ошибкой сервер не записывается:
+    у него остаётся последнее известное значение, а не 0.
+    """
+    from app.utils.fleet import fan_out
+    from app.utils.vps_data import count_users_on_port
+
+    counts, errors = fan_out(
+        servers, lambda srv: count_users_on_port(srv.host, srv.port, srv.ssh_username, srv.ssh_password,
+                                                 server_id=srv.id)
+    )
+    for sid, e in errors.items():
+        print(f"[USERS_COUNT][SKIP] server_id={sid}: {e}", flush=True)
+    previous = get_vps_counts(counts)
+    set_vps_counts(counts)
+    return {
+        "servers": len(servers),
+        "changed": sum(1 for sid, cnt in counts.items() if previous.get(sid) != cnt),
+        "failed": len(errors),
+    }
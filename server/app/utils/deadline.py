@@ -0,0 +1,62 @@
+# app/utils/deadline.py
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Бюджет HTTP-запроса, который уходит дальше как дедлайн gRPC
+HTTP_REQUEST_BUDGET = float(os.getenv("HTTP_REQUEST_BUDGET", 30))
+# Верхние границы для SSH, если дедлайна нет (фоновые задачи) или он дальше
+SSH_CONNECT_TIMEOUT = float(os.getenv("SSH_CONNECT_TIMEOUT", 10))
+SSH_COMMAND_TIMEOUT = float(os.getenv("SSH_COMMAND_TIMEOUT", 60))
+
+# Абсолютный дедлайн текущего запроса по time.monotonic(); None — без ограничения
+_deadline = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """
+    Ограничивает время работы внутри блока. Вложенный дедлайн не может быть позже внешнего.
+    seconds=None — без нового ограничения (действует внешний, если есть).
+    """
+    if seconds is None:
+        yield
+        return
+    current = _deadline.get()
+    new = time.monotonic() + max(0.0, seconds)
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Сколько секунд осталось до дедлайна; None — дедлайна нет."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check(what: str = ""):
+    """Прерывает работу, если дедлайн уже истёк, — не начинаем шаг, который не успеет закончиться."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Дедлайн истёк{': ' + what if what else ''}")
+
+
+def timeout_for(cap: float) -> float:
+    """Таймаут для одной блокирующей операции: не больше cap и не дальше дедлайна."""
+    check()
+    left = remaining()
+    return cap if left is None else min(cap, left)
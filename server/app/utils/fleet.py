@@ -0,0 +1,102 @@
+# app/utils/fleet.py
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from app.utils.deadline import remaining
+
+load_dotenv()
+
+# Сколько серверов опрашиваем одновременно и сколько ждём каждый
+FLEET_MAX_WORKERS    = int(os.getenv("FLEET_MAX_WORKERS", 16))
+FLEET_SERVER_TIMEOUT = float(os.getenv("FLEET_SERVER_TIMEOUT", 20))
+
+
+class FanOutTimeout(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class ServerRef:
+    """Снимок полей Server — ORM-объекты нельзя передавать в другие потоки."""
+    id: int
+    country: str
+    host: str
+    port: int
+    ssh_username: str
+    ssh_password: str
+    max_users: int
+    x_ui_port: int
+
+
+def server_ref(srv) -> ServerRef:
+    return ServerRef(
+        id=srv.id,
+        country=srv.country,
+        host=srv.host,
+        port=int(srv.port),
+        ssh_username=srv.ssh_username,
+        ssh_password=srv.ssh_password,
+        max_users=srv.max_users,
+        x_ui_port=srv.x_ui_port,
+    )
+
+
+def fan_out(servers, fn, timeout: float = FLEET_SERVER_TIMEOUT, max_workers: int = FLEET_MAX_WORKERS):
+    """
+    Вызывает fn(server) для всех серверов параллельно в ограниченном пуле потоков.
+    Таймаут отсчитывается для каждого сервера с момента начала его обработки.
+    Возвращает (results, errors): словари server.id -> результат / исключение.
+    Сервера, не уложившиеся в таймаут, попадают в errors как FanOutTimeout.
+    """
+    servers = list(servers)
+    results, errors = {}, {}
+    if not servers:
+        return results, errors
+
+    started = {}
+
+    def run(srv):
+        started[srv.id] = time.monotonic()
+        return fn(srv)
+
+    # Не ждём серверы дольше дедлайна запроса
+    left = remaining()
+    if left is not None:
+        timeout = max(0.0, min(timeout, left))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(servers))))
+    try:
+        # Каждой задаче — своя копия контекста: дедлайн и трассировка доходят до потоков
+        futures = {executor.submit(contextvars.copy_context().run, run, srv): srv for srv in servers}
+        pending = set(futures)
+        while pending:
+            # Просыпаемся не позже, чем истечёт таймаут самого «старого» запущенного сервера
+            now = time.monotonic()
+            running = [started[futures[f].id] for f in pending if futures[f].id in started]
+            wake = max(0.0, min(t0 + timeout for t0 in running) - now) if running else timeout
+            done, pending = wait(pending, timeout=wake, return_when=FIRST_COMPLETED)
+
+            for f in done:
+                srv = futures[f]
+                try:
+                    results[srv.id] = f.result()
+                except Exception as e:
+                    errors[srv.id] = e
+
+            now = time.monotonic()
+            for f in list(pending):
+                srv = futures[f]
+                t0 = started.get(srv.id)
+                if t0 is not None and now - t0 >= timeout:
+                    # Поток не прервать — просто перестаём ждать результат
+                    errors[srv.id] = FanOutTimeout(f"{srv.host}:{srv.port} не ответил за {timeout} сек")
+                    pending.discard(f)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, errors
@@ -0,0 +1,111 @@
+# app/utils/grpc_clients.py
+import atexit
+import itertools
+import os
+import threading
+
+import grpc
+from dotenv import load_dotenv
+
+from app.generated_grpc import config_service_pb2_grpc, server_service_pb2_grpc
+
+load_dotenv()
+
+# Адреса сервисов: хост (или несколько через запятую, можно с портом — host:port)
+GRPC_CONFIG_HOST = os.getenv("GRPC_CONFIG_HOST", "grpc_config")
+GRPC_CONFIG_PORT = int(os.getenv("GRPC_CONFIG_PORT", 50052))
+GRPC_SERVER_HOST = os.getenv("GRPC_SERVER_HOST", "grpc_server")
+GRPC_SERVER_PORT = int(os.getenv("GRPC_SERVER_PORT", 50051))
+
+# Балансировка внутри одного DNS-имени (все A-записи): pick_first | round_robin
+GRPC_LB_POLICY = os.getenv("GRPC_LB_POLICY", "round_robin")
+GRPC_KEEPALIVE_TIME_MS    = int(os.getenv("GRPC_KEEPALIVE_TIME_MS", 30000))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.getenv("GRPC_KEEPALIVE_TIMEOUT_MS", 10000))
+
+_CHANNEL_OPTIONS = [
+    ("grpc.lb_policy_name", GRPC_LB_POLICY),
+    ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_TIME_MS),
+    ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+]
+
+
+def _targets(hosts: str, default_port: int) -> list:
+    targets = []
+    for host in hosts.split(","):
+        host = host.strip()
+        if not host:
+            continue
+        if ":" not in host:
+            host = f"{host}:{default_port}"
+        targets.append(f"dns:///{host}")
+    return targets
+
+
+class GrpcClientManager:
+    """
+    Долгоживущие gRPC-каналы на процесс: HTTP/2-соединение устанавливается один раз,
+    а не на каждый HTTP-запрос. Если у сервиса несколько адресов, stub'ы выдаются
+    по кругу (round-robin на стороне клиента).
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._stubs = {}     # service -> itertools.cycle(stub)
+        self._channels = []
+
+    def _check_pid(self):
+        # Каналы родителя после fork (gunicorn/celery prefork) использовать нельзя — создаём свои
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _stub(self, service: str, targets: list, stub_cls):
+        self._check_pid()
+        stubs = self._stubs.get(service)
+        if stubs is None:
+            with self._lock:
+                stubs = self._stubs.get(service)
+                if stubs is None:
+                    created = []
+                    for target in targets:
+                        channel = grpc.insecure_channel(target, options=_CHANNEL_OPTIONS)
+                        self._channels.append(channel)
+                        created.append(stub_cls(channel))
+                    stubs = itertools.cycle(created)
+                    self._stubs[service] = stubs
+        with self._lock:
+            return next(stubs)
+
+    def config_stub(self) -> config_service_pb2_grpc.ConfigurationServiceStub:
+        return self._stub("config", _targets(GRPC_CONFIG_HOST, GRPC_CONFIG_PORT),
+                          config_service_pb2_grpc.ConfigurationServiceStub)
+
+    def server_stub(self) -> server_service_pb2_grpc.ServerServiceStub:
+        return self._stub("server", _targets(GRPC_SERVER_HOST, GRPC_SERVER_PORT),
+                          server_service_pb2_grpc.ServerServiceStub)
+
+    def close_all(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            for channel in self._channels:
+                channel.close()
+            self._stubs.clear()
+            self._channels.clear()
+
+
+grpc_clients = GrpcClientManager()
+atexit.register(grpc_clients.close_all)
+
+
+def config_stub() -> config_service_pb2_grpc.ConfigurationServiceStub:
+    return grpc_clients.config_stub()
+
+
+def server_stub() -> server_service_pb2_grpc.ServerServiceStub:
+    return grpc_clients.server_stub()
@@ -4,6 +4,7 @@ import os
 from dotenv import load_dotenv
 from app.models.server import Server
 from app.extensions import db
+from app.utils.placement import invalidate_placement_index
 
 # ─── ЗАГРУЖАЕМ ПЕРЕМЕННЫЕ ИЗ .env ──────────────────────────────────────────────
 load_dotenv()  # Если .env находится в корне проекта, он найдёт его автоматически
@@ -65,6 +66,7 @@ def insert_servers():
         db.session.add(new_server)
         try:
             db.session.commit()
+            invalidate_placement_index(country)
             print(f"[insert_servers] Сервер #{i} ({host}:{ssh_port}) добавлен успешно.")
         except Exception as e:
             db.session.rollback()
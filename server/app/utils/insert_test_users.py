@@ -3,10 +3,11 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import create_app, db
+from app import create_app, db, init_schema
 from app.models.user import User
 
 app = create_app()
+init_schema(app)
 
 with app.app_context():
     # Создание пользователей
@@ -0,0 +1,181 @@
+# app/utils/metrics.py
+import os
+import socket
+import threading
+
+from dotenv import load_dotenv
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, push_to_gateway
+from prometheus_client.core import GaugeMetricFamily
+
+load_dotenv()
+
+# Процессы без HTTP-эндпоинта (воркеры Celery) отправляют метрики в pushgateway; пусто — не отправлять
+PUSHGATEWAY_URL      = os.getenv("PUSHGATEWAY_URL", "pushgateway:9091")
+PUSHGATEWAY_INTERVAL = float(os.getenv("PUSHGATEWAY_INTERVAL", 15))
+
+# Синхронизация с VPS: сработал ли отпечаток x-ui.db (hit — данные не менялись, сервер пропущен)
+SYNC_FINGERPRINT_CHECKS = Counter(
+    "vps_sync_fingerprint_checks_total",
+    "Проверки отпечатка x-ui.db при синхронизации",
+    ["result"],  # hit | miss
+)
+SYNC_SERVERS_SKIPPED = Counter(
+    "vps_sync_servers_skipped_total",
+    "Сервера, для которых скачивание/разбор/сверка пропущены из-за неизменного отпечатка",
+    ["mode"],  # fleet | user | deferred (не опрашивался — давно не менялся)
+)
+
+# SSH/VPS (app/utils/vps_data.py, app/utils/ssh_pool.py); server_id — id сервера в БД
+# (не host:port: метка не меняется при смене адреса и не плодит серии)
+SSH_LATENCY = Histogram(
+    "vps_ssh_duration_seconds",
+    "Длительность этапов операции с VPS",
+    ["operation", "phase", "server_id"],  # phase: connect | exec | parse
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SSH_ERRORS = Counter(
+    "vps_ssh_errors_total",
+    "Ошибки операций с VPS по классу исключения",
+    ["operation", "server_id", "error"],
+)
+SSH_BYTES = Counter(
+    "vps_ssh_bytes_total",
+    "Байты команд и ответов SSH",
+    ["operation", "server_id", "direction"],  # sent | received
+)
+SSH_RETRIES = Counter(
+    "vps_ssh_retries_total",
+    "Повторы операций с VPS",
+    ["operation", "reason"],  # reconnect (соединение пула умерло) | task_retry (повтор задачи Celery)
+)
+SSH_POOL_CONNECTIONS = Gauge(
+    "vps_ssh_pool_connections",
+    "Открытые соединения в пуле SSH процесса",
+)
+SSH_POOL_CHANNELS_IN_USE = Gauge(
+    "vps_ssh_pool_channels_in_use",
+    "Занятые каналы пула SSH процесса",
+)
+
+# Периодические задачи Celery: запуски, длительность и выбранный интервал
+PERIODIC_RUNS = Counter(
+    "periodic_task_runs_total",
+    "Срабатывания периодических задач",
+    ["task", "result"],  # ok | error | skipped_running | skipped_not_due
+)
+PERIODIC_RUN_DURATION = Histogram(
+    "periodic_task_duration_seconds",
+    "Длительность прогона периодической задачи",
+    ["task"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+PERIODIC_INTERVAL = Gauge(
+    "periodic_task_interval_seconds",
+    "Интервал до следующего запуска периодической задачи",
+    ["task"],
+)
+
+# Отправка логов в Logstash (app/logging_config.py)
+LOGSTASH_RECORDS = Counter(
+    "logstash_records_total",
+    "Записи логов, отправленные в Logstash или выброшенные из переполненного буфера",
+    ["result"],  # sent | dropped
+)
+LOGSTASH_RECONNECTS = Counter(
+    "logstash_reconnects_total",
+    "Неудачные отправки пачек в Logstash (после каждой — переподключение с паузой)",
+)
+
+# Предохранители VPS: переходы в этом процессе и общее состояние из Redis (читается при сборе метрик)
+CIRCUIT_TRANSITIONS = Counter(
+    "vps_circuit_transitions_total",
+    "Переходы предохранителя VPS",
+    ["state"],  # open | closed
+)
+
+_CIRCUIT_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitStateCollector:
+    def _families(self):
+        return (
+            GaugeMetricFamily(
+                "vps_circuit_state", "Состояние предохранителя VPS: 0 closed, 1 half_open, 2 open",
+                labels=["host", "port"],
+            ),
+            GaugeMetricFamily(
+                "vps_circuit_failures", "Подряд идущие ошибки SSH к VPS", labels=["host", "port"],
+            ),
+        )
+
+    def describe(self):
+        # Без describe() REGISTRY.register вызвал бы collect() — с походом в Redis при импорте
+        return self._families()
+
+    def collect(self):
+        from app.utils.circuit_breaker import breaker_states  # локальный импорт: модуль сам пишет метрики
+
+        state, failures = self._families()
+        try:
+            states = breaker_states()
+        except Exception as e:
+            print(f"[METRICS][WARN] breaker states unavailable: {e}", flush=True)
+            states = {}
+        for (host, port), info in states.items():
+            state.add_metric([host, port], _CIRCUIT_STATE_VALUES.get(info["state"], 0))
+            failures.add_metric([host, port], info["failures"])
+        yield state
+        yield failures
+
+
+REGISTRY.register(CircuitStateCollector())
+
+
+class MetricsPusher:
+    """
+    Периодически отправляет REGISTRY процесса в pushgateway. Группа instance стабильна
+    для процесса (хост + номер воркера), поэтому перезапущенный воркер перезаписывает
+    свои ряды, а не плодит новые.
+    """
+
+    def __init__(self, job: str, instance: str, url: str = PUSHGATEWAY_URL,
+                 interval: float = PUSHGATEWAY_INTERVAL):
+        self.job = job
+        self.grouping_key = {"instance": f"{socket.gethostname()}-{instance}"}
+        self.url = url
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._failing = False
+
+    def push(self):
+        try:
+            push_to_gateway(self.url, job=self.job, registry=REGISTRY, grouping_key=self.grouping_key)
+        except Exception as e:
+            # Сообщаем только о смене состояния — иначе недоступный pushgateway засыплет лог
+            if not self._failing:
+                print(f"[METRICS][WARN] pushgateway {self.url} unavailable: {e}", flush=True)
+            self._failing = True
+            return
+        if self._failing:
+            print(f"[METRICS] pushgateway {self.url} available again", flush=True)
+        self._failing = False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.push()
+
+    def start(self):
+        if not self.url or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="metrics-pusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Последняя отправка — чтобы не потерять приращения с предыдущего интервала
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.push()
@@ -0,0 +1,195 @@
+# app/utils/periodic.py
+import functools
+import os
+import threading
+import time
+import uuid
+
+import redis
+from dotenv import load_dotenv
+
+from app.utils.metrics import PERIODIC_INTERVAL, PERIODIC_RUN_DURATION, PERIODIC_RUNS
+from app.utils.redis_pool import redis_client
+
+load_dotenv()
+
+# Как часто beat «стучится» в периодические задачи; реальный запуск — когда подошёл срок
+PERIODIC_TICK = float(os.getenv("PERIODIC_TICK", 15))
+# Аренда продлевается, пока задача работает; если воркер умер — освобождается сама через TTL
+PERIODIC_LEASE_TTL = int(os.getenv("PERIODIC_LEASE_TTL", 120))
+# Задача занимает не больше 1/PERIODIC_DUTY_FACTOR времени: интервал >= factor * длительность
+PERIODIC_DUTY_FACTOR = float(os.getenv("PERIODIC_DUTY_FACTOR", 3))
+# Сглаживание длительности и доли изменений между запусками (EWMA)
+PERIODIC_EWMA_ALPHA = 0.5
+
+# Удаляет/продлевает аренду, только если она всё ещё наша
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_release_script = redis_client.register_script(_RELEASE_LUA)
+_renew_script = redis_client.register_script(_RENEW_LUA)
+
+
+def _redis_key_for_lease(name: str) -> str:
+    return f"periodic:{name}:lease"
+
+
+def _redis_key_for_state(name: str) -> str:
+    return f"periodic:{name}:state"
+
+
+class Lease:
+    """
+    Аренда в Redis (SET NX EX с уникальным токеном): пока она жива, второй экземпляр
+    задачи не стартует. Во время работы аренда продлевается фоновым потоком.
+    """
+
+    def __init__(self, name: str, ttl: int = PERIODIC_LEASE_TTL):
+        self.key = _redis_key_for_lease(name)
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def acquire(self) -> bool:
+        if not redis_client.set(self.key, self.token, nx=True, ex=self.ttl):
+            return False
+        self._renewer = threading.Thread(target=self._renew_loop, daemon=True)
+        self._renewer.start()
+        return True
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                if not _renew_script(keys=[self.key], args=[self.token, self.ttl]):
+                    print(f"[PERIODIC][WARN] lease {self.key} lost", flush=True)
+                    return
+            except redis.RedisError as e:
+                print(f"[PERIODIC][WARN] lease {self.key} not renewed: {e}", flush=True)
+
+    def release(self):
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join()
+        try:
+            _release_script(keys=[self.key], args=[self.token])
+        except redis.RedisError as e:
+            print(f"[PERIODIC][WARN] lease {self.key} not released: {e}", flush=True)
+
+
+def _load_state(name: str) -> dict:
+    raw = redis_client.hgetall(_redis_key_for_state(name))
+    return {k.decode(): float(v) for k, v in raw.items()}
+
+
+def next_interval(state: dict, min_interval: float, max_interval: float) -> float:
+    """
+    Интервал до следующего запуска: чем больше доля изменений за последние запуски,
+    тем ближе к min_interval, простой флот опрашивается всё реже — до max_interval.
+    Долгий прогон (большой флот, медленные VPS) раздвигает интервал, чтобы не работать впритык.
+    """
+    activity = min(max(state.get("activity", 1.0), 0.0), 1.0)
+    interval = max_interval - (max_interval - min_interval) * activity
+    interval = max(interval, PERIODIC_DUTY_FACTOR * state.get("duration", 0.0))
+    return min(max(interval, min_interval), max_interval)
+
+
+def _save_state(name: str, state: dict, duration: float, activity, min_interval, max_interval) -> float:
+    alpha = PERIODIC_EWMA_ALPHA
+    if "duration" in state:
+        state["duration"] = alpha * duration + (1 - alpha) * state["duration"]
+    else:
+        state["duration"] = duration
+    if activity is None:
+        # Ошибка: данных об изменениях нет — повторим через минимальный интервал
+        interval = min_interval
+    else:
+        state["activity"] = alpha * activity + (1 - alpha) * state.get("activity", activity)
+        interval = next_interval(state, min_interval, max_interval)
+    state["interval"] = interval
+    state["next_due"] = time.time() + interval
+    try:
+        redis_client.hset(_redis_key_for_state(name), mapping=state)
+    except redis.RedisError as e:
+        print(f"[PERIODIC][WARN] {name}: state not saved: {e}", flush=True)
+    return interval
+
+
+def periodic(name: str, min_interval: float, max_interval: float, activity=None):
+    """
+    Декоратор периодической задачи. beat вызывает её каждые PERIODIC_TICK секунд, но
+    выполняется она, только если подошёл срок и не работает другой экземпляр.
+
+    activity(result) -> доля [0, 1] изменившегося за прогон (например, серверов с новыми
+    данными); по ней и по длительности прогона выбирается следующий интервал.
+    Вызов с аргументами (точечный запуск) не ждёт срока и не меняет расписание, но берёт
+    ту же аренду: пока работает любой экземпляр задачи, второй не стартует.
+    При недоступном Redis задача выполняется без аренды — пропуск хуже двойного запуска.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            lease = Lease(name)
+            try:
+                acquired = lease.acquire()
+            except redis.RedisError as e:
+                print(f"[PERIODIC][WARN] {name}: running without lease: {e}", flush=True)
+                return fn(*args, **kwargs)
+            if not acquired:
+                PERIODIC_RUNS.labels(task=name, result="skipped_running").inc()
+                return None
+
+            try:
+                if args or kwargs:
+                    return fn(*args, **kwargs)
+
+                try:
+                    state = _load_state(name)
+                except redis.RedisError as e:
+                    print(f"[PERIODIC][WARN] {name}: state unavailable: {e}", flush=True)
+                    state = {}
+
+                if time.time() < state.get("next_due", 0):
+                    PERIODIC_RUNS.labels(task=name, result="skipped_not_due").inc()
+                    return None
+
+                started = time.monotonic()
+                try:
+                    result = fn()
+                except Exception:
+                    duration = time.monotonic() - started
+                    PERIODIC_RUNS.labels(task=name, result="error").inc()
+                    PERIODIC_RUN_DURATION.labels(task=name).observe(duration)
+                    _save_state(name, state, duration, None, min_interval, max_interval)
+                    raise
+
+                duration = time.monotonic() - started
+                share = activity(result) if activity is not None else 1.0
+                PERIODIC_RUNS.labels(task=name, result="ok").inc()
+                PERIODIC_RUN_DURATION.labels(task=name).observe(duration)
+                interval = _save_state(name, state, duration, share, min_interval, max_interval)
+                PERIODIC_INTERVAL.labels(task=name).set(interval)
+                print(f"[PERIODIC] {name}: {duration:.1f}s, activity={share:.2f}, next in {interval:.0f}s",
+                      flush=True)
+                return result
+            finally:
+                lease.release()
+
+        return wrapper
+
+    return decorator
+
+
+def changed_share(changed: int, total: int) -> float:
+    return min(changed / total, 1.0) if total else 0.0
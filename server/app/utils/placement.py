@@ -0,0 +1,174 @@
+# app/utils/placement.py
+import os
+import time
+
+from sqlalchemy import func
+
+from app.models.client_slot import ClientSlot
+from app.models.server import Server
+from app.utils.circuit_breaker import open_hosts
+from app.utils.redis_pool import redis_client
+from app.utils.reconcile import count_by_server
+
+# Сколько ждать, пока другой процесс перестраивает индекс страны
+REBUILD_WAIT_SECONDS = 2.0
+# Индекс живёт ограниченное время и затем перестраивается из БД: расхождения
+# (падение процесса между reserve и release, ручные правки VPS) не накапливаются
+PLACEMENT_INDEX_TTL = int(os.getenv("PLACEMENT_INDEX_TTL", 600))
+
+
+def _redis_key_for_country(country: str) -> str:
+    return f"placement:free:{country}"
+
+
+def _redis_key_for_rebuild_lock(country: str) -> str:
+    return f"placement:lock:{country}"
+
+
+def _redis_key_for_generation(country: str) -> str:
+    return f"placement:gen:{country}"
+
+
+# Атомарно выбирает сервер с наибольшим числом свободных слотов (кроме исключённых)
+# и занимает в нём слот. -1 — индекса страны ещё нет, false — свободных серверов нет.
+_RESERVE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return -1
+end
+local candidates = redis.call('ZREVRANGEBYSCORE', KEYS[1], '+inf', 1, 'LIMIT', 0, #ARGV + 1)
+for _, member in ipairs(candidates) do
+  local excluded = false
+  for i = 1, #ARGV do
+    if ARGV[i] == member then
+      excluded = true
+      break
+    end
+  end
+  if not excluded then
+    redis.call('ZINCRBY', KEYS[1], -1, member)
+    return member
+  end
+end
+return false
+"""
+_reserve_script = redis_client.register_script(_RESERVE_LUA)
+
+
+# Записывает построенный индекс, только если его ещё нет и за время чтения БД его не сбросили
+# (поколение не изменилось): иначе устаревший снимок затёр бы резервирования других процессов.
+# KEYS: индекс, поколение; ARGV: поколение на момент чтения, TTL, затем пары score/member.
+_REBUILD_LUA = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] or redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+for i = 3, #ARGV, 2 do
+  redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+_rebuild_script = redis_client.register_script(_REBUILD_LUA)
+
+
+def _free_slots(country: str) -> dict:
+    """server_id -> свободные слоты по БД: max_users - конфигурации - готовые клиенты пула."""
+    servers = Server.query.filter_by(country=country).all()
+    if not servers:
+        return {}
+    counts = count_by_server(s.id for s in servers)
+    # Готовые клиенты пула тоже занимают место на VPS
+    pooled = dict(
+        ClientSlot.query.with_entities(ClientSlot.server_id, func.count())
+        .filter(ClientSlot.server_id.in_([s.id for s in servers]), ClientSlot.status == 'ready')
+        .group_by(ClientSlot.server_id).all()
+    )
+    return {s.id: s.max_users - counts.get(s.id, 0) - pooled.get(s.id, 0) for s in servers}
+
+
+def rebuild_placement_index(country: str) -> bool:
+    """
+    Строит индекс свободных слотов страны из БД. Вызывается, только когда индекса нет, —
+    дальше он поддерживается инкрементально до истечения PLACEMENT_INDEX_TTL.
+    Возвращает False, если серверов в стране нет. Должна вызываться внутри app_context.
+    """
+    # Поколение читается до БД: сброс во время чтения отменит запись снимка
+    generation = redis_client.get(_redis_key_for_generation(country)) or b"0"
+    free = _free_slots(country)
+    if not free:
+        return False
+    args = [generation, PLACEMENT_INDEX_TTL]
+    for sid, slots in free.items():
+        args += [slots, str(sid)]
+    _rebuild_script(keys=[_redis_key_for_country(country), _redis_key_for_generation(country)], args=args)
+    return True
+
+
+def invalidate_placement_index(country: str):
+    """Сбрасывает индекс страны (добавили/удалили сервер, поменяли max_users) — он перестроится при следующем размещении."""
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.incr(_redis_key_for_generation(country))
+    pipe.delete(_redis_key_for_country(country))
+    pipe.execute()
+
+
+def reserve_server(country: str, exclude=()):
+    """
+    Атомарно занимает слот на наименее загруженном сервере страны. O(log n) на стороне Redis,
+    два одновременных запроса не могут занять один и тот же последний слот.
+    Возвращает server_id или None, если свободных серверов нет.
+    Слот нужно вернуть через release_server, если выдать конфигурацию не удалось.
+    """
+    key = _redis_key_for_country(country)
+    excluded = [str(sid) for sid in exclude]
+    deadline = time.monotonic() + REBUILD_WAIT_SECONDS
+    while True:
+        result = _reserve_script(keys=[key], args=excluded)
+        if result != -1:
+            return int(result) if result else None
+
+        # Индекса нет — строит его тот, кто взял блокировку, остальные ждут
+        lock_key = _redis_key_for_rebuild_lock(country)
+        if redis_client.set(lock_key, 1, nx=True, ex=30):
+            try:
+                if not rebuild_placement_index(country):
+                    return None
+            finally:
+                redis_client.delete(lock_key)
+        elif time.monotonic() > deadline:
+            return None
+        else:
+            time.sleep(0.05)
+
+
+def unhealthy_servers(country: str) -> set:
+    """server_id страны с открытым предохранителем — в них размещать не стоит. Должна вызываться внутри app_context."""
+    rows = Server.query.with_entities(Server.id, Server.host, Server.port).filter_by(country=country).all()
+    down = open_hosts((host, int(port)) for _, host, port in rows)
+    return {sid for sid, host, port in rows if (host, int(port)) in down}
+
+
+def release_server(country: str, server_id: int, count: int = 1):
+    """Возвращает слоты (неудачное создание конфигурации). Несуществующий в индексе сервер не добавляется."""
+    redis_client.zadd(_redis_key_for_country(country), {str(server_id): count}, xx=True, incr=True)
+
+
+def drop_server(country: str, server_id: int):
+    redis_client.zrem(_redis_key_for_country(country), str(server_id))
+
+
+def adjust_free_slots(deltas: dict):
+    """
+    Сдвигает число свободных слотов серверов (server_id -> +освободилось / -занято),
+    например после синхронизации с VPS. Должна вызываться внутри app_context.
+    """
+    deltas = {sid: d for sid, d in deltas.items() if d}
+    if not deltas:
+        return
+    countries = dict(
+        Server.query.with_entities(Server.id, Server.country).filter(Server.id.in_(list(deltas))).all()
+    )
+    pipe = redis_client.pipeline(transaction=False)
+    for sid, delta in deltas.items():
+        if sid in countries:
+            pipe.zadd(_redis_key_for_country(countries[sid]), {str(sid): delta}, xx=True, incr=True)
+    pipe.execute()
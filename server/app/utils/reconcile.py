@@ -0,0 +1,186 @@
+# app/utils/reconcile.py
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import redis
+import sqlalchemy as sa
+from dateutil.relativedelta import relativedelta
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models.client_slot import ClientSlot
+from app.models.user_configuration import UserConfiguration
+from app.utils.counters import set_config_counts
+
+# Параметров в одном запросе не больше лимита драйвера: классический SQLite — 999
+MAX_BIND_PARAMS = {"sqlite": 999, "postgresql": 65535}
+# Строк в одном INSERT ... VALUES — даже если лимит параметров позволяет больше
+UPSERT_MAX_ROWS = 1000
+
+
+@dataclass
+class ReconcileResult:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    counts: dict = field(default_factory=dict)  # server_id -> актуальное число конфигураций
+
+
+def _row_from_entry(entry: dict, user_id: int) -> dict:
+    exp_date = datetime.fromtimestamp(entry['expiryTime'] / 1000, tz=timezone.utc)
+    months = entry.get('months')
+    return {
+        "user_id":         user_id,
+        "server_id":       entry['server_id'],
+        "client_uuid":     entry['id'],
+        "config_link":     entry.get('link'),
+        "expiration_date": exp_date,
+        "months":          months,
+        # bulk INSERT обходит UserConfiguration.__init__, поэтому created_at считаем сами
+        "created_at":      exp_date - relativedelta(months=months) if months else None,
+    }
+
+
+def _dialect() -> str:
+    return db.session.get_bind().dialect.name
+
+
+def _chunk_size(dialect: str, params_per_row: int, max_rows: int = UPSERT_MAX_ROWS) -> int:
+    return max(1, min(max_rows, MAX_BIND_PARAMS.get(dialect, 999) // params_per_row))
+
+
+def _insert_for_dialect(dialect: str):
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"Bulk upsert не поддерживается для диалекта {dialect}")
+
+
+def _upsert(rows: list):
+    if not rows:
+        return
+    dialect = _dialect()
+    insert = _insert_for_dialect(dialect)
+    table = UserConfiguration.__table__
+    # Каждая строка — len(rows[0]) параметров (7 колонок): на SQLite это 142 строки на запрос
+    chunk = _chunk_size(dialect, len(rows[0]))
+    for i in range(0, len(rows), chunk):
+        stmt = insert(table).values(rows[i:i + chunk])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.client_uuid],
+            set_={
+                "config_link":     stmt.excluded.config_link,
+                "expiration_date": stmt.excluded.expiration_date,
+                "months":          stmt.excluded.months,
+            },
+        )
+        db.session.execute(stmt)
+
+
+def _delete(client_uuids: list):
+    column = UserConfiguration.__table__.c.client_uuid
+    dialect = _dialect()
+    if dialect == "postgresql":
+        # Один параметр-массив вместо IN (...) с тысячами плейсхолдеров
+        condition = column == sa.any_(sa.bindparam("uuids", client_uuids, type_=postgresql.ARRAY(sa.String)))
+        db.session.execute(sa.delete(UserConfiguration.__table__).where(condition))
+        return
+    chunk = _chunk_size(dialect, 1, max_rows=MAX_BIND_PARAMS.get(dialect, 999))
+    for i in range(0, len(client_uuids), chunk):
+        db.session.execute(sa.delete(UserConfiguration.__table__).where(column.in_(client_uuids[i:i + chunk])))
+
+
+def count_by_server(server_ids) -> dict:
+    """Число конфигураций по серверам одним GROUP BY; для серверов без конфигураций — 0."""
+    server_ids = list(server_ids)
+    if not server_ids:
+        return {}
+    rows = db.session.execute(
+        sa.select(UserConfiguration.server_id, sa.func.count())
+        .where(UserConfiguration.server_id.in_(server_ids))
+        .group_by(UserConfiguration.server_id)
+    ).all()
+    counts = {sid: 0 for sid in server_ids}
+    counts.update({sid: cnt for sid, cnt in rows})
+    return counts
+
+
+def reconcile_configurations(entries, server_ids, user_id: int = None, present_uuids=None) -> ReconcileResult:
+    """
+    Приводит user_configurations к состоянию VPS.
+
+    entries       — записи клиентов с VPS (с заполненными server_id и user_id);
+    server_ids    — сервера, которые ответили: удаляем только их записи;
+    user_id       — если задан, удаления ограничены этим пользователем;
+    present_uuids — все UUID, существующие на ответивших серверах (по умолчанию — UUID из entries).
+
+    Вставки и обновления уходят одним INSERT ... ON CONFLICT (client_uuid) DO UPDATE,
+    удаления — одним DELETE, счётчики серверов пересчитываются одним GROUP BY.
+    """
+    server_ids = set(server_ids)
+    result = ReconcileResult()
+    if not server_ids:
+        return result
+
+    # Индекс локальных записей в зоне синхронизации: client_uuid -> server_id
+    query = sa.select(UserConfiguration.client_uuid, UserConfiguration.server_id) \
+        .where(UserConfiguration.server_id.in_(server_ids))
+    if user_id is not None:
+        query = query.where(UserConfiguration.user_id == user_id)
+    local = dict(db.session.execute(query).all())
+
+    # По client_uuid — один UUID не может дважды попасть в один INSERT ... ON CONFLICT
+    by_uuid = {}
+    for entry in entries:
+        if not entry.get('link') or not entry.get('months') or not entry.get('expiryTime'):
+            print(f"[RECONCILE][SKIP] incomplete VPS entry {entry.get('id')}", flush=True)
+            continue
+        by_uuid[entry['id']] = _row_from_entry(entry, entry.get('user_id', user_id))
+    rows = list(by_uuid.values())
+
+    if present_uuids is None:
+        present_uuids = {e['id'] for e in entries}
+    removed = [cuuid for cuuid in local if cuuid not in present_uuids]
+    if removed and user_id is not None:
+        # Клиент из пула уже выдан, но на VPS ещё без владельца (ждёт активации) — не удаляем
+        pending = {
+            cuuid for (cuuid,) in db.session.execute(
+                sa.select(ClientSlot.client_uuid)
+                .where(ClientSlot.client_uuid.in_(removed), ClientSlot.status == 'claimed')
+            ).all()
+        }
+        removed = [cuuid for cuuid in removed if cuuid not in pending]
+
+    affected = {row["server_id"] for row in rows if row["client_uuid"] not in local}
+    affected.update(local[cuuid] for cuuid in removed)
+
+    try:
+        if rows:
+            _upsert(rows)
+        if removed:
+            _delete(removed)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    added_by_server = Counter(row["server_id"] for row in rows if row["client_uuid"] not in local)
+    removed_by_server = Counter(local[cuuid] for cuuid in removed)
+
+    result.added = sum(added_by_server.values())
+    result.updated = len(rows) - result.added
+    result.removed = len(removed)
+    result.counts = count_by_server(affected)
+
+    # Индекс размещения: удалённые на VPS клиенты освобождают слоты, появившиеся — занимают
+    from app.utils.placement import adjust_free_slots  # локальный импорт: placement сам зависит от reconcile
+    try:
+        adjust_free_slots({sid: removed_by_server[sid] - added_by_server[sid] for sid in affected})
+    except redis.RedisError as e:
+        print(f"[RECONCILE][WARN] placement index not updated: {e}", flush=True)
+
+    set_config_counts(result.counts)
+
+    return result
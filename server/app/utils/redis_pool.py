@@ -0,0 +1,102 @@
+# app/utils/redis_pool.py
+"""
+Общий Redis процесса: один пул соединений с таймаутами и проверкой соединений
+вместо redis.Redis.from_url(...) в каждом модуле. Подключение — при первой команде.
+
+cached_client — тот же Redis с кешем на стороне клиента (RESP3, CLIENT TRACKING):
+повторные чтения горячих ключей (счётчики серверов) отдаются из памяти процесса,
+а сервер присылает инвалидацию, когда ключ меняется или истекает. Включается
+REDIS_CLIENT_CACHE=1 (Redis >= 7.4, redis-py >= 5.1); иначе cached_client — это redis_client.
+Через cached_client только читают: блокировки, аренды и счётчики пишутся в redis_client.
+"""
+import os
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL")
+# Соединений на процесс; когда все заняты, команда ждёт свободное не дольше REDIS_POOL_TIMEOUT
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 2.0))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 2.0))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 1.0))
+# Соединение, простаивавшее дольше, проверяется PING перед использованием
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+REDIS_CLIENT_CACHE = os.getenv("REDIS_CLIENT_CACHE", "0") == "1"
+REDIS_CLIENT_CACHE_SIZE = int(os.getenv("REDIS_CLIENT_CACHE_SIZE", 10000))
+# Команд в одном pipeline: большие пачки делятся, чтобы не раздувать буферы клиента и сервера
+REDIS_PIPELINE_CHUNK = int(os.getenv("REDIS_PIPELINE_CHUNK", 1000))
+
+
+def _make_client(**extra) -> redis.Redis:
+    pool = redis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_keepalive=True,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        **extra,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def _make_cached_client():
+    try:
+        from redis.cache import CacheConfig
+    except ImportError:
+        print("[REDIS][WARN] client-side cache needs redis-py >= 5.1, disabled", flush=True)
+        return None
+    return _make_client(protocol=3, cache_config=CacheConfig(max_size=REDIS_CLIENT_CACHE_SIZE))
+
+
+redis_client = _make_client()
+cached_client = (_make_cached_client() if REDIS_CLIENT_CACHE else None) or redis_client
+
+
+def _flush_client_cache():
+    # Пул после fork открывает новые соединения, а инвалидации по ключам,
+    # закешированным родителем, в дочерний процесс уже не придут
+    cache = getattr(cached_client.connection_pool, "cache", None)
+    if cache is not None:
+        cache.flush()
+
+
+os.register_at_fork(after_in_child=_flush_client_cache)
+
+
+def _chunks(items: list):
+    size = REDIS_PIPELINE_CHUNK
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def mget_many(keys, client=None) -> list:
+    """MGET любого числа ключей пачками по REDIS_PIPELINE_CHUNK; порядок значений — как у keys."""
+    client = client or redis_client
+    keys = list(keys)
+    values = []
+    for chunk in _chunks(keys):
+        values.extend(client.mget(chunk))
+    return values
+
+
+def set_many(items, client=None):
+    """SET пачками в pipeline без транзакции; items — (key, value, ttl), ttl=None — без срока."""
+    client = client or redis_client
+    items = list(items)
+    for chunk in _chunks(items):
+        pipe = client.pipeline(transaction=False)
+        for key, value, ttl in chunk:
+            pipe.set(key, value, ex=ttl)
+        pipe.execute()
+
+
+def delete_many(keys, client=None):
+    client = client or redis_client
+    keys = list(keys)
+    for chunk in _chunks(keys):
+        client.delete(*chunk)
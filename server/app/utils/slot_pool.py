@@ -0,0 +1,187 @@
+# app/utils/slot_pool.py
+import base64
+import os
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from dateutil.relativedelta import relativedelta
+from dotenv import load_dotenv
+
+from app.extensions import db
+from app.models.client_slot import ClientSlot
+from app.models.server import Server
+from app.models.user_configuration import UserConfiguration
+from app.utils.placement import reserve_server, release_server, unhealthy_servers
+from app.utils.redis_pool import redis_client
+from app.utils.vps_data import provision_clients, activate_client
+
+load_dotenv()
+
+# Сколько готовых клиентов держать на страну; 0 — пул выключен
+CLIENT_SLOT_POOL_SIZE = int(os.getenv("CLIENT_SLOT_POOL_SIZE", 0))
+
+
+def _redis_key_for_refill_lock(country: str) -> str:
+    return f"slots:refill:{country}"
+
+
+@dataclass
+class ClaimedSlot:
+    slot_id: int
+    server_id: int
+    config_link: str
+    expiration_date: datetime
+
+
+def _ready_slot_query(country: str):
+    return (
+        ClientSlot.query
+        .join(Server, ClientSlot.server_id == Server.id)
+        .filter(Server.country == country, ClientSlot.status == 'ready')
+        .order_by(ClientSlot.id)
+        # Параллельные запросы берут разные слоты, не дожидаясь друг друга (PostgreSQL)
+        .with_for_update(skip_locked=True, of=ClientSlot)
+    )
+
+
+def claim_client_slot(country: str, user_id: int, months: int):
+    """
+    Выдаёт пользователю готового клиента из пула одной транзакцией БД:
+    слот помечается claimed, создаётся UserConfiguration. Без SSH.
+    Возвращает ClaimedSlot или None, если готовых клиентов в стране нет.
+    Активацию на VPS и пополнение пула нужно поставить в очередь после вызова;
+    если поставить активацию не удалось, выдачу отменяет release_claimed_slot.
+    """
+    if CLIENT_SLOT_POOL_SIZE <= 0:
+        return None
+
+    slot = _ready_slot_query(country).first()
+    if slot is None:
+        return None
+
+    now = datetime.now(timezone.utc)
+    exp = now + relativedelta(months=months)
+    try:
+        slot.status = 'claimed'
+        slot.claimed_at = now
+        db.session.add(UserConfiguration(
+            user_id=user_id,
+            server_id=slot.server_id,
+            client_uuid=slot.client_uuid,
+            config_link=slot.config_link,
+            expiration_date=exp,
+            months=months
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return ClaimedSlot(slot_id=slot.id, server_id=slot.server_id,
+                       config_link=slot.config_link, expiration_date=exp)
+
+
+def release_claimed_slot(slot_id: int):
+    """
+    Отменяет выдачу, активация которой ещё не начиналась: конфигурация удаляется,
+    слот снова свободен. Должна вызываться внутри app_context.
+    """
+    slot = ClientSlot.query.get(slot_id)
+    if slot is None or slot.status != 'claimed':
+        return
+    try:
+        UserConfiguration.query.filter_by(client_uuid=slot.client_uuid).delete()
+        slot.status = 'ready'
+        slot.claimed_at = None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def activate_claimed_slot(slot_id: int):
+    """
+    Фоновая часть выдачи: включает клиента на VPS с владельцем и сроком из UserConfiguration,
+    затем удаляет слот из пула. Если активация не удалась (в т.ч. ClientNotFound), слот
+    остаётся claimed — задача повторит попытку. Должна вызываться внутри app_context.
+    """
+    slot = ClientSlot.query.get(slot_id)
+    if slot is None or slot.status != 'claimed':
+        return
+    cfg = UserConfiguration.query.filter_by(client_uuid=slot.client_uuid).first()
+    srv = slot.server
+    if cfg is not None:
+        activate_client(
+            srv.host, int(srv.port), srv.ssh_username, srv.ssh_password, srv.x_ui_port,
+            slot.client_uuid, slot.email, cfg.user_id, cfg.months, server_id=srv.id
+        )
+    db.session.delete(slot)
+    db.session.commit()
+
+
+def provision_slots(server_id: int, count: int) -> list:
+    """
+    Создаёт на VPS count выключенных клиентов без владельца одним SSH-вызовом
+    и кладёт их в пул. Должна вызываться внутри app_context.
+    """
+    srv = Server.query.get(server_id)
+    flow = os.environ.get("FLOW", "")
+    clients = [
+        dict(
+            email=f"Unknown_Soldier_pool_{uuid.uuid4().hex[:8]}",
+            client_uuid=base64.urlsafe_b64encode(uuid.uuid4().bytes).rstrip(b"=").decode(),
+            flow=flow, user_id=None, months=0, enable=False
+        )
+        for _ in range(count)
+    ]
+    links = provision_clients(srv.host, srv.port, srv.ssh_username, srv.ssh_password, srv.x_ui_port, clients,
+                              server_id=srv.id)
+
+    slots = [
+        ClientSlot(server_id=srv.id, client_uuid=c['client_uuid'], email=c['email'], config_link=link)
+        for c, link in zip(clients, links)
+    ]
+    db.session.add_all(slots)
+    db.session.commit()
+    return slots
+
+
+def refill_country(country: str) -> int:
+    """
+    Доводит число готовых клиентов страны до CLIENT_SLOT_POOL_SIZE. Каждый слот занимает
+    место в индексе размещения, как обычная конфигурация. Слоты одного сервера создаются
+    одной пачкой. Возвращает число созданных слотов.
+    """
+    if CLIENT_SLOT_POOL_SIZE <= 0:
+        return 0
+    lock_key = _redis_key_for_refill_lock(country)
+    if not redis_client.set(lock_key, 1, nx=True, ex=300):
+        return 0  # пополнением уже занят другой воркер
+    created = 0
+    try:
+        ready = (
+            ClientSlot.query
+            .join(Server, ClientSlot.server_id == Server.id)
+            .filter(Server.country == country, ClientSlot.status == 'ready')
+            .count()
+        )
+        reserved = Counter()
+        unhealthy = unhealthy_servers(country)
+        for _ in range(CLIENT_SLOT_POOL_SIZE - ready):
+            server_id = reserve_server(country, exclude=unhealthy)
+            if server_id is None:
+                break
+            reserved[server_id] += 1
+
+        for server_id, count in reserved.items():
+            try:
+                created += len(provision_slots(server_id, count))
+            except Exception as e:
+                db.session.rollback()
+                release_server(country, server_id, count)
+                print(f"[SLOT_POOL][ERROR] {country} server_id={server_id}: {e}", flush=True)
+    finally:
+        redis_client.delete(lock_key)
+    return created
@@ -0,0 +1,77 @@
+# app/utils/ssh_metrics.py
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from opentelemetry import trace
+
+from app.utils.metrics import SSH_BYTES, SSH_ERRORS, SSH_LATENCY, SSH_RETRIES
+
+# Текущая операция с VPS (operation, server_id): по ней подписываются метрики пула и ssh_exec.
+# Метка — id сервера из БД (число рядов ограничено размером флота); без id — "unknown"
+_current = ContextVar("ssh_operation", default=("other", "unknown"))
+
+tracer = trace.get_tracer(__name__)
+
+
+def ssh_operation(name: str):
+    """
+    Декоратор операции с VPS: функция должна принимать host и port, вызывающий передаёт
+    server_id=<Server.id> (ключевой аргумент забирает декоратор, в функцию он не попадает).
+    Операция — спан vps.<name>, её этапы connect/exec/parse — дочерние спаны и метрики
+    с этим именем; исключения считаются по классу.
+    """
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, server_id=None, **kwargs):
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            server = str(server_id) if server_id is not None else "unknown"
+            token = _current.set((name, server))
+            try:
+                with tracer.start_as_current_span(f"vps.{name}", kind=trace.SpanKind.CLIENT) as span:
+                    span.set_attribute("net.peer.name", str(bound.get("host")))
+                    span.set_attribute("net.peer.port", int(bound.get("port") or 0))
+                    span.set_attribute("vps.server_id", server)
+                    return fn(*args, **kwargs)
+            except Exception as e:
+                SSH_ERRORS.labels(name, server, type(e).__name__).inc()
+                raise
+            finally:
+                _current.reset(token)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def timed(phase: str):
+    """Время этапа (connect | exec | parse) текущей операции: метрика и дочерний спан."""
+    operation, server = _current.get()
+    started = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(f"ssh.{phase}") as span:
+            yield span
+    finally:
+        SSH_LATENCY.labels(operation, phase, server).observe(time.perf_counter() - started)
+
+
+def count_error(exc: Exception):
+    """Для ошибок, которые операция обрабатывает сама и не пробрасывает."""
+    operation, server = _current.get()
+    SSH_ERRORS.labels(operation, server, type(exc).__name__).inc()
+
+
+def count_bytes(sent: int, received: int):
+    operation, server = _current.get()
+    SSH_BYTES.labels(operation, server, "sent").inc(sent)
+    SSH_BYTES.labels(operation, server, "received").inc(received)
+
+
+def count_retry(reason: str, operation: str = None):
+    SSH_RETRIES.labels(operation or _current.get()[0], reason).inc()
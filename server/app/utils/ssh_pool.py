@@ -0,0 +1,200 @@
+# app/utils/ssh_pool.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+from dotenv import load_dotenv
+
+from app.utils.circuit_breaker import guard, record_failure, record_success
+from app.utils.deadline import DeadlineExceeded, SSH_CONNECT_TIMEOUT, remaining, timeout_for
+from app.utils.metrics import SSH_POOL_CHANNELS_IN_USE, SSH_POOL_CONNECTIONS
+from app.utils.ssh_metrics import count_retry, timed
+
+load_dotenv()
+
+# Настройки пула (можно переопределить через .env)
+SSH_KEEPALIVE_INTERVAL    = int(os.getenv("SSH_KEEPALIVE_INTERVAL", 30))
+SSH_POOL_MAX_IDLE         = int(os.getenv("SSH_POOL_MAX_IDLE", 300))
+SSH_MAX_CHANNELS_PER_HOST = int(os.getenv("SSH_MAX_CHANNELS_PER_HOST", 4))
+
+# Ошибки, после которых соединение считаем «сломанным» и выбрасываем из пула
+TRANSPORT_ERRORS = (paramiko.SSHException, EOFError, OSError)
+
+
+class CommandTimeout(DeadlineExceeded):
+    """Команда не завершилась за отведённое время; соединение остаётся в пуле."""
+
+
+class _PooledConnection:
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.last_used = time.monotonic()
+
+    def is_healthy(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+
+class SSHConnectionPool:
+    """
+    Пул SSH-соединений на процесс: одно аутентифицированное соединение на ключ (host, port, user).
+    Каналы (exec_command) открываются поверх общего транспорта, их число на хост ограничено семафором.
+    """
+
+    def __init__(self, max_idle: int = SSH_POOL_MAX_IDLE,
+                 keepalive: int = SSH_KEEPALIVE_INTERVAL,
+                 max_channels: int = SSH_MAX_CHANNELS_PER_HOST):
+        self.max_idle = max_idle
+        self.keepalive = keepalive
+        self.max_channels = max_channels
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._connections = {}  # key -> _PooledConnection
+        self._key_locks = {}    # key -> Lock (подключение к одному хосту только в одном потоке)
+        self._semaphores = {}   # key -> BoundedSemaphore
+        self._in_use = 0        # занятые каналы по всем хостам
+
+    def _check_pid(self):
+        # После fork сокеты принадлежат родителю — просто забываем их, не закрывая
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _connect(self, host: str, port: int, ssh_username: str, ssh_password: str) -> paramiko.SSHClient:
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        timeout = timeout_for(SSH_CONNECT_TIMEOUT)
+        with timed("connect"):
+            ssh.connect(host, port=port, username=ssh_username, password=ssh_password,
+                        timeout=timeout, banner_timeout=timeout, auth_timeout=timeout)
+        transport = ssh.get_transport()
+        if transport is not None and self.keepalive > 0:
+            transport.set_keepalive(self.keepalive)
+        return ssh
+
+    def _slots_for(self, key):
+        with self._lock:
+            self._check_pid()
+            if key not in self._semaphores:
+                self._semaphores[key] = threading.BoundedSemaphore(self.max_channels)
+                self._key_locks[key] = threading.Lock()
+            return self._semaphores[key], self._key_locks[key]
+
+    def _acquire(self, key, ssh_password: str, key_lock) -> paramiko.SSHClient:
+        self.evict_idle()
+        with key_lock:
+            with self._lock:
+                conn = self._connections.get(key)
+            if conn is not None and conn.is_healthy():
+                conn.last_used = time.monotonic()
+                return conn.client
+            if conn is not None:
+                # Соединение из пула умерло (VPS перезагрузился, NAT сбросил сессию) — подключаемся заново
+                count_retry("reconnect")
+                self._discard(key, conn.client)
+
+            host, port, ssh_username = key
+            client = self._connect(host, port, ssh_username, ssh_password)
+            with self._lock:
+                self._connections[key] = _PooledConnection(client)
+            return client
+
+    def _discard(self, key, client: paramiko.SSHClient):
+        with self._lock:
+            conn = self._connections.get(key)
+            if conn is not None and conn.client is client:
+                del self._connections[key]
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def session(self, host: str, port: int, ssh_username: str, ssh_password: str):
+        """
+        Выдаёт SSHClient из пула. Соединение не закрывается после использования,
+        а при транспортной ошибке выбрасывается из пула.
+        """
+        key = (host, int(port), ssh_username)
+        # Хост с открытым предохранителем не трогаем — не тратим таймаут подключения
+        guard(host, port)
+        semaphore, key_lock = self._slots_for(key)
+        # Ждать свободный канал дольше дедлайна запроса бессмысленно
+        left = remaining()
+        if not semaphore.acquire(timeout=None if left is None else max(0.0, left)):
+            raise DeadlineExceeded(f"Нет свободного SSH-канала к {host}:{port} до дедлайна")
+        with self._lock:
+            self._in_use += 1
+        try:
+            try:
+                client = self._acquire(key, ssh_password, key_lock)
+            except TRANSPORT_ERRORS:
+                record_failure(host, port)
+                raise
+            host_failed = False
+            try:
+                yield client
+            except TRANSPORT_ERRORS:
+                self._discard(key, client)
+                host_failed = True
+                raise
+            except CommandTimeout:
+                # Соединение живое, но хост не успевает выполнить команду
+                host_failed = True
+                raise
+            finally:
+                # Любой другой исход (в т.ч. ошибка разбора ответа) — хост отвечает
+                if host_failed:
+                    record_failure(host, port)
+                else:
+                    record_success(host, port)
+                with self._lock:
+                    conn = self._connections.get(key)
+                    if conn is not None:
+                        conn.last_used = time.monotonic()
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            semaphore.release()
+
+    def evict_idle(self):
+        """Закрывает соединения, простаивающие дольше max_idle секунд, и «мёртвые» транспорты."""
+        now = time.monotonic()
+        with self._lock:
+            self._check_pid()
+            stale = [
+                (key, conn) for key, conn in self._connections.items()
+                if now - conn.last_used > self.max_idle or not conn.is_healthy()
+            ]
+        for key, conn in stale:
+            self._discard(key, conn.client)
+
+    def close_all(self):
+        with self._lock:
+            self._check_pid()
+            connections = list(self._connections.items())
+        for key, conn in connections:
+            self._discard(key, conn.client)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._check_pid()
+            return {
+                "connections": len(self._connections),
+                "hosts": len(self._semaphores),
+                "channels_in_use": self._in_use,
+            }
+
+
+# Пул на процесс
+ssh_pool = SSHConnectionPool()
+SSH_POOL_CONNECTIONS.set_function(lambda: ssh_pool.stats()["connections"])
+SSH_POOL_CHANNELS_IN_USE.set_function(lambda: ssh_pool.stats()["channels_in_use"])
+
+
+def ssh_session(host: str, port: int, ssh_username: str, ssh_password: str):
+    return ssh_pool.session(host, port, ssh_username, ssh_password)
@@ -2,17 +2,19 @@
 import base64
 import paramiko
 import json
+import socket
 from datetime import datetime, timezone
 from dateutil.relativedelta import relativedelta
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import random
+import time
 import uuid as _uuid
 from urllib.parse import quote
-from celery import Celery
-from app.extensions import celery
-import redis
-from app.tasks.celery_tasks import update_user_count_cache
+from app.utils.ssh_pool import CommandTimeout, ssh_session
+from app.utils.deadline import SSH_COMMAND_TIMEOUT, check, timeout_for
+from app.utils.ssh_metrics import count_bytes, count_retry, ssh_operation, timed
 
 # Загрузка переменных окружения (PUBLIC_KEY, DOMAIN)
 load_dotenv()
@@ -20,98 +22,104 @@ load_dotenv()
 # Получение значений переменных
 public_key = os.getenv('PUBLIC_KEY')
 domain = os.getenv('DOMAIN')
-# Redis клиент для кеша
-redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"))
 
-def ssh_connect(host: str, port: int, ssh_username: str, ssh_password: str) -> paramiko.SSHClient:
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(host, port=port, username=ssh_username, password=ssh_password)
-    return ssh
+# Сколько sqlite3 на VPS ждёт, пока x-ui.db пишет другой процесс (x-ui, параллельный запрос)
+XUI_DB_BUSY_TIMEOUT_MS = int(os.getenv("XUI_DB_BUSY_TIMEOUT_MS", 5000))
+# Повторы записи, если x-ui.db так и не освободилась
+XUI_DB_BUSY_RETRIES = int(os.getenv("XUI_DB_BUSY_RETRIES", 2))
 
-def get_redis_key(host: str, port: int) -> str:
-    return f"vps:users:{host}:{port}"
-
-def get_cached_user_count(host: str, port: int, ssh_username: str, ssh_password: str) -> int:
+def ssh_exec(ssh: paramiko.SSHClient, cmd: str, step: str = "exec") -> tuple[str, str]:
     """
-    Возвращает закешированное значение количества пользователей или 0.
-    Запускает обновление кеша асинхронно, если данных нет.
+    Выполняет команду на пуловом соединении и дожидается её завершения,
+    чтобы канал освободился до возврата соединения в пул.
+    Время чтения ограничено дедлайном запроса (и SSH_COMMAND_TIMEOUT).
+    step — что делает команда (query, update, ...), пишется в спан.
     """
-    redis_key = f"vps:users:{host}:{port}"
-    cached = redis_client.get(redis_key)
-    if cached:
+    with timed("exec") as span:
+        # Сам текст команды в трассу не попадает: в нём UUID клиентов (это их ключи доступа)
+        span.set_attribute("vps.step", step)
+        span.set_attribute("ssh.command.bytes", len(cmd))
+        stdin, stdout, stderr = ssh.exec_command(cmd, timeout=timeout_for(SSH_COMMAND_TIMEOUT))
         try:
-            return int(cached)
-        except ValueError:
-            pass
-    # Запускаем обновление в фоне
-    update_user_count_cache.delay(host, port, ssh_username, ssh_password)
-    return 0
-
-
+            out = stdout.read()
+            err = stderr.read()
+        except socket.timeout:
+            # Закрываем только канал: соединение живое и вернётся в пул
+            stdout.channel.close()
+            raise CommandTimeout(f"Команда на VPS не завершилась вовремя: {cmd[:60]}")
+        stdout.channel.recv_exit_status()
+    count_bytes(len(cmd.encode()), len(out) + len(err))
+    return out.decode().strip(), err.decode().strip()
+
+@ssh_operation("count_users")
 def count_users_on_port(host: str, port: int, ssh_username: str, ssh_password: str) -> int:
     """
-    Подробный подсчёт пользователей по SSH — медленный синхронный метод.
+    Подсчёт пользователей по SSH. Агрегация выполняется в sqlite на VPS —
+    по сети передаётся одно число, а не весь JSON settings.
+    Ошибки (недоступный VPS, открытый предохранитель, странный ответ) пробрасываются:
+    вызывающий оставляет последнее известное значение, а не записывает 0.
     """
-    ssh = None
-    try:
-        ssh = ssh_connect(host, port, ssh_username, ssh_password)
-        cmd = 'sqlite3 /etc/x-ui/x-ui.db "SELECT settings FROM inbounds;"'
-        stdin, stdout, stderr = ssh.exec_command(cmd)
-        out = stdout.read().decode().strip()
-        if not out:
-            raise RuntimeError(f"Inbound на сервере {host} не найден")
+    sql = "SELECT COALESCE(SUM(json_array_length(settings, '$.clients')), 0) FROM inbounds;"
+    cmd = f'sqlite3 /etc/x-ui/x-ui.db "{sql}"'
+    with ssh_session(host, port, ssh_username, ssh_password) as ssh:
+        out, err = ssh_exec(ssh, cmd, step="query")
+    if not out:
+        raise RuntimeError(f"Не удалось посчитать клиентов на {host}: {err or 'пустой ответ'}")
+    with timed("parse"):
+        try:
+            return int(out)
+        except ValueError:
+            raise ValueError(f"Неожиданный ответ sqlite на {host}: {out[:100]!r}")
 
-        # Вот магия:
-        cfg = json.loads(out)  # парсим весь результат целиком
-        clients = cfg.get('clients', [])
-        return len(clients)
 
-    except json.JSONDecodeError as e:
-        print(f"Ошибка декодирования JSON: {e}")
-        print("RAW OUT:", repr(out))
-        return 0
+@ssh_operation("restart_xui")
+def restart_xui(host: str, port: int, ssh_username: str, ssh_password: str):
+    with ssh_session(host, port, ssh_username, ssh_password) as ssh:
+        ssh_exec(ssh, "systemctl restart x-ui", step="restart")
 
-    except Exception as e:
-        print(f"Ошибка при выполнении команды на {host}:{port}: {e}")
-        return 0
 
-    finally:
-        if ssh:
-            ssh.close()
+class ClientNotFound(Exception):
+    """Клиента с таким id нет в inbound'е VPS (удалён вручную, x-ui.db восстановлен из копии)."""
 
 
-def restart_xui(host: str, port: int, ssh_username: str, ssh_password: str):
-    ssh = ssh_connect(host, port, ssh_username, ssh_password)
-    try:
-        ssh.exec_command("systemctl restart x-ui")
-    finally:
-        ssh.close()
+class VpsBusy(Exception):
+    """x-ui.db на VPS занята другой записью дольше XUI_DB_BUSY_TIMEOUT_MS; транзакция откачена, можно повторить."""
+
 
+def _is_busy(err: str) -> bool:
+    return "database is locked" in err or "database is busy" in err
 
+
+def _expiry_ms(months: int) -> int:
+    """Срок действия в формате x-ui (мс); 0 — бессрочно (заготовки пула до выдачи пользователю)."""
+    if not months:
+        return 0
+    return int((datetime.now(timezone.utc) + relativedelta(months=months)).timestamp() * 1000)
+
+
+@ssh_operation("insert_traffic")
 def insert_traffic_record(
     email: str,
     port: int,
     months: int,
     host: str,
     ssh_username: str,
-    ssh_password: str
+    ssh_password: str,
+    enable: bool = True
 ):
-    ssh = ssh_connect(host, port, ssh_username, ssh_password)
-    try:
+    with ssh_session(host, port, ssh_username, ssh_password) as ssh:
         db_path = "/etc/x-ui/x-ui.db"
-        expiry_ms = int((datetime.now(timezone.utc) + relativedelta(months=months)).timestamp() * 1000)
+        expiry_ms = _expiry_ms(months)
         sql = (
             "INSERT INTO client_traffics "
             "(inbound_id, enable, email, up, down, expiry_time, total, reset) VALUES ("
             f"(SELECT id FROM inbounds),"
-            f"1, '{email}', 0, 0, {expiry_ms}, 0, 0);"
+            f"{int(enable)}, '{email}', 0, 0, {expiry_ms}, 0, 0);"
         )
-        ssh.exec_command(f'sqlite3 {db_path} "{sql}"')
-    finally:
-        ssh.close()
+        ssh_exec(ssh, f'sqlite3 {db_path} "{sql}"', step="traffic_insert")
 
 
+@ssh_operation("insert_inbound")
 def insert_inbound_record(
     email: str,
     client_uuid: str,
@@ -122,10 +130,10 @@ def insert_inbound_record(
     months: int,
     ssh_username: str,
     ssh_password: str,
-    x_ui_port: str
+    x_ui_port: str,
+    enable: bool = True
 ) -> str:
-    try:
-        ssh = ssh_connect(host, port, ssh_username, ssh_password)
+    with ssh_session(host, port, ssh_username, ssh_password) as ssh:
         db_path = "/etc/x-ui/x-ui.db"
 
         sql = (
@@ -136,8 +144,7 @@ def insert_inbound_record(
         )
 
         cmd = f'sqlite3 {db_path} \"{sql}\"'
-        stdin, stdout, stderr = ssh.exec_command(cmd)
-        out = stdout.read().decode().strip()
+        out, _ = ssh_exec(ssh, cmd, step="query")
 
         if not out:
             raise Exception(f"Inbound на порту {x_ui_port} не найден")
@@ -149,7 +156,7 @@ def insert_inbound_record(
         # Загружаем JSON и добавляем клиента
         cfg = json.loads(settings_json)
         # sub_id = _uuid.uuid4().hex[:12]
-        expiry_ms = int((datetime.now(timezone.utc) + relativedelta(months=months)).timestamp() * 1000)
+        expiry_ms = _expiry_ms(months)
 
 
         # ⬇️ Генерируем ссылку заранее
@@ -162,7 +169,7 @@ def insert_inbound_record(
             "link": config_link,
             "empty_data_here": "=============================BELOW_IS_THE_VPS_DATA=============================",
             "email": email,
-            "enable": True,
+            "enable": enable,
             "expiryTime": expiry_ms,
             "flow": flow,
             "id": client_uuid,
@@ -188,18 +195,137 @@ def insert_inbound_record(
             f'"UPDATE inbounds SET settings = \'{{}}\' WHERE id = {inbound_id};"'
         )
 
-        stdin, stdout, stderr = ssh.exec_command(upd_cmd)
-        err = stderr.read().decode().strip()
+        _, err = ssh_exec(ssh, upd_cmd, step="update")
         if err:
             raise Exception(f"Ошибка при выполнении UPDATE: {err}")
 
         # Возвращаем ссылку
         return config_link
-
-    finally:
-        ssh.close()
         
         
+# Подставляется в ссылки вместо shortId, пока он не прочитан на VPS
+_SHORT_ID_PLACEHOLDER = "__XUI_SHORT_ID__"
+
+
+def _sql_str(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _transaction_command(statements: list) -> str:
+    """Команда sqlite3: statements одной транзакцией, первая же ошибка откатывает всё (-bail)."""
+    db_path = "/etc/x-ui/x-ui.db"
+    script = "\n".join([
+        # Занятая x-ui.db не роняет запрос сразу: BEGIN IMMEDIATE ждёт освобождения блокировки
+        f".timeout {XUI_DB_BUSY_TIMEOUT_MS}",
+        "BEGIN IMMEDIATE;",
+        *statements,
+        "COMMIT;",
+    ])
+    # Кавычки у ограничителя heredoc отключают подстановки shell внутри SQL
+    return f"sqlite3 -bail {db_path} <<'XUI_SQL'\n{script}\nXUI_SQL"
+
+
+def _run_transaction(host, port, ssh_username, ssh_password, cmd: str, step: str) -> tuple[str, str]:
+    """
+    Выполняет команду _transaction_command. Если x-ui.db занята и после ожидания,
+    повторяет до XUI_DB_BUSY_RETRIES раз, пока клиент ждёт ответа, затем бросает VpsBusy.
+    """
+    for attempt in range(XUI_DB_BUSY_RETRIES + 1):
+        with ssh_session(host, port, ssh_username, ssh_password) as ssh:
+            out, err = ssh_exec(ssh, cmd, step=step)
+        if not (err and _is_busy(err)):
+            return out, err
+        if attempt == XUI_DB_BUSY_RETRIES:
+            raise VpsBusy(f"x-ui.db на {host} занята: {err}")
+        count_retry("db_locked")
+        time.sleep(random.uniform(0.1, 0.5))
+        check("повтор записи в x-ui.db")
+
+
+def _provision_command(host: str, x_ui_port: int, clients: list) -> str:
+    """
+    Команда sqlite3 для provision_clients: одна транзакция на всю пачку.
+    Клиенты дописываются в settings через json_insert (без пересылки всего JSON),
+    строки client_traffics вставляются одним INSERT ... SELECT, shortId подставляется
+    в ссылки на VPS. Вывод команды — shortId inbound'а (пусто, если inbound'а нет).
+    """
+    x_ui_port = int(x_ui_port)
+    short_id = "json_extract(stream_settings, '$.realitySettings.shortIds[0]')"
+    inbound = f"port = {x_ui_port} AND COALESCE({short_id}, '') != ''"
+
+    inserts, traffic = [], []
+    for c in clients:
+        expiry_ms = _expiry_ms(c['months'])
+        link = generate_vless_link(c['email'], c['client_uuid'], host, x_ui_port,
+                                   c['flow'], _SHORT_ID_PLACEHOLDER)
+        client = {
+            "host": host,
+            "user_id": c['user_id'],
+            "months": c['months'],
+            "link": link,
+            "empty_data_here": "=============================BELOW_IS_THE_VPS_DATA=============================",
+            "email": c['email'],
+            "enable": c.get('enable', True),
+            "expiryTime": expiry_ms,
+            "flow": c['flow'],
+            "id": c['client_uuid'],
+            "limitIp": 0,
+            "reset": 0,
+            "tgId": "",
+            "totalGB": 0
+        }
+        # shortId подставляется на VPS из stream_settings той же строки
+        inserts.append(
+            f"'$.clients[#]', json(replace({_sql_str(json.dumps(client))}, "
+            f"'{_SHORT_ID_PLACEHOLDER}', {short_id}))"
+        )
+        traffic.append(
+            f"SELECT {int(c.get('enable', True))} AS enable, {_sql_str(c['email'])} AS email, "
+            f"{expiry_ms} AS expiry_time"
+        )
+
+    return _transaction_command([
+        f"UPDATE inbounds SET settings = json_insert(settings, {', '.join(inserts)}) WHERE {inbound};",
+        "INSERT INTO client_traffics (inbound_id, enable, email, up, down, expiry_time, total, reset) "
+        f"SELECT inbounds.id, t.enable, t.email, 0, 0, t.expiry_time, 0, 0 FROM inbounds, "
+        f"({' UNION ALL '.join(traffic)}) AS t WHERE {inbound};",
+        f"SELECT {short_id} FROM inbounds WHERE {inbound};",
+    ])
+
+
+@ssh_operation("provision_clients")
+def provision_clients(
+    host: str,
+    port: int,
+    ssh_username: str,
+    ssh_password: str,
+    x_ui_port: int,
+    clients: list
+) -> list:
+    """
+    Добавляет пачку клиентов на один VPS за один SSH-вызов и одну транзакцию sqlite
+    (см. _provision_command).
+
+    clients — список dict с ключами email, client_uuid, flow, user_id, months, enable.
+    Возвращает vless-ссылки в том же порядке. Если x-ui.db занята и после повторов,
+    бросает VpsBusy: на VPS ничего не записано.
+    """
+    if not clients:
+        return []
+    cmd = _provision_command(host, x_ui_port, clients)
+    out, err = _run_transaction(host, port, ssh_username, ssh_password, cmd, step="provision")
+    if err:
+        raise Exception(f"Ошибка при добавлении клиентов: {err}")
+    if not out:
+        raise Exception(f"Inbound на порту {x_ui_port} не найден или без shortId")
+
+    first_short_id = out.splitlines()[0]
+    return [
+        generate_vless_link(c['email'], c['client_uuid'], host, int(x_ui_port), c['flow'], first_short_id)
+        for c in clients
+    ]
+
+
 def generate_vless_link(
     email: str,
     client_uuid: str,
@@ -222,26 +348,143 @@ def generate_vless_link(
 
 
 
-def get_vps_clients_configurations(host, port, ssh_username, ssh_password, x_ui_port):
-    try:
-        ssh = ssh_connect(host, port, ssh_username, ssh_password)
-        db_path = "/etc/x-ui/x-ui.db"
-
+def _clients_sql(x_ui_port, user_id=None) -> str:
+    """
+    SQL для списка клиентов inbound'а. С user_id фильтрация выполняется на VPS
+    через json_each — по сети уходят только клиенты этого пользователя.
+    """
+    if user_id is None:
         # Извлекаем clients из JSON-колонки settings, а не из stream_settings
-        sql = (
+        return (
             'SELECT json_extract(settings, \'$.clients\') AS clients '
             f'FROM inbounds WHERE port = {x_ui_port};'
         )
+    return (
+        'SELECT json_group_array(json(c.value)) '
+        'FROM inbounds, json_each(inbounds.settings, \'$.clients\') AS c '
+        f'WHERE inbounds.port = {int(x_ui_port)} '
+        f'AND json_extract(c.value, \'$.user_id\') = {int(user_id)};'
+    )
+
 
-        cmd = f'sqlite3 {db_path} "{sql}"'
-        stdin, stdout, stderr = ssh.exec_command(cmd)
-        out = stdout.read().decode().strip()
+@ssh_operation("get_clients")
+def get_vps_clients_configurations(host, port, ssh_username, ssh_password, x_ui_port, user_id=None):
+    with ssh_session(host, port, ssh_username, ssh_password) as ssh:
+        db_path = "/etc/x-ui/x-ui.db"
+        cmd = f'sqlite3 {db_path} "{_clients_sql(x_ui_port, user_id)}"'
+        out, _ = ssh_exec(ssh, cmd, step="query")
 
         if not out:
             raise Exception("Конфигурации клиентов на VPS не найдены")
 
+    with timed("parse"):
         clients = json.loads(out)  # теперь это массив dict-ов с нужными полями
-        return clients
+    return clients
+
+
+@ssh_operation("get_clients_if_changed")
+def get_vps_clients_if_changed(host, port, ssh_username, ssh_password, x_ui_port,
+                               known_fingerprint=None, user_id=None):
+    """
+    Одной SSH-командой считает отпечаток (md5 от settings inbound'а) и, только если он
+    отличается от known_fingerprint, возвращает список клиентов (с user_id — только его клиентов).
+    Возвращает (fingerprint, clients); clients = None, если на VPS ничего не менялось.
+    """
+    db_path = "/etc/x-ui/x-ui.db"
+    fp_sql = f'SELECT settings FROM inbounds WHERE port = {x_ui_port};'
+    sql = _clients_sql(x_ui_port, user_id)
+    # Отпечаток считается на VPS — при совпадении по сети уходят только 32 байта
+    cmd = (
+        f'fp=$(sqlite3 {db_path} "{fp_sql}" | md5sum | cut -d" " -f1); '
+        f'echo "$fp"; '
+        f'if [ "$fp" != "{known_fingerprint or ""}" ]; then sqlite3 {db_path} "{sql}"; fi'
+    )
+
+    with ssh_session(host, port, ssh_username, ssh_password) as ssh:
+        out, _ = ssh_exec(ssh, cmd, step="query")
+
+    fingerprint, _, payload = out.partition("\n")
+    fingerprint = fingerprint.strip()
+    if not fingerprint:
+        raise Exception("Не удалось получить отпечаток x-ui.db")
+    if fingerprint == known_fingerprint:
+        return fingerprint, None
 
-    finally:
-        ssh.close()
\ No newline at end of file
+    payload = payload.strip()
+    if not payload:
+        raise Exception("Конфигурации клиентов на VPS не найдены")
+    with timed("parse"):
+        clients = json.loads(payload)
+    return fingerprint, clients
+
+
+@ssh_operation("activate_client")
+def activate_client(
+    host: str,
+    port: int,
+    ssh_username: str,
+    ssh_password: str,
+    x_ui_port: int,
+    client_uuid: str,
+    email: str,
+    user_id: int,
+    months: int
+):
+    """
+    Выдаёт заранее созданного (выключенного) клиента пользователю: проставляет user_id,
+    months, срок действия и включает его — одной командой, без перезаписи всего settings.
+    Если клиента на VPS нет, бросает ClientNotFound.
+    """
+    expiry_ms = _expiry_ms(months)
+    client_id = _sql_str(client_uuid)
+    # Путь к клиенту в массиве clients ищется на VPS через json_each
+    path = (
+        "'$.clients[' || (SELECT c.key FROM json_each(inbounds.settings, '$.clients') AS c "
+        f"WHERE json_extract(c.value, '$.id') = {client_id}) || ']"
+    )
+    cmd = _transaction_command([
+        "UPDATE inbounds SET settings = json_set(settings, "
+        f"{path}.user_id', {int(user_id)}, "
+        f"{path}.months', {int(months)}, "
+        f"{path}.enable', json('true'), "
+        f"{path}.expiryTime', {expiry_ms}) "
+        f"WHERE port = {int(x_ui_port)} AND EXISTS (SELECT 1 FROM json_each(inbounds.settings, '$.clients') AS c "
+        f"WHERE json_extract(c.value, '$.id') = {client_id});",
+        # Число изменённых inbound'ов: 0 — клиента на VPS нет, UPDATE молча ничего не сделал
+        "SELECT changes();",
+        f"UPDATE client_traffics SET enable = 1, expiry_time = {expiry_ms} WHERE email = {_sql_str(email)};",
+    ])
+    out, err = _run_transaction(host, port, ssh_username, ssh_password, cmd, step="update")
+    if err:
+        raise Exception(f"Ошибка при активации клиента {client_uuid}: {err}")
+    if out.strip() == "0":
+        raise ClientNotFound(f"Клиент {client_uuid} не найден на {host}:{x_ui_port}")
+
+
+@ssh_operation("remove_clients")
+def remove_clients(
+    host: str,
+    port: int,
+    ssh_username: str,
+    ssh_password: str,
+    x_ui_port: int,
+    clients: list
+):
+    """
+    Удаляет клиентов из inbound'а и их строки client_traffics одной транзакцией —
+    например, созданных provision_clients, если выдать их не удалось.
+    clients — список dict с ключами client_uuid и email.
+    """
+    if not clients:
+        return
+    ids = ", ".join(_sql_str(c['client_uuid']) for c in clients)
+    emails = ", ".join(_sql_str(c['email']) for c in clients)
+    cmd = _transaction_command([
+        "UPDATE inbounds SET settings = json_set(settings, '$.clients', "
+        "(SELECT json_group_array(json(c.value)) FROM json_each(inbounds.settings, '$.clients') AS c "
+        f"WHERE json_extract(c.value, '$.id') NOT IN ({ids}))) WHERE port = {int(x_ui_port)};",
+        f"DELETE FROM client_traffics WHERE email IN ({emails});",
+    ])
+    _, err = _run_transaction(host, port, ssh_username, ssh_password, cmd, step="delete")
+    if err:
+        raise Exception(f"Ошибка при удалении клиентов: {err}")
@@ -0,0 +1,215 @@
+# benchmarks/fake_vps.py
+"""
+Имитация флота x-ui VPS в одном процессе: каждый «сервер» — SSH-сервер paramiko на
+127.0.0.1 со своим x-ui.db (схема inbounds/client_traffics). Команды приложения
+выполняются локальным sh, путь /etc/x-ui/x-ui.db подменяется на файл сервера.
+"""
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import threading
+import time
+import uuid
+
+import paramiko
+
+XUI_DB_PATH = "/etc/x-ui/x-ui.db"
+SHORT_ID = "0123abcd"
+
+_SCHEMA = """
+CREATE TABLE inbounds (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER, up INTEGER DEFAULT 0, down INTEGER DEFAULT 0, total INTEGER DEFAULT 0,
+    remark TEXT, enable INTEGER DEFAULT 1, expiry_time INTEGER DEFAULT 0,
+    listen TEXT, port INTEGER UNIQUE, protocol TEXT,
+    settings TEXT, stream_settings TEXT, tag TEXT, sniffing TEXT
+);
+CREATE TABLE client_traffics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    inbound_id INTEGER, enable INTEGER, email TEXT UNIQUE,
+    up INTEGER, down INTEGER, expiry_time INTEGER, total INTEGER, reset INTEGER DEFAULT 0
+);
+"""
+
+
+def create_xui_db(path: str, x_ui_port: int, clients: list):
+    """x-ui.db с одним VLESS Reality inbound'ом и заданными клиентами (dict в формате x-ui)."""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(_SCHEMA)
+    stream = {"network": "tcp", "security": "reality", "realitySettings": {"shortIds": [SHORT_ID]}}
+    conn.execute(
+        "INSERT INTO inbounds (remark, port, protocol, settings, stream_settings, tag) "
+        "VALUES ('bench', ?, 'vless', ?, ?, ?)",
+        (x_ui_port, json.dumps({"clients": clients, "decryption": "none"}), json.dumps(stream),
+         f"inbound-{x_ui_port}"),
+    )
+    conn.executemany(
+        "INSERT INTO client_traffics (inbound_id, enable, email, up, down, expiry_time, total, reset) "
+        "VALUES (1, 1, ?, 0, 0, ?, 0, 0)",
+        [(c["email"], c["expiryTime"]) for c in clients],
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_client(user_id=None, months: int = 1) -> dict:
+    expiry_ms = int((time.time() + months * 30 * 86400) * 1000)
+    client_uuid = str(uuid.uuid4())
+    email = f"bench_{uuid.uuid4().hex[:12]}"
+    link = f"vless://{client_uuid}@127.0.0.1:443?type=tcp&security=reality&sid={SHORT_ID}#{email}"
+    return {
+        "host": "127.0.0.1", "user_id": user_id, "months": months, "link": link,
+        "email": email, "enable": True, "expiryTime": expiry_ms,
+        "flow": "", "id": client_uuid, "limitIp": 0, "reset": 0, "tgId": "", "totalGB": 0,
+    }
+
+
+class _SSHHandler(paramiko.ServerInterface):
+    def __init__(self, vps: "FakeVPS"):
+        self.vps = vps
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if username == self.vps.username and password == self.vps.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_REQUEST
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.vps.run_command, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+
+class FakeVPS:
+    """
+    Один VPS. latency — задержка каждой команды (сек, ± jitter), failure_rate — доля команд,
+    на которых VPS обрывает SSH-соединение (как при сбое сети или перезагрузке).
+    """
+
+    def __init__(self, workdir: str, host_key, x_ui_port: int = 443, clients=None,
+                 latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 username: str = "root", password: str = "bench"):
+        os.makedirs(workdir, exist_ok=True)
+        self.db_path = os.path.join(workdir, "x-ui.db")
+        self.host_key = host_key
+        self.x_ui_port = x_ui_port
+        self.latency, self.jitter, self.failure_rate = latency, jitter, failure_rate
+        self.username, self.password = username, password
+        self.commands = 0
+        self.failures = 0
+        create_xui_db(self.db_path, x_ui_port, clients or [])
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(128)
+        self.host, self.port = self._sock.getsockname()
+        self._transports = []
+        self._lock = threading.Lock()
+        self._closed = False
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            with self._lock:
+                self._transports.append(transport)
+            try:
+                transport.start_server(server=_SSHHandler(self))
+            except (paramiko.SSHException, EOFError, OSError):
+                continue
+            # Открытые каналы копятся в очереди accept() транспорта — разбираем её
+            threading.Thread(target=self._drain_channels, args=(transport,), daemon=True).start()
+
+    @staticmethod
+    def _drain_channels(transport):
+        # Ссылки на каналы держим до закрытия: собранный GC канал закрывается сам
+        channels = set()
+        while transport.is_active():
+            channel = transport.accept(timeout=1)
+            channels = {c for c in channels if not c.closed}
+            if channel is not None:
+                channels.add(channel)
+
+    def run_command(self, channel, command: str):
+        with self._lock:
+            self.commands += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            channel.get_transport().close()
+            return
+        # Перезапуск x-ui в имитации не нужен
+        if command.strip() == "systemctl restart x-ui":
+            command = "true"
+        proc = subprocess.run(["sh", "-c", command.replace(XUI_DB_PATH, self.db_path)], capture_output=True)
+        try:
+            if proc.stdout:
+                channel.sendall(proc.stdout)
+            if proc.stderr:
+                channel.sendall_stderr(proc.stderr)
+            channel.send_exit_status(proc.returncode)
+        except OSError:
+            # Соединение уже оборвано (в т.ч. имитацией сбоя другой команды)
+            pass
+        finally:
+            channel.close()
+
+    def client_count(self) -> int:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            (count,) = conn.execute(
+                "SELECT COALESCE(SUM(json_array_length(settings, '$.clients')), 0) FROM inbounds"
+            ).fetchone()
+        finally:
+            conn.close()
+        return count
+
+    def close(self):
+        self._closed = True
+        self._sock.close()
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+
+
+class FakeFleet:
+    """N FakeVPS с общим ключом хоста; clients_for(i) задаёт начальных клиентов i-го сервера."""
+
+    def __init__(self, workdir: str, size: int, clients_for=None, **vps_kwargs):
+        host_key = paramiko.RSAKey.generate(2048)
+        self.servers = [
+            FakeVPS(os.path.join(workdir, f"vps{i}"), host_key,
+                    clients=clients_for(i) if clients_for else None, **vps_kwargs)
+            for i in range(size)
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "commands": sum(s.commands for s in self.servers),
+            "injected_failures": sum(s.failures for s in self.servers),
+        }
+
+    def close(self):
+        for s in self.servers:
+            s.close()
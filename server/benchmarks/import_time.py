@@ -0,0 +1,152 @@
+# benchmarks/import_time.py
+"""
+Время холодного старта точек входа: каждая импортируется в отдельном процессе
+(python -X importtime) несколько раз. В JSON пишутся медиана и минимум времени
+импорта (внутри процесса), полное время жизни процесса за вычетом запуска пустого
+интерпретатора (включает завершение: сброс логов, остановку экспортеров) и самые
+дорогие модули.
+
+    python -m benchmarks.import_time --repeat 5 --out import_time.json
+    python -m benchmarks.import_time --baseline import_time.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    "package": "import app",
+    "web": "import run",
+    "grpc_config": "import app.grpc_server.config_service",
+    "grpc_server": "import app.grpc_server.server_service",
+    "celery_worker": "import app.celery_worker",
+    "celery_tasks": "import app.tasks.celery_tasks",
+    "vps_data": "import app.utils.vps_data",
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS))
+    parser.add_argument("--top", type=int, default=10, help="сколько самых дорогих модулей сохранить")
+    parser.add_argument("--out", default="import_time.json")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    return parser.parse_args(argv)
+
+
+def _environment(workdir: str) -> dict:
+    # Сервисы недоступны: старт не должен от них зависеть (подключения — лениво)
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'app.db')}")
+    env.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")
+    env.setdefault("LOGSTASH_HOST", "127.0.0.1")
+    env.setdefault("PUSHGATEWAY_URL", "")
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+# Время импорта меряется в самом процессе; в stdout пишут и фоновые потоки приложения — строку ищем по метке
+_MARKER = "IMPORT_SECONDS"
+_TIMED = "import time as _t; _s = _t.perf_counter()\n{statement}\nprint('%s', _t.perf_counter() - _s, flush=True)" % _MARKER
+
+
+def _run(statement: str, env: dict):
+    """(полное время процесса, время импорта, лог -X importtime)."""
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _TIMED.format(statement=statement)],
+                          cwd=SERVER_DIR, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"{statement!r} завершился с кодом {proc.returncode}:\n{proc.stderr[-2000:]}")
+    imported = next(float(line.split()[1]) for line in proc.stdout.splitlines() if line.startswith(_MARKER))
+    return elapsed, imported, proc.stderr
+
+
+def _top_modules(importtime_log: str, top: int) -> list:
+    """Модули верхнего уровня (импортированные самой точкой входа) по суммарному времени."""
+    modules = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  self_us | cumulative_us |   package.module" — отступ имени = вложенность
+        _, cumulative_us, name = line.split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((int(cumulative_us), name.strip(), depth))
+    # Только первые уровни вложенности — иначе время вложенных модулей считается дважды
+    shallow = [m for m in modules if m[2] <= 1]
+    shallow.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name, _ in shallow[:top]]
+
+
+def measure(statement: str, env: dict, repeat: int, interpreter: float, top: int) -> dict:
+    imports, processes, log = [], [], ""
+    for _ in range(repeat):
+        elapsed, imported, log = _run(statement, env)
+        imports.append(imported * 1000)
+        processes.append(max(0.0, elapsed - interpreter) * 1000)
+    return {
+        "median_ms": round(statistics.median(imports), 1),
+        "min_ms": round(min(imports), 1),
+        "process_median_ms": round(statistics.median(processes), 1),
+        "top_modules": _top_modules(log, top),
+    }
+
+
+def _print_comparison(results: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"{'entry point':<16}{'import, ms':>22}{'process, ms':>22}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        cells = []
+        for key in ("median_ms", "process_median_ms"):
+            delta = (current[key] - before[key]) / before[key] * 100 if before.get(key) else 0.0
+            cells.append(f"{current[key]:.1f} ({delta:+.0f}%)")
+        print(f"{name:<16}" + "".join(f"{c:>22}" for c in cells))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = [e.strip() for e in args.entry_points.split(",") if e.strip()]
+    unknown = set(selected) - set(ENTRY_POINTS)
+    if unknown:
+        print(f"Неизвестные точки входа: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    env = _environment(tempfile.mkdtemp(prefix="import-bench-"))
+    interpreter = statistics.median(_run("pass", env)[0] for _ in range(args.repeat))
+
+    results = {}
+    for name in selected:
+        results[name] = measure(ENTRY_POINTS[name], env, args.repeat, interpreter, args.top)
+        print(f"[IMPORT_TIME] {name}: import {results[name]['median_ms']} ms, "
+              f"process {results[name]['process_median_ms']} ms", flush=True)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "interpreter_ms": round(interpreter * 1000, 1),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[IMPORT_TIME] written {args.out}", flush=True)
+
+    if args.baseline:
+        _print_comparison(results, args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+# benchmarks/run.py
+"""
+Офлайн-бенчмарк сервисов на имитированном флоте x-ui VPS (benchmarks/fake_vps.py):
+
+    python -m benchmarks.run --servers 10 --clients-per-server 200 --latency 0.05 \\
+        --failure-rate 0.01 --requests 200 --concurrency 16 --out bench.json
+    python -m benchmarks.run ... --baseline bench.json   # сравнить с прошлым прогоном
+
+Redis — fakeredis в процессе, БД приложения — SQLite во временном каталоге или
+--database-url (например, Postgres). Servicer'ы вызываются напрямую (без сети gRPC),
+задачи Celery — синхронно, без брокера. Для каждого сценария в JSON пишутся
+p50/p95/p99, среднее, пропускная способность и число ошибок.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+
+SCENARIOS = ("create_configuration", "sync_configurations", "list_servers",
+             "update_vps_user_counts", "sync_fleet")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", type=int, default=5, help="размер имитируемого флота")
+    parser.add_argument("--clients-per-server", type=int, default=100, help="клиентов в x-ui.db каждого VPS")
+    parser.add_argument("--users", type=int, default=50, help="пользователей приложения")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждой SSH-команды, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки, ± сек")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="доля команд с обрывом соединения")
+    parser.add_argument("--requests", type=int, default=100, help="вызовов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30.0, help="дедлайн одного вызова, сек")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--database-url", default=None, help="по умолчанию SQLite во временном каталоге")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    return parser.parse_args(argv)
+
+
+def _configure_environment(args, workdir: str):
+    """До импорта модулей app: они берут общий клиент Redis из app/utils/redis_pool.py при импорте."""
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'app.db')}"
+    os.environ.setdefault("REDIS_URL", "redis://fakeredis:6379/0")
+    os.environ.setdefault("OTEL_TRACES_SAMPLER_ARG", "0")
+    os.environ.setdefault("PUSHGATEWAY_URL", "")
+
+    import fakeredis
+    import app.utils.redis_pool as redis_pool
+
+    redis_pool.redis_client = redis_pool.cached_client = fakeredis.FakeRedis(server=fakeredis.FakeServer())
+
+    from app.extensions import celery
+    # Брокер в памяти: .delay() из сервисов только ставит сообщение, воркера нет
+    celery.conf.update(broker_url="memory://", result_backend="cache+memory://")
+
+
+def _seed(fleet, users: int, max_users: int):
+    from app.extensions import db
+    from app.models.server import Server
+    from app.models.user import User
+
+    db.session.add_all(
+        User(username=f"bench{i}", email=f"bench{i}@example.com", password="x",
+             birth_date=date(1990, 1, 1), full_name=f"Bench {i}")
+        for i in range(1, users + 1)
+    )
+    db.session.add_all(
+        Server(country="Bench", host=vps.host, port=str(vps.port), ssh_username=vps.username,
+               ssh_password=vps.password, max_users=max_users, x_ui_port=vps.x_ui_port,
+               ui_panel_link="http://bench")
+        for vps in fleet.servers
+    )
+    db.session.commit()
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def measure(fn, calls: int, concurrency: int) -> dict:
+    """fn(i) -> True при успехе. Возвращает перцентили задержки (мс) и пропускную способность."""
+
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            ok = fn(i)
+        except Exception as e:
+            print(f"[BENCH][ERROR] {type(e).__name__}: {e}", flush=True)
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(calls)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, _ in results)
+    return {
+        "calls": calls,
+        "errors": sum(1 for _, ok in results if not ok),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "throughput_rps": round(calls / wall, 2) if wall else 0.0,
+    }
+
+
+def _scenarios(args):
+    from app.generated_grpc.config_service_pb2 import CreateConfigRequest, SyncConfigsRequest
+    from app.generated_grpc.server_service_pb2 import ListServersRequest
+    from app import get_app
+    from app.grpc_server.config_service import ConfigurationServiceServicer
+    from app.grpc_server.context import LocalServicerContext
+    from app.grpc_server.server_service import ServerServiceServicer
+    from app.tasks.celery_tasks import sync_all_user_configurations, update_all_vps_user_counts
+
+    config_service = ConfigurationServiceServicer()
+    server_service = ServerServiceServicer()
+
+    def rpc(method, request):
+        context = LocalServicerContext(timeout=args.timeout)
+        method(request, context)
+        return context.ok
+
+    def job(task):
+        # Без аренды и адаптивного расписания (app/utils/periodic.py) — каждый вызов выполняет задачу
+        with get_app().app_context():
+            task.run.__wrapped__()
+        return True
+
+    return {
+        "create_configuration": lambda i: rpc(
+            config_service.CreateConfiguration,
+            CreateConfigRequest(user_id=i % args.users + 1, country="Bench", months=1),
+        ),
+        "sync_configurations": lambda i: rpc(
+            config_service.SyncConfigurations, SyncConfigsRequest(user_id=i % args.users + 1),
+        ),
+        "list_servers": lambda i: rpc(server_service.ListServers, ListServersRequest(country="Bench")),
+        "update_vps_user_counts": lambda i: job(update_all_vps_user_counts),
+        "sync_fleet": lambda i: job(sync_all_user_configurations),
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _print_comparison(results: dict, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"{'scenario':<24}{'p50':>16}{'p95':>16}{'rps':>16}")
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "throughput_rps"):
+            delta = (current[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            cells.append(f"{current[key]:.1f} ({delta:+.0f}%)")
+        print(f"{name:<24}" + "".join(f"{c:>16}" for c in cells))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        print(f"Неизвестные сценарии: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    workdir = tempfile.mkdtemp(prefix="xui-bench-")
+    _configure_environment(args, workdir)
+
+    from benchmarks.fake_vps import FakeFleet, make_client
+
+    def clients_for(i):
+        # Часть клиентов принадлежит пользователям приложения — синхронизации есть что сверять
+        return [make_client(user_id=(i * args.clients_per_server + j) % args.users + 1 if j % 2 == 0 else None)
+                for j in range(args.clients_per_server)]
+
+    fleet = FakeFleet(workdir, args.servers, clients_for=clients_for, latency=args.latency,
+                      jitter=args.jitter, failure_rate=args.failure_rate)
+    try:
+        scenarios = _scenarios(args)
+        from app import get_app, init_schema
+        init_schema()
+        with get_app().app_context():
+            # Места хватает на все создаваемые конфигурации
+            _seed(fleet, args.users, max_users=args.clients_per_server + args.requests)
+
+        results = {}
+        for name in selected:
+            print(f"[BENCH] {name}: {args.requests} calls, concurrency {args.concurrency}", flush=True)
+            results[name] = measure(scenarios[name], args.requests, args.concurrency)
+            print(f"[BENCH] {name}: {results[name]}", flush=True)
+    finally:
+        fleet_stats = fleet.stats()
+        fleet.close()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": _git_revision(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "fleet": fleet_stats,
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[BENCH] written {args.out}", flush=True)
+
+    if args.baseline:
+        _print_comparison(results, args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
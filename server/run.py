@@ -1,7 +1,9 @@
 # run.py
-from app import create_app
+from app import get_app, init_schema
 
-app = create_app()
+app = get_app()
+# Веб-процесс создаёт недостающие таблицы при старте (отдельно: flask init-db)
+init_schema(app)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
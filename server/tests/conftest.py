@@ -1,17 +1,21 @@
-F:\Education\OOP\shadow_link\server\tests\conftest.py
+# F:\Education\OOP\shadow_link\server\tests\conftest.py
 import sys, os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# env — до импорта app: общий Redis (redis_pool) создаётся при импорте
+os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')
+os.environ.setdefault('LOGSTASH_HOST', 'localhost')
+
+import fakeredis
 import pytest
 from app import create_app, db
+from app.models.server import Server
 from app.models.user import User
+from app.utils.fleet import ServerRef
+import app.utils.redis_pool as redis_pool
 from datetime import datetime
 from sqlalchemy.orm import sessionmaker, scoped_session
 
-# env
-os.environ.setdefault('REDIS_URL', 'redis://localhost:6379/0')
-os.environ.setdefault('LOGSTASH_HOST', 'localhost')
-
 @pytest.fixture(scope='session')
 def app():
     app = create_app()
@@ -57,3 +61,44 @@ def init_user(session):
     session.add(u)
     session.commit()
     return u
+
+
+@pytest.fixture
+def fake_redis_server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch, fake_redis_server):
+    """
+    Общий Redis процесса (redis_pool) поверх fakeredis с Lua: модули, их pipeline и
+    зарегистрированные скрипты работают с ним как с настоящим Redis.
+    Недоступный Redis — fake_redis_server.connected = False.
+    """
+    r = fakeredis.FakeRedis(server=fake_redis_server)
+    monkeypatch.setattr(redis_pool.redis_client, 'connection_pool', r.connection_pool)
+    if redis_pool.cached_client is not redis_pool.redis_client:
+        monkeypatch.setattr(redis_pool.cached_client, 'connection_pool', r.connection_pool)
+    return r
+
+
+@pytest.fixture
+def make_server(session):
+    """Фабрика серверов в БД: make_server('10.0.0.1', country='DE', max_users=5)."""
+    def make(host, **fields):
+        srv = Server(**{
+            'country': 'Test', 'host': host, 'port': '22', 'ssh_username': 'root', 'ssh_password': 'x',
+            'max_users': 10, 'x_ui_port': 443, 'ui_panel_link': 'http://panel', **fields,
+        })
+        session.add(srv)
+        session.commit()
+        return srv
+    return make
+
+
+def server_ref(i, **fields):
+    """ServerRef без БД — для fan_out и SSH-функций."""
+    return ServerRef(**{
+        'id': i, 'country': 'Test', 'host': f'10.0.0.{i}', 'port': 22, 'ssh_username': 'root',
+        'ssh_password': 'x', 'max_users': 10, 'x_ui_port': 443, **fields,
+    })
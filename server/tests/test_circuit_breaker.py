@@ -0,0 +1,75 @@
+# tests/test_circuit_breaker.py
+import types
+
+import pytest
+
+import app.utils.circuit_breaker as breaker
+
+
+@pytest.fixture
+def clock(monkeypatch, fake_redis):
+    now = [1000.0]
+    monkeypatch.setattr(breaker, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    monkeypatch.setattr(breaker, 'BREAKER_FAILURE_THRESHOLD', 2)
+    monkeypatch.setattr(breaker, 'BREAKER_BASE_COOLDOWN', 30)
+    monkeypatch.setattr(breaker, 'BREAKER_MAX_COOLDOWN', 100)
+    monkeypatch.setattr(breaker, 'BREAKER_PROBE_TTL', 10)
+    return now
+
+
+def _state(host='10.0.0.1'):
+    return breaker.breaker_states().get((host, '22'), {}).get('state', 'closed')
+
+
+def test_failures_open_circuit_until_cooldown(clock):
+    breaker.record_failure('10.0.0.1', 22)
+    assert _state() == 'closed' and breaker.allow('10.0.0.1', 22)
+
+    breaker.record_failure('10.0.0.1', 22)
+    assert _state() == 'open'
+    with pytest.raises(breaker.CircuitOpen):
+        breaker.guard('10.0.0.1', 22)
+    assert breaker.open_hosts([('10.0.0.1', 22), ('10.0.0.2', 22)]) == {('10.0.0.1', 22)}
+
+    clock[0] += 30
+    assert breaker.allow('10.0.0.1', 22)
+    assert _state() == 'half_open'
+
+
+def test_half_open_lets_through_single_probe(clock):
+    for _ in range(2):
+        breaker.record_failure('10.0.0.1', 22)
+    clock[0] += 30
+
+    assert breaker.allow('10.0.0.1', 22)
+    # Пока проба идёт, остальные ждут
+    assert not breaker.allow('10.0.0.1', 22)
+    assert breaker.open_hosts([('10.0.0.1', 22)]) == {('10.0.0.1', 22)}
+    # Зависшая проба истекла — пробу получает следующий
+    clock[0] += 10
+    assert breaker.allow('10.0.0.1', 22)
+
+    breaker.record_success('10.0.0.1', 22)
+    assert _state() == 'closed'
+    assert breaker.allow('10.0.0.1', 22) and breaker.allow('10.0.0.1', 22)
+
+
+def test_failed_probe_reopens_with_longer_cooldown(clock):
+    for _ in range(2):
+        breaker.record_failure('10.0.0.1', 22)
+    clock[0] += 30
+    assert breaker.allow('10.0.0.1', 22)
+
+    breaker.record_failure('10.0.0.1', 22)
+    assert _state() == 'open'
+    clock[0] += 30
+    assert not breaker.allow('10.0.0.1', 22)
+    clock[0] += 30
+    assert breaker.allow('10.0.0.1', 22)
+
+
+def test_redis_outage_does_not_block_calls(clock, fake_redis_server):
+    fake_redis_server.connected = False
+    breaker.record_failure('10.0.0.1', 22)
+    assert breaker.allow('10.0.0.1', 22)
+    assert breaker.open_hosts([('10.0.0.1', 22)]) == set()
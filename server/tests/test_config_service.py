@@ -0,0 +1,103 @@
+# tests/test_config_service.py
+import grpc
+import pytest
+
+from app.extensions import db
+from app.generated_grpc import config_service_pb2
+from app.grpc_server.context import LocalServicerContext
+from app.models.client_slot import ClientSlot
+from app.models.user_configuration import UserConfiguration
+import app.grpc_server.config_service as config_service
+import app.utils.counters as counters
+import app.utils.placement as placement
+import app.utils.slot_pool as slot_pool
+
+
+class _Task:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def delay(self, *args):
+        if self.fail:
+            raise ConnectionError('broker down')
+        self.calls.append(args)
+
+
+@pytest.fixture
+def servicer(app, monkeypatch, fake_redis):
+    monkeypatch.setattr(config_service, 'get_app', lambda: app)
+    monkeypatch.setattr(config_service, 'refill_client_slots', _Task())
+    monkeypatch.setattr(placement, 'open_hosts', lambda hosts: set())
+    monkeypatch.setattr(counters, '_last_known', {})
+    return config_service.ConfigurationServiceServicer()
+
+
+@pytest.fixture
+def vps(monkeypatch):
+    calls = {'provisioned': [], 'removed': []}
+
+    def provision(host, port, ssh_username, ssh_password, x_ui_port, clients, server_id=None):
+        calls['provisioned'] += [c['client_uuid'] for c in clients]
+        return [f"vless://{c['client_uuid']}" for c in clients]
+
+    def remove(host, port, ssh_username, ssh_password, x_ui_port, clients, server_id=None):
+        calls['removed'] += [c['client_uuid'] for c in clients]
+
+    monkeypatch.setattr(config_service, 'provision_clients', provision)
+    monkeypatch.setattr(config_service, 'remove_clients', remove)
+    return calls
+
+
+def _create(servicer, user_id, country='DE'):
+    context = LocalServicerContext()
+    response = servicer.CreateConfiguration(
+        config_service_pb2.CreateConfigRequest(user_id=user_id, country=country, months=1), context)
+    return response, context
+
+
+def test_failed_activation_enqueue_falls_back_to_ssh_path(session, init_user, make_server, servicer, vps,
+                                                          monkeypatch):
+    srv = make_server('10.0.0.1', country='DE')
+    session.add(ClientSlot(server_id=srv.id, client_uuid='slot-1', email='pool_1', config_link='vless://slot-1'))
+    session.commit()
+    monkeypatch.setattr(slot_pool, 'CLIENT_SLOT_POOL_SIZE', 1)
+    monkeypatch.setattr(config_service, 'activate_client_slot', _Task(fail=True))
+
+    response, context = _create(servicer, init_user.id)
+
+    assert context.ok
+    # Выключенный клиент из пула не выдан: слот снова свободен, конфигурация создана по SSH
+    assert response.config_link == f"vless://{vps['provisioned'][0]}"
+    assert ClientSlot.query.one().status == 'ready'
+    assert [c.config_link for c in UserConfiguration.query.all()] == [response.config_link]
+
+
+def test_client_is_removed_from_vps_when_commit_fails(session, init_user, make_server, servicer, vps,
+                                                      fake_redis, monkeypatch):
+    server_id = make_server('10.0.0.1', country='DE', max_users=5).id
+
+    def fail():
+        raise RuntimeError('db down')
+
+    monkeypatch.setattr(db.session, 'commit', fail)
+    response, context = _create(servicer, init_user.id)
+
+    assert context.code == grpc.StatusCode.INTERNAL
+    assert vps['removed'] == vps['provisioned'] and len(vps['removed']) == 1
+    assert fake_redis.zscore('placement:free:DE', str(server_id)) == 5
+
+
+def test_slot_stays_reserved_when_orphan_cannot_be_removed(session, init_user, make_server, servicer, vps,
+                                                           fake_redis, monkeypatch):
+    server_id = make_server('10.0.0.1', country='DE', max_users=5).id
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('db down')
+
+    monkeypatch.setattr(db.session, 'commit', fail)
+    monkeypatch.setattr(config_service, 'remove_clients', fail)
+    _create(servicer, init_user.id)
+
+    # Клиент остался на VPS — место занято, пока синхронизация не добавит его в БД
+    assert fake_redis.zscore('placement:free:DE', str(server_id)) == 4
@@ -0,0 +1,161 @@
+# tests/test_config_sync.py
+import hashlib
+import json
+import types
+
+import pytest
+
+from app.grpc_server.context import LocalServicerContext
+from app.generated_grpc import config_service_pb2
+from app.models.user import User
+from app.models.user_configuration import UserConfiguration
+import app.grpc_server.config_service as config_service
+import app.utils.config_sync as config_sync
+import app.utils.counters as counters
+
+
+class _FakeFleet:
+    """Клиенты x-ui по серверам; отпечаток и фильтр по user_id — как в get_vps_clients_if_changed."""
+
+    def __init__(self):
+        self.clients = {}  # server_id -> список клиентов
+        self.calls = []    # (server_id, user_id, hit)
+        self.down = set()
+
+    def add(self, server_id, uuid, user_id, months=1):
+        self.clients.setdefault(server_id, []).append({
+            'id': uuid, 'user_id': user_id, 'link': f'vless://{uuid}',
+            'months': months, 'expiryTime': 1924992000000,
+        })
+
+    def fetch(self, server_id, host, port, ssh_username, ssh_password, x_ui_port,
+              known_fingerprint=None, user_id=None):
+        if server_id in self.down:
+            raise OSError(f'{host}: connection refused')
+        clients = self.clients.get(server_id, [])
+        fingerprint = hashlib.md5(json.dumps(clients).encode()).hexdigest()
+        hit = fingerprint == known_fingerprint
+        self.calls.append((server_id, user_id, hit))
+        if hit:
+            return fingerprint, None
+        return fingerprint, [dict(c) for c in clients if user_id is None or c['user_id'] == user_id]
+
+
+@pytest.fixture
+def fleet(monkeypatch, fake_redis):
+    f = _FakeFleet()
+    monkeypatch.setattr(config_sync, 'get_vps_clients_if_changed', f.fetch)
+    monkeypatch.setattr(counters, '_last_known', {})
+    return f
+
+
+@pytest.fixture
+def sync_user(app, monkeypatch):
+    monkeypatch.setattr(config_service, 'get_app', lambda: app)
+    servicer = config_service.ConfigurationServiceServicer()
+
+    def sync(user_id):
+        context = LocalServicerContext()
+        servicer.SyncConfigurations(config_service_pb2.SyncConfigsRequest(user_id=user_id), context)
+        assert context.ok, context.details
+    return sync
+
+
+def _local(user_id):
+    return sorted(c.client_uuid for c in UserConfiguration.query.filter_by(user_id=user_id))
+
+
+def test_user_sync_skips_unchanged_server(init_user, make_server, fleet, sync_user):
+    user_id, sid = init_user.id, make_server('10.0.0.1').id
+    fleet.add(sid, 'a', user_id)
+
+    sync_user(user_id)
+    sync_user(user_id)
+
+    assert fleet.calls == [(sid, user_id, False), (sid, user_id, True)]
+    assert _local(user_id) == ['a']
+
+    # Изменение на VPS — отпечаток другой, клиенты перечитываются
+    fleet.add(sid, 'b', user_id)
+    sync_user(user_id)
+    assert fleet.calls[-1] == (sid, user_id, False)
+    assert _local(user_id) == ['a', 'b']
+
+
+def test_user_sync_restores_locally_deleted_row(session, init_user, make_server, fleet, sync_user):
+    user_id, sid = init_user.id, make_server('10.0.0.1').id
+    fleet.add(sid, 'a', user_id)
+    sync_user(user_id)
+
+    UserConfiguration.query.filter_by(client_uuid='a').delete()
+    session.commit()
+    sync_user(user_id)
+
+    # VPS не менялся, но локальная запись пропала — отпечаток не действует
+    assert fleet.calls[-1] == (sid, user_id, False)
+    assert _local(user_id) == ['a']
+
+
+def test_fleet_fingerprint_does_not_skip_user_sync(init_user, make_server, fleet, sync_user):
+    user_id, sid = init_user.id, make_server('10.0.0.1').id
+    fleet.add(sid, 'a', user_id)
+    # Общая синхронизация запомнила отпечаток флота, а запись пользователя потом удалили
+    config_sync.save_fingerprints({sid: fleet.fetch(sid, '10.0.0.1', 22, 'root', 'x', 443)[0]})
+
+    sync_user(user_id)
+
+    assert fleet.calls[-1] == (sid, user_id, False)
+    assert _local(user_id) == ['a']
+
+
+def test_fleet_sync_polls_each_server_once(session, init_user, make_server, fleet):
+    other = User(username='other', email='other@example.com', birth_date=init_user.birth_date, full_name='Other')
+    other.set_password('pass')
+    session.add(other)
+    session.commit()
+    user_id, other_id = init_user.id, other.id
+    s1, s2, s3 = (make_server(f'10.0.0.{i}').id for i in (1, 2, 3))
+    fleet.add(s1, 'a', user_id)
+    fleet.add(s1, 'b', other_id)
+    fleet.add(s2, 'c', user_id)
+    fleet.add(s2, 'manual', None)    # клиент, созданный вручную в панели
+    fleet.add(s2, 'ghost', 999)      # пользователя нет в БД
+    fleet.down.add(s3)
+
+    stats = config_sync.sync_fleet_configurations()
+
+    assert sorted(fleet.calls) == [(s1, None, False), (s2, None, False)]
+    assert (stats['answered'], stats['failed'], stats['users']) == (2, 1, 3)
+    assert _local(user_id) == ['a', 'c'] and _local(other_id) == ['b']
+
+
+def test_unchanged_servers_are_deferred(init_user, make_server, fleet, monkeypatch):
+    user_id = init_user.id
+    s1, s2 = make_server('10.0.0.1').id, make_server('10.0.0.2').id
+    fleet.add(s1, 'a', user_id)
+    fleet.add(s2, 'b', user_id)
+    now = [1000.0]
+    monkeypatch.setattr(config_sync, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    monkeypatch.setattr(config_sync, 'SYNC_IDLE_BASE_INTERVAL', 60)
+
+    config_sync.sync_fleet_configurations()
+    fleet.add(s2, 'c', user_id)
+    stats = config_sync.sync_fleet_configurations()
+
+    # s1 не менялся — отпечаток совпал, и следующий опрос отложен на базовый интервал
+    assert (stats['unchanged'], stats['answered']) == (1, 1)
+    assert sorted(fleet.calls[2:]) == [(s1, None, True), (s2, None, False)]
+    fleet.calls.clear()
+    stats = config_sync.sync_fleet_configurations()
+    assert stats['deferred'] == 1 and [c[0] for c in fleet.calls] == [s2]
+
+    # Второй пустой цикл подряд — пауза удваивается
+    now[0] += 60
+    fleet.calls.clear()
+    config_sync.sync_fleet_configurations()
+    assert sorted(fleet.calls) == [(s1, None, True), (s2, None, True)]
+    now[0] += 60
+    assert config_sync.deferred_servers([s1, s2]) == {s1, s2}
+    now[0] += 60
+    assert config_sync.deferred_servers([s1, s2]) == set()
+    assert _local(user_id) == ['a', 'b', 'c']
@@ -0,0 +1,65 @@
+# tests/test_counters.py
+import time
+from datetime import datetime
+import pytest
+
+import app.utils.redis_pool as redis_pool
+from app.models.user_configuration import UserConfiguration
+import app.utils.counters as counters
+
+
+@pytest.fixture
+def counters_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(counters, '_last_known', {})
+    return fake_redis
+
+
+def _config(session, user_id, server_id, cuuid):
+    session.add(UserConfiguration(user_id=user_id, server_id=server_id, client_uuid=cuuid,
+                                  config_link='vless://x', expiration_date=datetime(2030, 1, 1), months=1))
+    session.commit()
+
+
+def test_config_counts_fill_misses_from_db(session, init_user, counters_redis, make_server, monkeypatch):
+    s1 = make_server('10.0.0.1')
+    s2 = make_server('10.0.0.2')
+    s3 = make_server('10.0.0.3')
+    _config(session, init_user.id, s2.id, 'u0')
+    _config(session, init_user.id, s2.id, 'u1')
+    counters_redis.set(f'server:{s1.id}:active_config_count', 7)
+    counters_redis.set(f'server:{s1.id}:active_config_count:refresh', f'{time.time() + 300}:0.01')
+    mgets = []
+    mget = redis_pool.redis_client.mget
+    monkeypatch.setattr(redis_pool.redis_client, 'mget', lambda keys: mgets.append(keys) or mget(keys))
+
+    counts = counters.get_config_counts([s1.id, s2.id, s3.id])
+
+    # s1 из кеша, s2 и s3 — одним запросом к БД и записаны обратно
+    assert counts == {s1.id: 7, s2.id: 2, s3.id: 0}
+    assert len(mgets) == 1
+    assert counters_redis.get(f'server:{s2.id}:active_config_count') == b'2'
+    assert counters_redis.get(f'server:{s3.id}:active_config_count') == b'0'
+    assert counters_redis.keys('*:lock') == []
+
+
+def test_stale_count_served_while_another_caller_refreshes(session, init_user, counters_redis, make_server):
+    s1 = make_server('10.0.0.1')
+    _config(session, init_user.id, s1.id, 'u0')
+    # Срок свежести истёк, а пересчёт уже делает другой запрос
+    counters_redis.set(f'server:{s1.id}:active_config_count', 5)
+    counters_redis.set(f'server:{s1.id}:active_config_count:lock', 1)
+
+    assert counters.get_config_counts([s1.id]) == {s1.id: 5}
+
+    # Блокировка освободилась — устаревшее значение пересчитывается
+    counters_redis.delete(f'server:{s1.id}:active_config_count:lock')
+    assert counters.get_config_counts([s1.id]) == {s1.id: 1}
+
+
+def test_redis_outage_serves_last_known_counts(session, init_user, counters_redis, fake_redis_server, make_server):
+    s1 = make_server('10.0.0.1')
+    assert counters.get_config_counts([s1.id]) == {s1.id: 0}
+    _config(session, init_user.id, s1.id, 'u0')
+
+    fake_redis_server.connected = False
+    assert counters.get_config_counts([s1.id]) == {s1.id: 0}
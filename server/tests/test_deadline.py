@@ -0,0 +1,38 @@
+# tests/test_deadline.py
+import time
+import pytest
+
+from app.utils.deadline import DeadlineExceeded, check, deadline_scope, remaining, timeout_for
+from conftest import server_ref
+from app.utils.fleet import fan_out, FanOutTimeout
+
+
+def test_nested_scope_cannot_extend_outer_deadline():
+    assert remaining() is None
+    with deadline_scope(1):
+        with deadline_scope(100):
+            assert remaining() <= 1
+            assert timeout_for(60) <= 1
+        with deadline_scope(0):
+            with pytest.raises(DeadlineExceeded):
+                check()
+    assert remaining() is None
+
+
+def test_fan_out_propagates_deadline_to_workers():
+    seen = {}
+
+    def fn(srv):
+        seen[srv.id] = remaining()
+        if srv.id == 2:
+            time.sleep(1)
+        return srv.id
+
+    started = time.monotonic()
+    with deadline_scope(0.3):
+        results, errors = fan_out([server_ref(1), server_ref(2)], fn, timeout=20)
+
+    assert results == {1: 1}
+    assert isinstance(errors[2], FanOutTimeout)
+    assert 0 < seen[1] <= 0.3
+    assert time.monotonic() - started < 1
@@ -0,0 +1,36 @@
+# tests/test_fleet.py
+import time
+from conftest import server_ref
+from app.utils.fleet import fan_out, FanOutTimeout
+
+
+def test_fan_out_returns_partial_results():
+    def fn(srv):
+        if srv.id == 2:
+            raise RuntimeError('ssh down')
+        if srv.id == 3:
+            time.sleep(2)
+        return srv.id * 10
+
+    started = time.monotonic()
+    results, errors = fan_out([server_ref(1), server_ref(2), server_ref(3)], fn, timeout=0.5)
+    elapsed = time.monotonic() - started
+
+    assert results == {1: 10}
+    assert isinstance(errors[2], RuntimeError)
+    assert isinstance(errors[3], FanOutTimeout)
+    # ждём самый медленный сервер не дольше таймаута, а не сумму всех
+    assert elapsed < 1.5
+
+
+def test_fan_out_runs_servers_concurrently():
+    def fn(srv):
+        time.sleep(0.3)
+        return srv.id
+
+    started = time.monotonic()
+    results, errors = fan_out([server_ref(i) for i in range(1, 6)], fn, timeout=5)
+
+    assert errors == {}
+    assert sorted(results) == [1, 2, 3, 4, 5]
+    assert time.monotonic() - started < 1.0
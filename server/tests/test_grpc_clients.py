@@ -0,0 +1,60 @@
+# tests/test_grpc_clients.py
+import pytest
+
+import app.utils.grpc_clients as grpc_clients
+
+
+class _Channel:
+    def __init__(self, target):
+        self.target = target
+        self.closed = False
+
+    def unary_unary(self, *args, **kwargs):
+        return None
+
+    unary_stream = unary_unary
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def channels(monkeypatch):
+    created = []
+
+    def insecure_channel(target, options=None):
+        created.append(_Channel(target))
+        return created[-1]
+
+    monkeypatch.setattr(grpc_clients.grpc, 'insecure_channel', insecure_channel)
+    monkeypatch.setattr(grpc_clients, 'GRPC_SERVER_HOST', 'grpc-a, grpc-b:6000')
+    return created
+
+
+def test_stubs_share_channels_round_robin(channels):
+    manager = grpc_clients.GrpcClientManager()
+
+    stubs = [manager.server_stub() for _ in range(4)]
+
+    assert [c.target for c in channels] == ['dns:///grpc-a:50051', 'dns:///grpc-b:6000']
+    assert stubs[0] is stubs[2] and stubs[1] is stubs[3] and stubs[0] is not stubs[1]
+
+
+def test_channels_are_rebuilt_after_fork(channels, monkeypatch):
+    manager = grpc_clients.GrpcClientManager()
+    parent_stub = manager.server_stub()
+    parent_channels = list(channels)
+
+    # Дочерний процесс (gunicorn/celery prefork) наследует менеджер с каналами родителя
+    child_pid = manager._pid + 1
+    monkeypatch.setattr(grpc_clients.os, 'getpid', lambda: child_pid)
+    manager.close_all()
+    child_stub = manager.server_stub()
+
+    assert child_stub is not parent_stub
+    assert len(channels) == 4
+    # Каналы родителя не закрываются из дочернего процесса
+    assert not any(c.closed for c in parent_channels)
+
+    manager.close_all()
+    assert all(c.closed for c in channels[2:])
@@ -0,0 +1,95 @@
+# tests/test_list_servers.py
+import grpc
+import pytest
+from google.protobuf import field_mask_pb2
+
+from app.generated_grpc import server_service_pb2
+from app.grpc_server.context import LocalServicerContext
+import app.grpc_server.server_service as server_service
+
+
+@pytest.fixture
+def servicer(app, monkeypatch):
+    monkeypatch.setattr(server_service, 'get_app', lambda: app)
+    monkeypatch.setattr(server_service, 'get_config_counts', lambda ids: {sid: 3 for sid in ids})
+    return server_service.ServerServiceServicer()
+
+
+@pytest.fixture
+def servers(make_server):
+    def add(n, country='Test'):
+        for i in range(n):
+            make_server(f'10.0.0.{i}', country=country, ssh_password='secret')
+    return add
+
+
+def test_list_servers_pages_with_field_mask(servicer, servers):
+    servers(5)
+    servers(2, country='Other')
+    mask = field_mask_pb2.FieldMask(paths=['id', 'host', 'users_count'])
+
+    hosts, token = [], ''
+    while True:
+        res = servicer.ListServers(server_service_pb2.ListServersRequest(
+            country='Test', page_size=2, page_token=token, read_mask=mask), LocalServicerContext())
+        hosts += [s.host for s in res.servers]
+        assert all(s.ssh_password == '' and s.users_count == 3 for s in res.servers)
+        token = res.next_page_token
+        if not token:
+            break
+
+    assert hosts == [f'10.0.0.{i}' for i in range(5)]
+
+
+def test_list_servers_rejects_unknown_field_and_foreign_token(servicer, servers):
+    servers(3)
+    context = LocalServicerContext()
+    servicer.ListServers(server_service_pb2.ListServersRequest(
+        read_mask=field_mask_pb2.FieldMask(paths=['password'])), context)
+    assert context.code == grpc.StatusCode.INVALID_ARGUMENT
+
+    first = servicer.ListServers(server_service_pb2.ListServersRequest(page_size=1), LocalServicerContext())
+    context = LocalServicerContext()
+    servicer.ListServers(server_service_pb2.ListServersRequest(
+        country='Other', page_token=first.next_page_token), context)
+    assert context.code == grpc.StatusCode.INVALID_ARGUMENT
+
+
+def test_stream_servers_yields_whole_fleet(servicer, servers, monkeypatch):
+    monkeypatch.setattr(server_service, 'STREAM_BATCH_SIZE', 2)
+    servers(5)
+    infos = list(servicer.StreamServers(server_service_pb2.ListServersRequest(), LocalServicerContext()))
+    assert [s.host for s in infos] == [f'10.0.0.{i}' for i in range(5)]
+
+
+def test_credentials_are_returned_only_when_requested(servicer, servers):
+    servers(1)
+    default, = servicer.ListServers(server_service_pb2.ListServersRequest(), LocalServicerContext()).servers
+    assert (default.host, default.ssh_username, default.ssh_password) == ('10.0.0.0', '', '')
+
+    mask = field_mask_pb2.FieldMask(paths=['id', 'ssh_username', 'ssh_password'])
+    explicit, = servicer.ListServers(server_service_pb2.ListServersRequest(read_mask=mask),
+                                     LocalServicerContext()).servers
+    assert (explicit.ssh_username, explicit.ssh_password) == ('root', 'secret')
+
+
+def test_rest_default_fields_exclude_credentials(client, session, init_user, servicer, servers, monkeypatch):
+    from flask_jwt_extended import create_access_token
+    import app.routes.servers as servers_route
+
+    class _Stub:
+        def ListServers(self, request, timeout=None):
+            return servicer.ListServers(request, LocalServicerContext())
+
+    monkeypatch.setattr(servers_route, 'server_stub', lambda: _Stub())
+    init_user.role = 'admin'
+    session.commit()
+    servers(1)
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(init_user.id))}'}
+
+    server, = client.get('/api/servers', headers=headers).get_json()
+    assert 'ssh_password' not in server and 'ssh_username' not in server
+    assert server['host'] == '10.0.0.0' and server['users_count'] == 3
+
+    server, = client.get('/api/servers?fields=id,ssh_password', headers=headers).get_json()
+    assert server == {'id': server['id'], 'ssh_password': 'secret'}
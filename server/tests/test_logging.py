@@ -0,0 +1,109 @@
+# tests/test_logging.py
+import logging
+import socket
+import threading
+import time
+
+import app.logging_config as logging_config
+from app.logging_config import LogstashJSONHandler
+
+
+def _record(msg):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, None, None)
+
+
+def test_records_are_batched_over_one_connection():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    received, connections = [], []
+
+    def accept():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            connections.append(conn)
+            with conn:
+                while chunk := conn.recv(65536):
+                    received.append(chunk)
+
+    threading.Thread(target=accept, daemon=True).start()
+
+    handler = LogstashJSONHandler("127.0.0.1", server.getsockname()[1], batch_size=10, flush_interval=0.05)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    for i in range(25):
+        handler.emit(_record(f"line {i}"))
+    handler.flush()
+    handler.close()
+    server.close()
+
+    lines = b"".join(received).decode().splitlines()
+    assert lines == [f"line {i}" for i in range(25)]
+    assert len(connections) == 1
+    assert handler.sent == 25 and handler.dropped == 0
+
+
+def test_full_buffer_drops_oldest_without_blocking():
+    # Порт без слушателя: отправка не удаётся, emit при этом не ждёт сеть
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    handler = LogstashJSONHandler("127.0.0.1", port, queue_size=5, batch_size=100, flush_interval=60)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    for i in range(8):
+        handler.emit(_record(f"line {i}"))
+
+    assert handler.dropped == 3
+    assert list(handler._buffer) == [f"line {i}\n" for i in range(3, 8)]
+    handler.close()
+
+
+def test_backoff_bounds_reconnects_to_closed_port(monkeypatch):
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    attempts = []
+    connect = socket.create_connection
+
+    def counting_connect(*args, **kwargs):
+        attempts.append(time.monotonic())
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(logging_config.socket, "create_connection", counting_connect)
+    handler = LogstashJSONHandler("127.0.0.1", port, batch_size=1, flush_interval=0.01)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    # Поток записей будит отправителя, но не должен сокращать паузу 0.5 → 1.0 → 2.0 с
+    deadline = time.monotonic() + 2.0
+    while time.monotonic() < deadline:
+        handler.emit(_record("line"))
+        time.sleep(0.001)
+    handler.close()
+
+    assert 2 <= len(attempts) <= 4
+
+
+def test_partially_sent_batch_is_not_resent():
+    class _HalfSocket:
+        def __init__(self):
+            self.calls = 0
+
+        def send(self, data):
+            self.calls += 1
+            if self.calls == 1:
+                return len(b"line 0\nli")  # первая запись целиком, вторая — частично
+            raise ConnectionResetError("reset")
+
+    handler = LogstashJSONHandler("127.0.0.1", 1)
+    handler._sock = _HalfSocket()
+    try:
+        handler._send(["line 0\n", "line 1\n", "line 2\n"])
+    except OSError as e:
+        assert e.records_sent == 1
+    else:
+        raise AssertionError("send must fail")
@@ -0,0 +1,64 @@
+# tests/test_periodic.py
+import app.utils.config_sync as config_sync
+import app.utils.periodic as periodic
+
+
+def test_periodic_runs_once_and_waits_for_interval(fake_redis):
+    calls = []
+
+    @periodic.periodic("job", min_interval=60, max_interval=600, activity=lambda r: r)
+    def job():
+        calls.append(1)
+        # Пока задача работает, второй экземпляр не стартует
+        assert job() is None
+        return 0.0
+
+    assert job() == 0.0
+    assert calls == [1]
+    assert not fake_redis.exists("periodic:job:lease")
+
+    # Срок следующего запуска ещё не подошёл
+    assert job() is None
+    assert calls == [1]
+    state = fake_redis.hgetall("periodic:job:state")
+    assert float(state[b"interval"]) == 600  # ничего не изменилось — максимальный интервал
+
+
+
+def test_targeted_call_shares_lease_but_not_schedule(fake_redis):
+    @periodic.periodic("job2", min_interval=60, max_interval=600)
+    def job2(country=None):
+        if country == "DE":
+            # Во время точечного запуска полный не стартует, и наоборот
+            assert job2() is None
+            assert job2(country="FI") is None
+        return country
+
+    # Точечный вызов выполняется сразу и расписание не трогает
+    assert job2(country="DE") == "DE"
+    assert not fake_redis.exists("periodic:job2:state")
+    assert not fake_redis.exists("periodic:job2:lease")
+
+    fake_redis.set("periodic:job2:lease", "other-worker")
+    assert job2(country="FI") is None
+
+
+def test_next_interval_adapts_to_activity_and_duration():
+    assert periodic.next_interval({"activity": 1.0, "duration": 1}, 60, 600) == 60
+    assert periodic.next_interval({"activity": 0.0, "duration": 1}, 60, 600) == 600
+    assert periodic.next_interval({"activity": 0.5, "duration": 1}, 60, 600) == 330
+    # Долгий прогон раздвигает интервал, даже если всё меняется
+    assert periodic.next_interval({"activity": 1.0, "duration": 100}, 60, 600) == 100 * periodic.PERIODIC_DUTY_FACTOR
+
+
+def test_idle_servers_are_polled_less_often(fake_redis):
+    now = 1000.0
+    config_sync.update_cadence(unchanged=[1, 2], changed=[3], now=now)
+    assert config_sync.deferred_servers([1, 2, 3], now=now + 1) == {1, 2}
+    assert config_sync.deferred_servers([1, 2, 3], now=now + config_sync.SYNC_IDLE_BASE_INTERVAL) == set()
+
+    # Второй пустой цикл подряд — пауза удваивается, изменение сбрасывает её
+    later = now + config_sync.SYNC_IDLE_BASE_INTERVAL
+    config_sync.update_cadence(unchanged=[1], changed=[2], now=later)
+    assert config_sync.deferred_servers([1, 2], now=later + config_sync.SYNC_IDLE_BASE_INTERVAL) == {1}
+    assert config_sync.deferred_servers([1, 2], now=later + 2 * config_sync.SYNC_IDLE_BASE_INTERVAL) == set()
@@ -0,0 +1,77 @@
+# tests/test_placement.py
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import app.utils.placement as placement
+
+
+@pytest.fixture
+def free_slots(monkeypatch, fake_redis):
+    """Свободные слоты «по БД»; чтение медленное, чтобы параллельные перестроения пересекались."""
+    slots = {1: 3, 2: 2}
+    reads = []
+
+    def read(country):
+        reads.append(country)
+        time.sleep(0.01)
+        return dict(slots)
+
+    monkeypatch.setattr(placement, '_free_slots', read)
+    return slots, reads
+
+
+def test_concurrent_reservations_never_overbook(free_slots):
+    slots, _ = free_slots
+    results = []
+    barrier = threading.Barrier(12)
+
+    def reserve():
+        barrier.wait()
+        results.append(placement.reserve_server('DE'))
+
+    # Индекса ещё нет: перестроение и резервирования идут одновременно
+    threads = [threading.Thread(target=reserve) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    taken = Counter(r for r in results if r is not None)
+    assert taken == Counter(slots)
+    assert results.count(None) == 12 - sum(slots.values())
+
+
+def test_rebuild_does_not_overwrite_live_index(free_slots, fake_redis):
+    assert placement.reserve_server('DE') == 1
+    # Перестроение по снимку БД (например, после истёкшей блокировки) не возвращает занятый слот
+    placement.rebuild_placement_index('DE')
+    assert fake_redis.zscore('placement:free:DE', '1') == 2
+    assert 0 < fake_redis.ttl('placement:free:DE') <= placement.PLACEMENT_INDEX_TTL
+
+
+def test_invalidation_during_rebuild_discards_stale_snapshot(free_slots, monkeypatch, fake_redis):
+    slots, reads = free_slots
+    read = placement._free_slots
+
+    def read_then_invalidate(country):
+        # Пока читаем БД, администратор уменьшил max_users и сбросил индекс
+        result = read(country)
+        if len(reads) == 1:
+            slots[1] = 0
+            placement.invalidate_placement_index(country)
+        return result
+
+    monkeypatch.setattr(placement, '_free_slots', read_then_invalidate)
+    assert placement.reserve_server('DE') == 2
+    assert len(reads) == 2
+    assert fake_redis.zscore('placement:free:DE', '1') == 0
+
+
+def test_country_without_servers_has_no_placement(free_slots):
+    slots, reads = free_slots
+    slots.clear()
+    assert placement.reserve_server('DE') is None
+    assert len(reads) == 1
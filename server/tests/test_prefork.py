@@ -0,0 +1,101 @@
+# tests/test_prefork.py
+import os
+import signal
+import threading
+import time
+from multiprocessing.connection import wait as real_wait
+
+import pytest
+
+import app.grpc_server.prefork as prefork
+
+
+class _Process:
+    """Воркер без процесса: sentinel — конец pipe, который «закрывается», когда воркер завершился."""
+
+    def __init__(self, log, target=None, args=(), daemon=None):
+        self.log = log
+        self.pid = None
+        self.exitcode = None
+        self.sentinel, self._w = os.pipe()
+
+    def start(self):
+        self.pid = len([e for e in self.log if e[0] == 'start']) + 1
+        self.log.append(('start', self.pid))
+
+    def is_alive(self):
+        return self.exitcode is None
+
+    def exit(self, code):
+        self.exitcode = code
+        os.close(self._w)
+
+    def terminate(self):
+        self.log.append(('stop', self.pid))
+        self.exit(-signal.SIGTERM)
+
+    def kill(self):
+        self.exit(-signal.SIGKILL)
+
+    def join(self, timeout=None):
+        pass
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    log, procs = [], []
+
+    class _Ctx:
+        def Process(self, **kwargs):
+            procs.append(_Process(log, **kwargs))
+            return procs[-1]
+
+    monkeypatch.setattr(prefork, '_ctx', _Ctx())
+    monkeypatch.setattr(prefork, 'wait', lambda objects, timeout=None: real_wait(objects, timeout=0.02))
+    monkeypatch.setattr(prefork, 'RESTART_BACKOFF', 0)
+    handlers = {s: signal.getsignal(s) for s in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)}
+    yield prefork.Supervisor('app.grpc_server.config_service', workers=2), log, procs
+    for s, handler in handlers.items():
+        signal.signal(s, handler)
+    for proc in procs:
+        os.close(proc.sentinel)
+        if proc.is_alive():
+            os.close(proc._w)
+
+
+def _run_until(sup, *steps):
+    """Запускает супервизор; каждый шаг — (условие по журналу, действие), в конце — SIGTERM."""
+    def drive():
+        for condition, action in steps:
+            deadline = time.monotonic() + 5
+            while not condition() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            action()
+    driver = threading.Thread(target=drive)
+    driver.start()
+    sup.run()
+    driver.join()
+
+
+def test_sighup_restarts_workers_one_by_one(supervisor):
+    sup, log, _ = supervisor
+    hup = lambda: os.kill(os.getpid(), signal.SIGHUP)
+    term = lambda: os.kill(os.getpid(), signal.SIGTERM)
+
+    _run_until(sup, (lambda: len(log) == 2, hup), (lambda: len(log) == 6, term))
+
+    # Новый воркер стартует до остановки старого — на порту всегда не меньше двух
+    assert log == [('start', 1), ('start', 2),
+                   ('start', 3), ('stop', 1), ('start', 4), ('stop', 2),
+                   ('stop', 3), ('stop', 4)]
+    assert sup.procs == {}
+
+
+def test_crashed_worker_is_replaced(supervisor):
+    sup, log, procs = supervisor
+    crash = lambda: procs[0].exit(1)
+    term = lambda: os.kill(os.getpid(), signal.SIGTERM)
+
+    _run_until(sup, (lambda: len(log) == 2, crash), (lambda: len(log) == 3, term))
+
+    assert log == [('start', 1), ('start', 2), ('start', 3), ('stop', 2), ('stop', 3)]
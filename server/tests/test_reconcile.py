@@ -0,0 +1,52 @@
+# tests/test_reconcile.py
+from datetime import datetime
+
+from app.models.user_configuration import UserConfiguration
+import app.utils.reconcile as reconcile
+
+
+def _entry(cuuid, server_id, user_id, link='vless://new', months=3):
+    return {'id': cuuid, 'server_id': server_id, 'user_id': user_id,
+            'link': link, 'months': months, 'expiryTime': 1924992000000}
+
+
+def test_reconcile_upserts_deletes_and_counts(session, init_user, fake_redis, make_server):
+    s1 = make_server('10.0.0.1')
+    s2 = make_server('10.0.0.2')
+    for cuuid, sid in (('stale', s1.id), ('keep', s1.id), ('offline', s2.id)):
+        session.add(UserConfiguration(user_id=init_user.id, server_id=sid, client_uuid=cuuid,
+                                      config_link='vless://old', expiration_date=datetime(2030, 1, 1), months=1))
+    session.commit()
+
+    entries = [_entry('keep', s1.id, init_user.id), _entry('fresh', s1.id, init_user.id)]
+    # s2 не ответил — его записи не трогаем
+    result = reconcile.reconcile_configurations(entries, {s1.id}, user_id=init_user.id)
+
+    assert (result.added, result.updated, result.removed) == (1, 1, 1)
+    rows = {c.client_uuid: c for c in UserConfiguration.query.all()}
+    assert set(rows) == {'keep', 'fresh', 'offline'}
+    assert rows['keep'].config_link == 'vless://new'
+    assert rows['keep'].months == 3
+    assert rows['fresh'].created_at is not None
+    assert result.counts == {s1.id: 2}
+    assert fake_redis.get(f'server:{s1.id}:active_config_count') == b'2'
+
+
+def test_reconcile_respects_sqlite_variable_limit(session, init_user, fake_redis, make_server):
+    import sqlite3
+    s1 = make_server('10.0.0.1')
+    # Классический лимит SQLite (SQLITE_MAX_VARIABLE_NUMBER = 999): больше 142 строк по 7 колонок не влезет
+    raw = session.connection().connection.dbapi_connection
+    previous = raw.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    try:
+        entries = [_entry(f'u{i}', s1.id, init_user.id) for i in range(300)]
+        result = reconcile.reconcile_configurations(entries, {s1.id}, user_id=init_user.id)
+        assert result.added == 300
+        assert UserConfiguration.query.count() == 300
+
+        # На VPS остался один другой клиент — 300 записей удаляются пачками
+        result = reconcile.reconcile_configurations([_entry('other', s1.id, init_user.id)], {s1.id},
+                                                    user_id=init_user.id)
+        assert result.removed == 300
+    finally:
+        raw.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, previous)
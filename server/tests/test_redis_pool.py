@@ -0,0 +1,44 @@
+# tests/test_redis_pool.py
+import redis
+
+import app.utils.redis_pool as redis_pool
+
+
+def test_batches_are_split_into_chunks(monkeypatch, fake_redis):
+    monkeypatch.setattr(redis_pool, 'REDIS_PIPELINE_CHUNK', 2)
+    r = redis_pool.redis_client
+    pipelines, mgets = [], []
+
+    pipeline = r.pipeline
+
+    def counting_pipeline(transaction=True):
+        assert transaction is False
+        pipe = pipeline(transaction=transaction)
+        execute = pipe.execute
+        pipe.execute = lambda: pipelines.append(len(pipe.command_stack)) or execute()
+        return pipe
+
+    mget = r.mget
+    monkeypatch.setattr(r, 'pipeline', counting_pipeline)
+    monkeypatch.setattr(r, 'mget', lambda keys: mgets.append(len(keys)) or mget(keys))
+
+    redis_pool.set_many([(f'k{i}', i, 60 if i % 2 else None) for i in range(5)])
+    assert pipelines == [2, 2, 1]
+    assert fake_redis.get('k1') == b'1' and fake_redis.ttl('k1') == 60
+    assert fake_redis.get('k2') == b'2' and fake_redis.ttl('k2') == -1
+
+    assert redis_pool.mget_many(['k0', 'missing', 'k4']) == [b'0', None, b'4']
+    assert mgets == [2, 1]
+
+
+def test_clients_share_configured_pool(monkeypatch):
+    pool = redis_pool.redis_client.connection_pool
+    assert isinstance(pool, redis.BlockingConnectionPool)
+    assert pool.max_connections == redis_pool.REDIS_MAX_CONNECTIONS
+    assert pool.connection_kwargs['socket_timeout'] == redis_pool.REDIS_SOCKET_TIMEOUT
+    # Кеш на стороне клиента выключен по умолчанию — читают тем же клиентом
+    assert redis_pool.cached_client is redis_pool.redis_client
+
+    cached = redis_pool._make_cached_client()
+    assert cached.connection_pool.connection_kwargs['protocol'] == 3
+    assert cached.connection_pool.cache is not None
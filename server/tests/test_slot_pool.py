@@ -0,0 +1,112 @@
+# tests/test_slot_pool.py
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app.models.client_slot import ClientSlot
+from app.models.user_configuration import UserConfiguration
+from app.utils.vps_data import ClientNotFound
+import app.utils.placement as placement
+import app.utils.slot_pool as slot_pool
+
+
+@pytest.fixture
+def pool(monkeypatch, fake_redis):
+    monkeypatch.setattr(slot_pool, 'CLIENT_SLOT_POOL_SIZE', 3)
+    monkeypatch.setattr(placement, 'open_hosts', lambda hosts: set())
+    provisioned = []
+
+    def provision(host, port, ssh_username, ssh_password, x_ui_port, clients, server_id=None):
+        provisioned.append((server_id, len(clients)))
+        return [f"vless://{c['client_uuid']}@{host}" for c in clients]
+
+    monkeypatch.setattr(slot_pool, 'provision_clients', provision)
+    return provisioned
+
+
+def _slot(session, server_id, i, status='ready'):
+    slot = ClientSlot(server_id=server_id, client_uuid=f'slot-{i}', email=f'pool_{i}',
+                      config_link=f'vless://slot-{i}', status=status)
+    session.add(slot)
+    session.commit()
+    return slot
+
+
+def test_ready_slot_query_skips_locked_rows():
+    sql = str(slot_pool._ready_slot_query('DE').statement.compile(dialect=postgresql.dialect()))
+    assert sql.endswith('FOR UPDATE OF client_slots SKIP LOCKED')
+
+
+def test_claims_take_distinct_slots_until_pool_is_empty(session, init_user, make_server, pool):
+    srv = make_server('10.0.0.1', country='DE')
+    _slot(session, srv.id, 1)
+    _slot(session, srv.id, 2)
+    make_server('10.0.0.2', country='FI')
+
+    first = slot_pool.claim_client_slot('DE', init_user.id, 3)
+    second = slot_pool.claim_client_slot('DE', init_user.id, 1)
+
+    assert first.slot_id != second.slot_id
+    assert slot_pool.claim_client_slot('DE', init_user.id, 1) is None
+    assert {c.client_uuid for c in UserConfiguration.query.all()} == {'slot-1', 'slot-2'}
+    assert {s.status for s in ClientSlot.query.all()} == {'claimed'}
+
+
+def test_released_claim_returns_slot_to_pool(session, init_user, make_server, pool):
+    srv = make_server('10.0.0.1', country='DE')
+    _slot(session, srv.id, 1)
+    claimed = slot_pool.claim_client_slot('DE', init_user.id, 1)
+
+    slot_pool.release_claimed_slot(claimed.slot_id)
+
+    assert ClientSlot.query.get(claimed.slot_id).status == 'ready'
+    assert UserConfiguration.query.count() == 0
+    assert slot_pool.claim_client_slot('DE', init_user.id, 1).slot_id == claimed.slot_id
+
+
+def test_refill_provisions_one_batch_per_server(session, make_server, pool, fake_redis):
+    s1 = make_server('10.0.0.1', country='DE', max_users=2)
+    s2 = make_server('10.0.0.2', country='DE', max_users=5)
+    _slot(session, s2.id, 0)
+
+    # Готов один слот из трёх: не хватает двух, оба — на менее загруженном s2
+    assert slot_pool.refill_country('DE') == 2
+    assert pool == [(s2.id, 2)]
+    assert ClientSlot.query.filter_by(server_id=s2.id, status='ready').count() == 3
+    # Слоты заняли место в индексе размещения, блокировка пополнения снята
+    assert fake_redis.zscore('placement:free:DE', str(s2.id)) == 2
+    assert fake_redis.zscore('placement:free:DE', str(s1.id)) == 2
+    assert not fake_redis.exists('slots:refill:DE')
+    # Пул полон — повторное пополнение ничего не делает
+    assert slot_pool.refill_country('DE') == 0
+
+
+def test_failed_refill_returns_reserved_places(session, make_server, pool, fake_redis, monkeypatch):
+    server_id = make_server('10.0.0.1', country='DE', max_users=5).id
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('ssh down')
+
+    monkeypatch.setattr(slot_pool, 'provision_clients', fail)
+    assert slot_pool.refill_country('DE') == 0
+    assert ClientSlot.query.count() == 0
+    assert fake_redis.zscore('placement:free:DE', str(server_id)) == 5
+
+
+def test_activation_keeps_slot_when_client_is_missing(session, init_user, make_server, pool, monkeypatch):
+    srv = make_server('10.0.0.1', country='DE')
+    _slot(session, srv.id, 1)
+    claimed = slot_pool.claim_client_slot('DE', init_user.id, 1)
+    activated = []
+
+    def missing(*args, **kwargs):
+        raise ClientNotFound('slot-1')
+
+    monkeypatch.setattr(slot_pool, 'activate_client', missing)
+    with pytest.raises(ClientNotFound):
+        slot_pool.activate_claimed_slot(claimed.slot_id)
+    assert ClientSlot.query.get(claimed.slot_id).status == 'claimed'
+
+    monkeypatch.setattr(slot_pool, 'activate_client', lambda *args, **kwargs: activated.append(args[5:]))
+    slot_pool.activate_claimed_slot(claimed.slot_id)
+    assert activated == [('slot-1', 'pool_1', init_user.id, 1)]
+    assert ClientSlot.query.get(claimed.slot_id) is None
@@ -0,0 +1,47 @@
+# tests/test_ssh_metrics.py
+import io
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.utils.ssh_metrics import ssh_operation
+from app.utils.vps_data import ssh_exec
+
+
+class _FakeChannel:
+    def recv_exit_status(self):
+        return 0
+
+
+class _FakeStream(io.BytesIO):
+    channel = _FakeChannel()
+
+
+class _FakeSSH:
+    def exec_command(self, cmd, timeout=None):
+        return None, _FakeStream(b"42\n"), _FakeStream(b"")
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_operation_labels_exec_bytes_and_errors():
+    labels = dict(operation="test_op", server_id="7")
+
+    @ssh_operation("test_op")
+    def op(host, port, fail=False):
+        out, _ = ssh_exec(_FakeSSH(), "echo 42")
+        if fail:
+            raise ValueError("bad output")
+        return out
+
+    before = _value("vps_ssh_duration_seconds_count", phase="exec", **labels)
+    assert op("10.0.0.1", 22, server_id=7) == "42"
+    assert _value("vps_ssh_duration_seconds_count", phase="exec", **labels) == before + 1
+    assert _value("vps_ssh_bytes_total", direction="sent", **labels) >= len("echo 42")
+    assert _value("vps_ssh_bytes_total", direction="received", **labels) >= len("42\n")
+
+    with pytest.raises(ValueError):
+        op(host="10.0.0.1", port=22, fail=True, server_id=7)
+    assert _value("vps_ssh_errors_total", error="ValueError", **labels) == 1
@@ -0,0 +1,138 @@
+# tests/test_ssh_pool.py
+import threading
+import time
+
+import pytest
+
+from app.utils.deadline import DeadlineExceeded, deadline_scope
+from app.utils.ssh_pool import SSHConnectionPool
+
+
+class _Transport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+
+class _Client:
+    def __init__(self, key):
+        self.key = key
+        self.transport = _Transport()
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+
+
+class _Pool(SSHConnectionPool):
+    """Пул без сети: _connect возвращает фиктивного клиента и запоминает подключения."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.connects = []
+
+    def _connect(self, host, port, ssh_username, ssh_password):
+        client = _Client((host, port, ssh_username))
+        self.connects.append(client)
+        return client
+
+
+@pytest.fixture
+def pool(fake_redis):
+    # fake_redis — предохранитель (guard/record_*) хранит состояние в Redis
+    return _Pool(max_idle=60, max_channels=2)
+
+
+def test_session_reuses_connection_per_host_and_user(pool):
+    with pool.session('10.0.0.1', 22, 'root', 'x') as first:
+        pass
+    with pool.session('10.0.0.1', '22', 'root', 'x') as second:
+        pass
+    with pool.session('10.0.0.1', 22, 'admin', 'x') as other:
+        pass
+
+    assert first is second and other is not first
+    assert len(pool.connects) == 2
+    assert pool.stats() == {'connections': 2, 'hosts': 2, 'channels_in_use': 0}
+
+
+def test_idle_and_dead_connections_are_replaced(pool):
+    with pool.session('10.0.0.1', 22, 'root', 'x') as idle:
+        pass
+    with pool.session('10.0.0.2', 22, 'root', 'x') as dead:
+        pass
+
+    pool._connections[('10.0.0.1', 22, 'root')].last_used -= 61
+    dead.transport.active = False
+    pool.evict_idle()
+
+    assert idle.closed and dead.closed
+    assert pool.stats()['connections'] == 0
+    with pool.session('10.0.0.1', 22, 'root', 'x') as fresh:
+        assert fresh is not idle
+    assert len(pool.connects) == 3
+
+
+def test_transport_error_discards_connection(pool):
+    with pytest.raises(EOFError):
+        with pool.session('10.0.0.1', 22, 'root', 'x') as broken:
+            raise EOFError('connection reset')
+
+    assert broken.closed and pool.stats()['connections'] == 0
+    with pool.session('10.0.0.1', 22, 'root', 'x') as client:
+        assert client is not broken
+
+
+def test_channels_per_host_are_bounded(pool):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with pool.session('10.0.0.1', 22, 'root', 'x'):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert peak[0] == 2
+    assert len(pool.connects) == 1
+
+
+def test_waiting_for_channel_respects_deadline(pool):
+    release = threading.Event()
+    held = threading.Barrier(3)
+
+    def hold():
+        with pool.session('10.0.0.1', 22, 'root', 'x'):
+            held.wait()
+            release.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(2)]
+    for t in threads:
+        t.start()
+    held.wait()
+    try:
+        with deadline_scope(0.05), pytest.raises(DeadlineExceeded):
+            with pool.session('10.0.0.1', 22, 'root', 'x'):
+                pass
+        # Другой хост не ждёт чужих каналов
+        with deadline_scope(0.05), pool.session('10.0.0.2', 22, 'root', 'x'):
+            pass
+    finally:
+        release.set()
+        for t in threads:
+            t.join()
+    assert pool.stats()['channels_in_use'] == 0
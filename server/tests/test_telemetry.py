@@ -0,0 +1,56 @@
+# tests/test_telemetry.py
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+from app.telemetry import _trace_sampler
+
+
+@pytest.fixture
+def tracer(monkeypatch):
+    def make(ratio):
+        monkeypatch.setenv('OTEL_TRACES_SAMPLER_ARG', str(ratio))
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider(sampler=_trace_sampler())
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+        return provider.get_tracer('test'), exporter
+    return make
+
+
+def _remote_parent(sampled):
+    flags = TraceFlags(TraceFlags.SAMPLED if sampled else TraceFlags.DEFAULT)
+    ctx = SpanContext(trace_id=0x1234, span_id=0x5678, is_remote=True, trace_flags=flags)
+    return trace.set_span_in_context(NonRecordingSpan(ctx))
+
+
+def test_root_spans_follow_sampler_ratio(tracer):
+    t, exporter = tracer(0.25)
+    for _ in range(4000):
+        with t.start_as_current_span('request'):
+            pass
+    assert 800 < len(exporter.get_finished_spans()) < 1200
+
+    for ratio, expected in ((0, 0), (1, 100)):
+        t, exporter = tracer(ratio)
+        for _ in range(100):
+            with t.start_as_current_span('request'):
+                pass
+        assert len(exporter.get_finished_spans()) == expected
+
+
+def test_child_spans_inherit_parent_decision(tracer):
+    # Доля 0: сами по себе трассы не пишутся, но продолжение чужой записанной трассы — пишется
+    t, exporter = tracer(0)
+    with t.start_as_current_span('grpc', context=_remote_parent(sampled=True)):
+        with t.start_as_current_span('sql'):
+            pass
+    assert [s.name for s in exporter.get_finished_spans()] == ['sql', 'grpc']
+
+    t, exporter = tracer(1)
+    with t.start_as_current_span('grpc', context=_remote_parent(sampled=False)):
+        with t.start_as_current_span('sql'):
+            pass
+    assert exporter.get_finished_spans() == ()
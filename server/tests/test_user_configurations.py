@@ -0,0 +1,94 @@
+# tests/test_user_configurations.py
+import pytest
+from flask_jwt_extended import create_access_token
+
+import app.routes.user_configurations as user_configurations
+
+
+class _Result:
+    def __init__(self, state, result=None):
+        self.state = state
+        self.result = result
+
+
+class _ProvisionTask:
+    """Вместо Celery: запоминает постановку в очередь и отдаёт заданное состояние задачи."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.queued = []
+        self.results = {}
+        self.fail = False
+
+    def apply_async(self, args, task_id):
+        if self.fail:
+            raise ConnectionError('broker down')
+        # Владелец задачи уже должен быть записан
+        self.queued.append((args, task_id, self.redis.get(f'provision:job:{task_id}:owner')))
+
+    def AsyncResult(self, job_id):
+        return self.results.get(job_id, _Result('PENDING'))
+
+
+@pytest.fixture
+def task(monkeypatch, fake_redis):
+    t = _ProvisionTask(fake_redis)
+    monkeypatch.setattr(user_configurations, 'provision_configuration', t)
+    return t
+
+
+def _headers(user_id):
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+
+
+def _post(client, user_id, query=''):
+    return client.post(f'/api/users/configurations/{user_id}{query}', headers=_headers(user_id),
+                       json={'country': 'DE', 'months': 3})
+
+
+def test_create_is_queued_by_default(client, init_user, task):
+    resp = _post(client, init_user.id)
+
+    assert resp.status_code == 202
+    body = resp.get_json()
+    assert body['status'] == 'queued'
+    assert body['status_url'] == f"/api/users/configurations/jobs/{body['job_id']}"
+    assert task.queued == [((init_user.id, 'DE', 3), body['job_id'], str(init_user.id).encode())]
+
+
+def test_failed_enqueue_leaves_no_job(client, init_user, task, fake_redis):
+    task.fail = True
+    with pytest.raises(ConnectionError):
+        _post(client, init_user.id)
+    assert fake_redis.keys('provision:job:*') == []
+
+
+@pytest.mark.parametrize('result, expected', [
+    (_Result('PENDING'), {'status': 'queued'}),
+    (_Result('STARTED'), {'status': 'running'}),
+    (_Result('SUCCESS', {'config_link': 'vless://x', 'expiration_date': '2030-01-01', 'price': 250}),
+     {'status': 'succeeded', 'config_link': 'vless://x', 'expiration_date': '2030-01-01', 'price': 250}),
+    (_Result('SUCCESS', {'error': 'Нет свободных серверов', 'code': 'NOT_FOUND'}),
+     {'status': 'failed', 'error': 'Нет свободных серверов'}),
+    (_Result('FAILURE', RuntimeError('worker lost')), {'status': 'failed'}),
+    (_Result('REVOKED'), {'status': 'failed'}),
+])
+def test_job_status_follows_task_state(client, init_user, task, result, expected):
+    job_id = _post(client, init_user.id).get_json()['job_id']
+    task.results[job_id] = result
+
+    resp = client.get(f'/api/users/configurations/jobs/{job_id}', headers=_headers(init_user.id))
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['job_id'] == job_id
+    assert {k: body[k] for k in expected} == expected
+
+
+def test_job_status_is_visible_only_to_owner(client, init_user, task):
+    job_id = _post(client, init_user.id).get_json()['job_id']
+
+    assert client.get(f'/api/users/configurations/jobs/{job_id}',
+                      headers=_headers(init_user.id + 1)).status_code == 403
+    assert client.get('/api/users/configurations/jobs/unknown',
+                      headers=_headers(init_user.id)).status_code == 404
@@ -0,0 +1,200 @@
+# tests/test_vps_data.py
+import contextlib
+import io
+import json
+import sqlite3
+import subprocess
+
+import pytest
+
+import app.utils.vps_data as vps_data
+from benchmarks.fake_vps import SHORT_ID, XUI_DB_PATH, create_xui_db
+
+
+class _Channel:
+    def recv_exit_status(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class _Stream(io.BytesIO):
+    channel = _Channel()
+
+
+class _LocalSSH:
+    """Выполняет команды локальным sh на файле x-ui.db теста — как benchmarks/fake_vps, но без SSH."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.commands = []
+        self.down = set()  # хосты, к которым «нет сети»
+
+    def exec_command(self, cmd, timeout=None):
+        self.commands.append(cmd)
+        proc = subprocess.run(["sh", "-c", cmd.replace(XUI_DB_PATH, self.db_path)], capture_output=True)
+        return None, _Stream(proc.stdout), _Stream(proc.stderr)
+
+
+@pytest.fixture
+def vps(tmp_path, monkeypatch):
+    ssh = _LocalSSH(str(tmp_path / "x-ui.db"))
+    create_xui_db(ssh.db_path, 443, [])
+
+    @contextlib.contextmanager
+    def session(host, port, ssh_username, ssh_password):
+        if host in ssh.down:
+            raise OSError(f"{host}: connection refused")
+        yield ssh
+
+    monkeypatch.setattr(vps_data, 'ssh_session', session)
+    return ssh
+
+
+def _rows(vps, sql):
+    conn = sqlite3.connect(vps.db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def _client(email, user_id=1, months=1, **fields):
+    return dict(email=email, client_uuid=f"uuid-{email}", flow="", user_id=user_id, months=months, **fields)
+
+
+def test_provision_command_is_one_quoted_transaction():
+    cmd = vps_data._provision_command("10.0.0.1", 443, [_client("a"), _client("b")])
+    sql = cmd.split("\n", 1)[1]
+
+    assert cmd.startswith("sqlite3 -bail /etc/x-ui/x-ui.db <<'XUI_SQL'\n")
+    assert cmd.endswith("\nXUI_SQL")
+    assert sql.startswith(f".timeout {vps_data.XUI_DB_BUSY_TIMEOUT_MS}\nBEGIN IMMEDIATE;")
+    assert sql.count("BEGIN") == 1 and sql.count("COMMIT;") == 1
+    assert sql.count("UPDATE inbounds") == 1 and sql.count("INSERT INTO client_traffics") == 1
+
+
+def test_provision_clients_substitutes_short_id_in_one_call(vps):
+    # Кавычка и $ в данных не должны ломать ни SQL, ни shell
+    clients = [_client("o'brien"), _client("$HOME", user_id=None, months=0, enable=False)]
+
+    links = vps_data.provision_clients("10.0.0.1", 22, "root", "x", 443, clients)
+
+    assert len(vps.commands) == 1
+    assert all(f"&sid={SHORT_ID}&" in link for link in links)
+    (settings,), = _rows(vps, "SELECT settings FROM inbounds")
+    stored = json.loads(settings)["clients"]
+    assert [c["email"] for c in stored] == ["o'brien", "$HOME"]
+    assert [c["link"] for c in stored] == links
+    assert stored[1]["enable"] is False and stored[1]["expiryTime"] == 0
+    assert _rows(vps, "SELECT email, enable FROM client_traffics ORDER BY id") == [("o'brien", 1), ("$HOME", 0)]
+
+
+def test_provision_clients_without_inbound_raises(vps):
+    with pytest.raises(Exception, match="не найден"):
+        vps_data.provision_clients("10.0.0.1", 22, "root", "x", 8443, [_client("a")])
+    assert _rows(vps, "SELECT COUNT(*) FROM client_traffics") == [(0,)]
+
+
+def test_locked_xui_db_is_retried_then_reported_as_busy(vps, monkeypatch):
+    monkeypatch.setattr(vps_data, 'XUI_DB_BUSY_TIMEOUT_MS', 50)
+    monkeypatch.setattr(vps_data, 'XUI_DB_BUSY_RETRIES', 1)
+    monkeypatch.setattr(vps_data.time, 'sleep', lambda seconds: None)
+    # Другой процесс держит запись в x-ui.db
+    writer = sqlite3.connect(vps.db_path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(vps_data.VpsBusy):
+            vps_data.provision_clients("10.0.0.1", 22, "root", "x", 443, [_client("a")])
+        assert len(vps.commands) == 2
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+    # Блокировка снята — та же запись проходит
+    assert len(vps_data.provision_clients("10.0.0.1", 22, "root", "x", 443, [_client("a")])) == 1
+    assert _rows(vps, "SELECT email FROM client_traffics") == [("a",)]
+
+
+def test_activate_client_quotes_values_and_reports_missing_client(vps):
+    email = "o'brien\"; rm -rf $HOME"
+    vps_data.provision_clients("10.0.0.1", 22, "root", "x", 443,
+                               [_client(email, user_id=None, months=0, enable=False)])
+
+    vps_data.activate_client("10.0.0.1", 22, "root", "x", 443, f"uuid-{email}", email, 7, 3)
+
+    (settings,), = _rows(vps, "SELECT settings FROM inbounds")
+    client, = json.loads(settings)["clients"]
+    assert (client["user_id"], client["months"], client["enable"]) == (7, 3, True)
+    assert client["expiryTime"] > 0
+    assert _rows(vps, "SELECT enable FROM client_traffics") == [(1,)]
+
+    with pytest.raises(vps_data.ClientNotFound):
+        vps_data.activate_client("10.0.0.1", 22, "root", "x", 443, "uuid-' OR '1'='1", "x", 7, 3)
+
+
+def test_remove_clients_deletes_only_given_clients(vps):
+    vps_data.provision_clients("10.0.0.1", 22, "root", "x", 443, [_client("a"), _client("b'c")])
+
+    vps_data.remove_clients("10.0.0.1", 22, "root", "x", 443, [_client("b'c")])
+
+    (settings,), = _rows(vps, "SELECT settings FROM inbounds")
+    assert [c["email"] for c in json.loads(settings)["clients"]] == ["a"]
+    assert _rows(vps, "SELECT email FROM client_traffics") == [("a",)]
+
+
+def test_unreachable_vps_keeps_last_known_count(vps, make_server, fake_redis):
+    from app.utils.counters import get_vps_counts, refresh_vps_counts, set_vps_counts
+    from app.utils.fleet import server_ref
+
+    vps_data.provision_clients("10.0.0.1", 22, "root", "x", 443, [_client("a"), _client("b")])
+    up, down = make_server('10.0.0.1'), make_server('10.0.0.2')
+    set_vps_counts({up.id: 7, down.id: 5})
+    vps.down.add('10.0.0.2')
+
+    assert vps_data.count_users_on_port('10.0.0.1', 22, 'root', 'x') == 2
+    with pytest.raises(OSError):
+        vps_data.count_users_on_port('10.0.0.2', 22, 'root', 'x')
+
+    stats = refresh_vps_counts([server_ref(up), server_ref(down)])
+    assert (stats['changed'], stats['failed']) == (1, 1)
+    # Недоступный VPS не записан как пустой
+    assert get_vps_counts([up.id, down.id]) == {up.id: 2, down.id: 5}
+
+
+def _add_inbound(vps, x_ui_port, clients):
+    conn = sqlite3.connect(vps.db_path)
+    conn.execute("INSERT INTO inbounds (remark, port, protocol, settings) VALUES ('other', ?, 'vless', ?)",
+                 (x_ui_port, json.dumps({"clients": clients})))
+    conn.commit()
+    conn.close()
+
+
+def test_user_filter_runs_on_vps(vps):
+    vps_data.provision_clients("10.0.0.1", 22, "root", "x", 443,
+                               [_client("a", user_id=7), _client("b", user_id=8), _client("c", user_id=7)])
+    _add_inbound(vps, 8443, [{"id": "uuid-x", "email": "x", "user_id": 7}])
+
+    mine = vps_data.get_vps_clients_configurations("10.0.0.1", 22, "root", "x", 443, user_id=7)
+    everyone = vps_data.get_vps_clients_configurations("10.0.0.1", 22, "root", "x", 443)
+
+    assert [c["email"] for c in mine] == ["a", "c"]
+    assert [c["email"] for c in everyone] == ["a", "b", "c"]
+
+    fingerprint, clients = vps_data.get_vps_clients_if_changed("10.0.0.1", 22, "root", "x", 443, user_id=8)
+    assert [c["email"] for c in clients] == ["b"]
+    assert vps_data.get_vps_clients_if_changed("10.0.0.1", 22, "root", "x", 443, known_fingerprint=fingerprint,
+                                               user_id=8) == (fingerprint, None)
+
+
+def test_count_users_sums_all_inbounds_in_one_query(vps):
+    assert vps_data.count_users_on_port("10.0.0.1", 22, "root", "x") == 0
+
+    vps_data.provision_clients("10.0.0.1", 22, "root", "x", 443, [_client("a"), _client("b")])
+    _add_inbound(vps, 8443, [{"id": "uuid-x", "email": "x"}])
+    _add_inbound(vps, 9443, [])
+    vps.commands.clear()
+
+    assert vps_data.count_users_on_port("10.0.0.1", 22, "root", "x") == 3
+    assert len(vps.commands) == 1